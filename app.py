@@ -1,13 +1,19 @@
 import sys
 import os
 import streamlit as st
+import threading
 import time
+from collections import deque
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Force Python to see the local 'core' and 'tools' folders
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from core.config import get_secret
 from core.orchestrator import ProjectOrchestrator
+from core.context import ContextBuilder
 from core.validator import CodeValidator
+from core.executor import ActionExecutor, merge_observation
 from tools.file_manager import FileManager
 from tools.shell import ShellTool
 from tools.browser import WebBrowser
@@ -20,13 +26,21 @@ st.markdown("---")
 # --- INITIALIZE CORE ---
 @st.cache_resource
 def init_system():
-    return {
+    components = {
         "orchestrator": ProjectOrchestrator(),
-        "files": FileManager(),
-        "shell": ShellTool(),
+        # Long-lived process: let filesystem events, not every rerun, trigger rescans of the workspace
+        "files": FileManager(watch=True),
+        "shell": ShellTool(warm_workers=int(get_secret("OVERLORD_WARM_WORKERS", "0"))),
         "browser": WebBrowser(),
-        "validator": CodeValidator()
+        "validator": CodeValidator(),
+        "context": ContextBuilder()
     }
+    # The web interface never installs packages into the host interpreter
+    components["executor"] = ActionExecutor(
+        components["files"], components["shell"], components["browser"], components["validator"],
+        allow_install=False
+    )
+    return components
 
 sys = init_system()
 
@@ -34,17 +48,51 @@ sys = init_system()
 # This replaces TaskMemory for the web interface to ensure privacy
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "context_summary" not in st.session_state:
+    st.session_state.context_summary = ContextBuilder.new_summary_state()
 
 # --- SIDEBAR ---
 with st.sidebar:
     st.header("Session Control")
     if st.button("Clear Current Chat"):
         st.session_state.messages = []
+        st.session_state.context_summary = ContextBuilder.new_summary_state()
         st.rerun()
 
     st.header("Workspace Files")
-    files = [f for f in sys["files"].list_files()]
-    st.write(files)
+    # Served from the cached index; reruns do not touch the filesystem unless something changed
+    entries = sys["files"].index.list()
+    if entries:
+        st.dataframe(
+            [{"file": e.path, "KB": round(e.size / 1024, 1),
+              "modified": time.strftime("%H:%M:%S", time.localtime(e.mtime_ns / 1e9))} for e in entries],
+            hide_index=True, use_container_width=True
+        )
+    else:
+        st.caption("No files yet.")
+
+    st.header("Validator")
+    st.caption(
+        f"{sys['validator'].metrics['llm_calls']} LLM calls, {sys['validator'].llm_calls_avoided} avoided, "
+        f"cache hit rate {sys['validator'].cache_hit_rate:.0%}"
+    )
+
+    st.header("Rate Limits")
+    limits = sys["orchestrator"].scheduler.metrics
+    st.caption(
+        f"{limits['calls']} Gemini calls, {limits['rate_limited']} rate-limited, "
+        f"{limits['wait_seconds']:.0f}s spent waiting for quota"
+    )
+
+    streamed = sys["orchestrator"].stream_metrics
+    if streamed["calls"]:
+        st.header("Streaming")
+        dispatched = streamed["dispatched"] or 1
+        st.caption(
+            f"First token after {streamed['ttft_seconds'] / streamed['calls']:.2f}s, first action started after "
+            f"{streamed['dispatch_seconds'] / dispatched:.2f}s, response complete after "
+            f"{streamed['total_seconds'] / streamed['calls']:.2f}s (averages over {streamed['calls']} responses)"
+        )
 
 # --- DISPLAY CHAT HISTORY ---
 for message in st.session_state.messages:
@@ -61,8 +109,21 @@ if prompt := st.chat_input("What is your command, Architect?"):
     # --- AGENT LOOP ---
     with st.chat_message("assistant"):
         status_placeholder = st.empty()
+        output_placeholder = st.empty()
         thought_placeholder = st.expander("AI Thought Process", expanded=True)
 
+        # Script output arrives on worker threads; attach them to this session and show the latest lines
+        script_ctx = get_script_run_ctx()
+        live_lines = deque(maxlen=20)
+        last_paint = [0.0]
+
+        def show_output(stream, text):
+            add_script_run_ctx(threading.current_thread(), script_ctx)
+            live_lines.extend(text.splitlines())
+            if time.monotonic() - last_paint[0] > 0.2:
+                last_paint[0] = time.monotonic()
+                output_placeholder.code("\n".join(live_lines))
+
         step = 0
         while step < 5:
             step += 1
@@ -70,53 +131,57 @@ if prompt := st.chat_input("What is your command, Architect?"):
 
             try:
                 # Use st.session_state.messages instead of sys["memory"]
-                # We format it to match what the Gemini SDK expects
-                history_for_api = []
-                for m in st.session_state.messages:
-                    role = "model" if m["role"] == "assistant" else "user"
-                    history_for_api.append({"role": role, "parts": [{"text": m["content"]}]})
-
-                action = sys["orchestrator"].get_next_action(history_for_api)
-
-                if not action:
+                # The builder formats it for the Gemini SDK and keeps it inside the token budget
+                history_for_api, stats = sys["context"].build_from_messages(
+                    st.session_state.messages, st.session_state.context_summary
+                )
+                status_placeholder.info(f"Step {step}: Thinking... ({stats.prompt_tokens} tokens, saved {stats.saved_tokens})")
+
+                # The thought is shown as it streams in; finished actions start before the response is complete
+                thought_box = thought_placeholder.empty()
+                actions = sys["executor"].stream(on_output=show_output)
+                plan = sys["orchestrator"].get_next_step_streaming(
+                    history_for_api,
+                    on_thought=lambda text, n=step: thought_box.markdown(f"**Step {n} Thought:** {text} ▌"),
+                    on_action=actions.add,
+                )
+
+                if not plan:
+                    actions.cancel()
                     st.error("The AI failed to generate a plan.")
                     break
 
-                thought_placeholder.write(f"**Step {step} Thought:** {action.thought}")
-
-                # Handle Tools
-                result = ""
-                if action.tool == "SEARCH_WEB":
-                    status_placeholder.info(f"Searching for: {action.content}...")
-                    result = sys["browser"].search(action.content)
-                elif action.tool == "WRITE_FILE":
-                    status_placeholder.warning("Validating code...")
-                    check = sys["validator"].validate_code(action.content)
-                    if "UNSAFE" in check.upper():
-                        result = f"Security Blocked: {check}"
-                    else:
-                        result = sys["files"].write_file(action.file_name, action.content)
-                elif action.tool == "RUN_CODE":
-                    status_placeholder.info(f"Running {action.file_name}...")
-                    result = sys["shell"].execute_python(action.file_name)
-                elif action.tool == "FINAL_ANSWER":
+                thought_box.markdown(f"**Step {step} Thought:** {plan.thought}")
+
+                # Handle Tools (independent actions run in parallel)
+                tools_used = ", ".join(a.tool for a in plan.actions)
+                status_placeholder.info(f"Running: {tools_used}...")
+                results = actions.results(plan.actions)
+                output_placeholder.empty()
+
+                final = plan.actions[-1]
+                if final.tool == "FINAL_ANSWER" and not results[-1].startswith("SKIPPED"):
                     status_placeholder.empty()
-                    st.success(action.content)
-                    st.session_state.messages.append({"role": "assistant", "content": action.content})
+                    st.success(final.content)
+                    st.session_state.messages.append({"role": "assistant", "content": final.content})
                     break
 
                 # Record the tool interaction in the private session history
-                tool_memory = f"Thought: {action.thought}\nTool: {action.tool}\nResult: {result}"
+                result = merge_observation(plan.actions, results)
+                tool_memory = f"Thought: {plan.thought}\nTool: {tools_used}\nResult: {result}"
                 st.session_state.messages.append({"role": "assistant", "content": tool_memory})
                 st.write(f"**Tool Output:** `{result}`")
 
             except Exception as e:
                 if "QUOTA_LIMIT_REACHED" in str(e) or "429" in str(e):
-                    status_placeholder.warning("⚠️ API Quota reached. Pausing for 60s...")
+                    # The scheduler already retried with backoff; wait out the cooldown it learned from the 429s
+                    scheduler = sys["orchestrator"].scheduler
+                    wait = max(1, round(scheduler.cooldown(sys["orchestrator"].model_id)))
+                    status_placeholder.warning(f"⚠️ API Quota reached. Pausing for {wait}s...")
                     progress_bar = st.progress(0)
-                    for i in range(60):
+                    for i in range(wait):
                         time.sleep(1)
-                        progress_bar.progress((i + 1) / 60)
+                        progress_bar.progress((i + 1) / wait)
                     progress_bar.empty()
                     step -= 1
                     continue
@@ -0,0 +1,217 @@
+"""
+End-to-end benchmark of the agent loop, fully offline.
+
+Each fixture in benchmarks/fixtures/ is a recorded (or hand-written) run: model turns,
+validator verdicts and search results are replayed through core.replay, while files, memory
+and code execution are real. Record new fixtures with: python main.py --record fixture.jsonl
+
+--loop cli (the default) drives main.run_task, the loop main.py runs: ActionExecutor, streamed
+steps, the plan cache and held-back duplicate steps, with the console output thrown away.
+--loop engine drives AgentEngine.run_task, the asyncio loop behind --batch.
+
+Run:  python benchmarks/bench_agent_loop.py [--runs 3] [--loop cli|engine] [--json out.json]
+CI:   python benchmarks/bench_agent_loop.py --baseline baseline.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rich.console import Console
+
+from core.engine import AgentEngine
+from core.executor import ActionExecutor
+from core.memory import TaskMemory
+from core.orchestrator import ProjectOrchestrator
+from core.plan_cache import PlanCache
+from core.rate_limiter import GeminiScheduler
+from core.replay import AsyncReplaySession, Fixture, ReplaySession, replay_client
+from core.validator import CodeValidator
+from tools.browser import WebBrowser
+from tools.file_manager import FileManager
+from tools.shell import ShellTool
+from main import run_task
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class StageTimer:
+    """Wraps methods on live objects and accumulates wall time per stage."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def wrap(self, obj, method, stage):
+        original = getattr(obj, method)
+        if asyncio.iscoroutinefunction(original):
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self._add(stage, start)
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self._add(stage, start)
+        setattr(obj, method, timed)
+
+    def _add(self, stage, start):
+        self.seconds[stage] += time.perf_counter() - start
+        self.calls[stage] += 1
+
+
+def run_fixture(path, warm_workers, loop="cli"):
+    fixture = Fixture(path)
+    client = replay_client(fixture)
+    timer = StageTimer()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shell = ShellTool(tmp, warm_workers=warm_workers)
+        browser = WebBrowser(api_key="replay", session=ReplaySession(fixture), async_client=AsyncReplaySession(fixture))
+        # Replayed calls cost no quota; keep the default free-tier pacing out of the timings
+        scheduler = GeminiScheduler(rpm=1_000_000, tpm=1_000_000_000)
+        orchestrator = ProjectOrchestrator(client=client, scheduler=scheduler)
+        validator = CodeValidator(cache_path=None, client=client, scheduler=scheduler)
+        memory = TaskMemory(os.path.join(tmp, "bench.db"), session_id="bench")
+        files = FileManager(tmp)
+
+        # Both loops reach the tools through ToolDispatcher, so the same methods are timed
+        timer.wrap(validator, "avalidate_code", "validate")
+        timer.wrap(browser, "asearch", "search")
+        timer.wrap(browser, "asearch_many", "search")
+        timer.wrap(shell, "aexecute_python", "execute")
+        timer.wrap(shell, "ainstall_package", "install")
+        timer.wrap(memory, "get_summarized_history", "memory")
+        timer.wrap(memory, "add_event", "memory")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            if loop == "engine":
+                engine = AgentEngine(orchestrator, validator, files, shell, browser, quota_backoff=0)
+                timer.wrap(orchestrator, "aget_next_step", "model")
+                outcome = asyncio.run(engine.run_task(fixture.tasks[0], memory))
+            else:
+                # A fresh plan cache misses, so every step still comes from the (replayed) model
+                executor = ActionExecutor(files, shell, browser, validator)
+                plan_cache = PlanCache(os.path.join(tmp, "plans.db"))
+                timer.wrap(orchestrator, "get_next_step_streaming", "model")
+                memory.add_event("user", fixture.tasks[0])
+                try:
+                    outcome = run_task(fixture.tasks[0], Console(file=io.StringIO()), orchestrator, memory, executor,
+                                       files, validator, plan_cache)
+                finally:
+                    plan_cache.close()
+                    executor.close()
+        finally:
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            context = memory.last_context_stats
+            memory.close()
+            shell.close()
+            db_bytes = sum(os.path.getsize(p) for p in glob.glob(os.path.join(tmp, "bench.db*")))
+
+    return {
+        "loop": loop,
+        "status": outcome["status"],
+        "answer": outcome["answer"],
+        "steps": outcome["steps"],
+        "model_calls": timer.calls["model"],
+        "validator_llm_calls": validator.metrics["llm_calls"],
+        "total_ms": elapsed * 1000,
+        "stage_ms": {stage: s * 1000 for stage, s in timer.seconds.items()},
+        "prompt_tokens": context.prompt_tokens if context else 0,
+        "peak_alloc_kb": peak / 1024,
+        "db_kb": db_bytes / 1024,
+        "replay_misses": fixture.misses,
+    }
+
+
+def summarize(runs):
+    """Median of every numeric field across repeated runs of one fixture."""
+    first = runs[0]
+    summary = {k: v for k, v in first.items() if not isinstance(v, (int, float)) or isinstance(v, bool)}
+    for key, value in first.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            summary[key] = statistics.median(r[key] for r in runs)
+    stages = {stage for r in runs for stage in r["stage_ms"]}
+    summary["stage_ms"] = {s: statistics.median(r["stage_ms"].get(s, 0.0) for r in runs) for s in sorted(stages)}
+    return summary
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regressions: total time beyond tolerance, or more steps/model calls than before."""
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        # Baselines from before --loop existed were taken on the engine
+        if not before or before.get("loop", "engine") != current["loop"]:
+            continue
+        if current["total_ms"] > before["total_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: total {current['total_ms']:.0f}ms vs baseline {before['total_ms']:.0f}ms")
+        for key in ("steps", "model_calls", "prompt_tokens"):
+            if current[key] > before[key]:
+                regressions.append(f"{name}: {key} {current[key]} vs baseline {before[key]}")
+        if current["status"] != before["status"]:
+            regressions.append(f"{name}: status {current['status']} vs baseline {before['status']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", nargs="+", default=sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.jsonl"))))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warm-workers", type=int, default=0)
+    parser.add_argument("--loop", choices=["cli", "engine"], default="cli",
+                        help="cli: main.py's loop (main.run_task); engine: AgentEngine, as used by --batch")
+    parser.add_argument("--json", help="write results to this file (usable later as --baseline)")
+    parser.add_argument("--baseline", help="fail if results regress against this file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'fixture':<22} {'status':>8} {'steps':>6} {'model':>6} {'total':>9} {'tokens':>7} {'peak':>8}   stages")
+    for path in args.fixtures:
+        name = os.path.splitext(os.path.basename(path))[0]
+        result = summarize([run_fixture(path, args.warm_workers, args.loop) for _ in range(args.runs)])
+        results[name] = result
+        stages = "  ".join(f"{s} {ms:.1f}ms" for s, ms in result["stage_ms"].items())
+        print(f"{name:<22} {result['status']:>8} {result['steps']:>6.0f} {result['model_calls']:>6.0f} "
+              f"{result['total_ms']:>7.1f}ms {result['prompt_tokens']:>7.0f} {result['peak_alloc_kb']:>6.0f}KB   {stages}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failed = [name for name, r in results.items() if r["status"] != "done" or r["replay_misses"]]
+    if failed:
+        print(f"\nFAILED: {', '.join(failed)} did not finish from the recording.")
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
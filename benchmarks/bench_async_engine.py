@@ -0,0 +1,97 @@
+"""
+Throughput of AgentEngine against mocked model/validator/search backends.
+
+Each task is SEARCH_WEB -> WRITE_FILE -> RUN_CODE (real subprocess) -> FINAL_ANSWER.
+Run: python benchmarks/bench_async_engine.py --tasks 16 --concurrency 1 4 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.engine import AgentEngine
+from core.memory import TaskMemory
+from core.orchestrator import AgentAction, AgentStep
+from tools.file_manager import FileManager
+from tools.shell import ShellTool
+
+
+class MockOrchestrator:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def aget_next_step(self, history):
+        await asyncio.sleep(self.latency)
+        return AgentStep(thought="next", actions=[self._next_action(history)])
+
+    def _next_action(self, history):
+        goal = history[0]["parts"][0]["text"]
+        file_name = f"{abs(hash(goal))}.py"
+        step = len(history) - 1
+        if step == 0:
+            return AgentAction(thought="look it up", tool="SEARCH_WEB", content=goal)
+        if step == 1:
+            return AgentAction(thought="write it", tool="WRITE_FILE", file_name=file_name, content="print(6 * 7)")
+        if step == 2:
+            return AgentAction(thought="run it", tool="RUN_CODE", file_name=file_name)
+        return AgentAction(thought="done", tool="FINAL_ANSWER", content="42")
+
+
+class MockValidator:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def avalidate_code(self, code):
+        await asyncio.sleep(self.latency)
+        return "SAFE"
+
+
+class MockBrowser:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def asearch(self, query):
+        await asyncio.sleep(self.latency)
+        return f"[Result]: {query}..."
+
+
+def bench(n_tasks, concurrency, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = AgentEngine(
+            MockOrchestrator(args.model_latency), MockValidator(args.validator_latency),
+            FileManager(tmp), ShellTool(tmp), MockBrowser(args.search_latency)
+        )
+        db_path = os.path.join(tmp, "bench.db")
+        tasks = [f"task {i}: what is six times seven" for i in range(n_tasks)]
+
+        start = time.perf_counter()
+        results = asyncio.run(engine.run_many(
+            tasks, lambda i, task: TaskMemory(db_path, session_id=f"task-{i}"), concurrency=concurrency
+        ))
+        elapsed = time.perf_counter() - start
+
+    assert all(r["status"] == "done" for r in results)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--model-latency", type=float, default=0.3)
+    parser.add_argument("--validator-latency", type=float, default=0.2)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} | {'seconds':>8} | {'tasks/s':>8}")
+    for concurrency in args.concurrency:
+        elapsed = bench(args.tasks, concurrency, args)
+        print(f"{concurrency:>11} | {elapsed:>8.2f} | {args.tasks / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Per-step TaskMemory cost as the log grows.
+
+One "step" mirrors the main.py loop: read the summarized context, then log the tool result.
+Run: python benchmarks/bench_memory.py --sizes 100 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.memory import TaskMemory
+
+
+def populate(memory, n, other_sessions=1):
+    # Bulk load straight through the connection, spread across sessions so the index matters
+    rows = []
+    for i in range(n):
+        session = memory.session_id if i % (other_sessions + 1) == 0 else f"other-{i % other_sessions}"
+        rows.append((session, "model" if i else "user", f"Thought: step {i}\nAction: RUN_CODE\nStatus: ok"))
+    with memory.conn:
+        memory.conn.executemany("INSERT INTO logs (session_id, role, content) VALUES (?, ?, ?)", rows)
+
+
+def bench(n, steps):
+    with tempfile.TemporaryDirectory() as tmp:
+        with TaskMemory(os.path.join(tmp, "bench.db"), session_id="bench") as memory:
+            populate(memory, n)
+            # The first call folds whatever of the pre-loaded session is outside the window; time the steady state
+            memory.get_summarized_history()
+
+            start = time.perf_counter()
+            for i in range(steps):
+                memory.get_summarized_history()
+                memory.add_event("model", f"Thought: bench {i}\nAction: RUN_CODE\nStatus: ok")
+            elapsed = time.perf_counter() - start
+
+    return elapsed / steps * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--steps", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'events':>10} | {'us/step':>10}")
+    for n in args.sizes:
+        print(f"{n:>10} | {bench(n, args.steps):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+One action per model call vs. one batched step through ActionExecutor.
+
+Scenario: search two things, write three files, run one of them (mocked model, search and validator latency).
+Run: python benchmarks/bench_parallel_actions.py --model-latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.executor import ActionExecutor
+from core.orchestrator import AgentAction
+from tools.file_manager import FileManager
+from tools.shell import ShellTool
+
+
+class MockBrowser:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def asearch(self, query):
+        await asyncio.sleep(self.latency)
+        return f"[Result]: {query}..."
+
+
+class MockValidator:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def avalidate_code(self, code):
+        await asyncio.sleep(self.latency)
+        return "SAFE"
+
+
+def scenario():
+    return [
+        AgentAction(thought="", tool="SEARCH_WEB", content="python statistics module", id="s1"),
+        AgentAction(thought="", tool="SEARCH_WEB", content="median vs mean", id="s2"),
+        AgentAction(thought="", tool="WRITE_FILE", file_name="data.py", content="DATA = [3, 1, 4, 1, 5]", id="w1"),
+        AgentAction(thought="", tool="WRITE_FILE", file_name="stats.py",
+                    content="import statistics\nfrom data import DATA\nprint(statistics.median(DATA))", id="w2"),
+        AgentAction(thought="", tool="WRITE_FILE", file_name="notes.py", content="NOTES = 'median'", id="w3"),
+        AgentAction(thought="", tool="RUN_CODE", file_name="stats.py", id="r1", depends_on=["w1"]),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-latency", type=float, default=1.0)
+    parser.add_argument("--search-latency", type=float, default=0.4)
+    parser.add_argument("--validator-latency", type=float, default=0.6)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        executor = ActionExecutor(FileManager(tmp), ShellTool(tmp), MockBrowser(args.search_latency),
+                                  MockValidator(args.validator_latency))
+        actions = scenario()
+
+        start = time.perf_counter()
+        for action in actions:
+            time.sleep(args.model_latency)  # one model round trip per action
+            executor.run_action(action)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        time.sleep(args.model_latency)  # a single round trip for the whole batch
+        results = executor.execute(actions)
+        batched = time.perf_counter() - start
+
+    print(results[-1])
+    print(f"{'mode':>10} | {'model calls':>11} | {'seconds':>8}")
+    print(f"{'one-by-one':>10} | {len(actions):>11} | {sequential:>8.2f}")
+    print(f"{'batched':>10} | {1:>11} | {batched:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
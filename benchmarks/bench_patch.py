@@ -0,0 +1,151 @@
+"""
+WRITE_FILE vs APPLY_PATCH on a multi-iteration fix-and-rerun task, fully offline.
+
+A ~120-line script with several planted bugs is written once, then fixed one bug per iteration
+and re-run each time. With WRITE_FILE the model re-sends the whole file and the validator reviews
+all of it; with APPLY_PATCH it sends a SEARCH/REPLACE block and the validator only sees the changed
+lines plus context. Model output and validator prompts are counted with core.context.estimate_tokens;
+files, validation plumbing and execution are real, the validator's model is a stub that answers SAFE.
+
+Run: python benchmarks/bench_patch.py [--bugs 6] [--functions 12]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.context import estimate_tokens
+from core.executor import ActionExecutor
+from core.orchestrator import AgentAction
+from core.rate_limiter import GeminiScheduler
+from core.validator import CodeValidator
+from tools.file_manager import FileManager
+from tools.patch import apply_patch
+from tools.shell import ShellTool
+
+
+class CountingModels:
+    """Stands in for client.aio.models: every review is counted and answered SAFE."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        self.prompt_tokens += estimate_tokens(contents)
+        return SimpleNamespace(text="SAFE", usage_metadata=None)
+
+
+def build_script(functions, bugs):
+    """Returns (buggy source, [(buggy line, fixed line)]). Each bug makes one check fail."""
+    lines = ["import os", "import sys", "", "RESULTS = []", ""]
+    fixes = []
+    for i in range(functions):
+        good = f"    return sum(v * {i + 1} for v in values) + offset"
+        bad = f"    return sum(v * {i + 1} for v in values) - offset  # step {i}"
+        buggy = i < bugs
+        lines += [
+            f"def transform_{i}(values, offset={i}):",
+            f'    """Scales the values by {i + 1} and adds the offset."""',
+            "    if not values:",
+            "        return 0",
+            bad if buggy else good,
+            "",
+            "",
+        ]
+        if buggy:
+            fixes.append((bad, good + f"  # step {i}"))
+    lines += ["def main():", "    data = [1, 2, 3, 4]", "    failed = 0"]
+    for i in range(functions):
+        expected = sum(v * (i + 1) for v in [1, 2, 3, 4]) + i
+        lines += [
+            f"    if transform_{i}(data) != {expected}:",
+            f"        print('transform_{i} is wrong')",
+            "        failed += 1",
+        ]
+    lines += [
+        "    print(f'{failed} checks failed in', os.path.basename(__file__))",
+        "    sys.exit(1 if failed else 0)",
+        "",
+        "",
+        'if __name__ == "__main__":',
+        "    main()",
+        "",
+    ]
+    return "\n".join(lines), fixes
+
+
+def check_insertion():
+    # '@@ -N,0 ... @@' inserts after line N, and '-0,0' at the very top
+    content, ranges = apply_patch("a\nb\nc\nd\ne\n", "@@ -2,0 +3,1 @@\n+X\n")
+    assert content == "a\nb\nX\nc\nd\ne\n" and ranges == [(2, 3)], (content, ranges)
+    content, _ = apply_patch("a\nb\n", "@@ -0,0 +1,1 @@\n+X\n")
+    assert content == "X\na\nb\n", content
+
+
+def run(strategy, functions, bugs):
+    source, fixes = build_script(functions, bugs)
+    models = CountingModels()
+    validator = CodeValidator(cache_path=None, client=SimpleNamespace(aio=SimpleNamespace(models=models)),
+                              scheduler=GeminiScheduler(rpm=1_000_000, tpm=1_000_000_000))
+    with tempfile.TemporaryDirectory() as tmp:
+        files = FileManager(tmp)
+        executor = ActionExecutor(files, ShellTool(tmp), browser=None, validator=validator)
+        output_tokens = estimate_tokens(source)
+        started = time.perf_counter()
+        executor.run_action(AgentAction(thought="", tool="WRITE_FILE", file_name="app.py", content=source))
+        executor.run_action(AgentAction(thought="", tool="RUN_CODE", file_name="app.py"))
+
+        for bad, good in fixes:
+            if strategy == "WRITE_FILE":
+                source = source.replace(bad, good)
+                content = source
+            else:
+                content = f"<<<<<<< SEARCH\n{bad}\n=======\n{good}\n>>>>>>> REPLACE\n"
+            output_tokens += estimate_tokens(content)
+            result = executor.run_action(AgentAction(thought="", tool=strategy, file_name="app.py", content=content))
+            if not result.startswith("CONFIRMED"):
+                raise RuntimeError(f"{strategy} failed: {result}")
+            result = executor.run_action(AgentAction(thought="", tool="RUN_CODE", file_name="app.py"))
+        elapsed = time.perf_counter() - started
+
+        if "0 checks failed" not in result:
+            raise RuntimeError(f"{strategy}: script still failing after all fixes:\n{result}")
+        # The model re-sending the file it just wrote is a common loop; the write is skipped by hash
+        files.write_file("app.py", files.read_file("app.py"))
+        return {
+            "output_tokens": output_tokens,
+            "validator_prompt_tokens": models.prompt_tokens,
+            "validator_calls": models.calls,
+            "bytes_written": files.metrics["bytes_written"],
+            "writes_skipped": files.metrics["writes_skipped"],
+            "seconds": elapsed,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", type=int, default=12, help="functions in the script (~10 lines each)")
+    parser.add_argument("--bugs", type=int, default=6, help="fix-and-rerun iterations")
+    args = parser.parse_args()
+
+    check_insertion()
+    source, _ = build_script(args.functions, args.bugs)
+    print(f"script: {len(source.splitlines())} lines, {args.bugs} fix-and-rerun iterations\n")
+
+    results = {strategy: run(strategy, args.functions, args.bugs) for strategy in ("WRITE_FILE", "APPLY_PATCH")}
+    full, patch = results["WRITE_FILE"], results["APPLY_PATCH"]
+    print(f"{'':26}{'WRITE_FILE':>12}{'APPLY_PATCH':>13}{'saved':>9}")
+    for key in ("output_tokens", "validator_prompt_tokens", "validator_calls", "bytes_written", "writes_skipped"):
+        saved = f"{1 - patch[key] / full[key]:.0%}" if full[key] and key != "writes_skipped" else ""
+        print(f"{key:26}{full[key]:>12}{patch[key]:>13}{saved:>9}")
+    print(f"{'wall time (s)':26}{full['seconds']:>12.2f}{patch['seconds']:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
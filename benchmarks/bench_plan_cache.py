@@ -0,0 +1,106 @@
+"""
+Plan cache on repeated tasks: model calls and wall time with and without core.plan_cache.
+
+A stream of tasks where each distinct task comes back several times. The mocked model answers
+WRITE_FILE -> RUN_CODE -> FINAL_ANSWER (one call per step, with latency); code runs for real.
+One task reads a file that changes between runs, so its replays stop matching and hand back
+to the model. Another prints more than the output caps: its output is saved under a new file
+name every run, which must not count as a different result.
+
+Run: python benchmarks/bench_plan_cache.py [--distinct 5] [--repeats 4] [--model-latency 0.5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.engine import AgentEngine
+from core.memory import TaskMemory
+from core.orchestrator import AgentAction, AgentStep
+from core.plan_cache import PlanCache
+from tools.file_manager import FileManager
+from tools.shell import ShellTool
+
+
+class MockOrchestrator:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    async def aget_next_step(self, history):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        goal = history[0]["parts"][0]["text"]
+        number = int(goal.rstrip(".").split()[-1])
+        file_name = f"square_{number}.py"
+        code = f"print({number} ** 2)"
+        if "drifting" in goal.lower():
+            code = "print(open('counter.txt').read())"
+        elif "listing" in goal.lower():
+            code = f"for i in range({number} * 100):\n    print(i)"
+        done = sum("Status:" in event["parts"][0]["text"] for event in history[1:])
+        if done == 0:
+            action = AgentAction(thought="write", tool="WRITE_FILE", file_name=file_name, content=code)
+        elif done == 1:
+            action = AgentAction(thought="run", tool="RUN_CODE", file_name=file_name)
+        else:
+            action = AgentAction(thought="done", tool="FINAL_ANSWER", content="see output")
+        return AgentStep(thought=action.thought, actions=[action])
+
+
+class MockValidator:
+    async def avalidate_code(self, code):
+        return "SAFE"
+
+
+def run(tasks, use_cache, latency):
+    with tempfile.TemporaryDirectory() as tmp:
+        orchestrator = MockOrchestrator(latency)
+        plan_cache = PlanCache(os.path.join(tmp, "cache.db")) if use_cache else None
+        engine = AgentEngine(orchestrator, MockValidator(), FileManager(tmp), ShellTool(tmp), browser=None,
+                             plan_cache=plan_cache)
+        db_path = os.path.join(tmp, "memory.db")
+        start = time.perf_counter()
+        for i, task in enumerate(tasks):
+            with open(os.path.join(tmp, "counter.txt"), "w") as f:
+                f.write(str(i))
+            memory = TaskMemory(db_path, session_id=f"task-{i}")
+            outcome = engine.run(task, memory)
+            memory.close()
+            assert outcome["status"] == "done", outcome
+        elapsed = time.perf_counter() - start
+        metrics = dict(plan_cache.metrics, hit_rate=plan_cache.hit_rate) if plan_cache else {}
+        return orchestrator.calls, elapsed, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--distinct", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=4)
+    parser.add_argument("--model-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    distinct = [f"Compute the square of {n}" for n in range(2, args.distinct + 1)] + [
+        "Show the drifting counter 0", "Print a long listing 5"]
+    # Same tasks again, written a little differently each time (the fingerprint ignores case and punctuation)
+    tasks = [task.upper() + "." if r % 2 else task for r in range(args.repeats) for task in distinct]
+
+    calls, seconds, _ = run(tasks, False, args.model_latency)
+    cached_calls, cached_seconds, metrics = run(tasks, True, args.model_latency)
+    # Only the drifting counter's replays may hand back to the model
+    assert metrics["fallbacks"] == args.repeats - 1, metrics
+
+    print(f"{len(tasks)} tasks ({len(distinct)} distinct x {args.repeats}), model latency {args.model_latency}s\n")
+    print(f"{'':14}{'model calls':>12}{'seconds':>10}")
+    print(f"{'no cache':14}{calls:>12}{seconds:>10.2f}")
+    print(f"{'plan cache':14}{cached_calls:>12}{cached_seconds:>10.2f}")
+    print(f"\nhit rate {metrics['hit_rate']:.0%}, {metrics['llm_calls_saved']} LLM calls saved "
+          f"({metrics['llm_calls_saved'] / len(tasks):.1f} per task), {metrics['fallbacks']} replays handed back")
+
+
+if __name__ == "__main__":
+    main()
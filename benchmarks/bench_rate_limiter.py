@@ -0,0 +1,136 @@
+"""
+GeminiScheduler against a fake Gemini client that enforces a quota and answers 429s
+(with retryDelay and quotaValue, like the real API). No API key needed.
+
+Compares the old behaviour (retry after a fixed pause) with the scheduler, which learns the
+quota from the first 429 and then paces calls just under it, serving urgent calls first.
+
+Run: python benchmarks/bench_rate_limiter.py --calls 60 --rpm 600 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import errors
+
+from core.rate_limiter import BACKGROUND, URGENT, GeminiScheduler, is_rate_limited
+
+
+class FakeQuotaModels:
+    """Server-side token bucket: `burst` calls at once, refilled at rpm/60 per second."""
+
+    def __init__(self, rpm, burst, latency):
+        self.rpm = rpm
+        self.burst = burst
+        self.latency = latency
+        self.level = burst
+        self.updated = time.monotonic()
+        self.accepted = 0
+        self.rejected = 0
+
+    async def generate_content(self, *, model, contents, config=None):
+        now = time.monotonic()
+        self.level = min(self.burst, self.level + (now - self.updated) * self.rpm / 60)
+        self.updated = now
+        if self.level < 1:
+            self.rejected += 1
+            retry = (1 - self.level) * 60 / self.rpm
+            raise errors.ClientError(429, {"error": {
+                "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Quota exceeded",
+                "details": [
+                    {"@type": "type.googleapis.com/google.rpc.QuotaFailure", "violations": [
+                        {"quotaMetric": "generativelanguage.googleapis.com/generate_content_requests",
+                         "quotaValue": str(self.rpm)}]},
+                    {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry:.2f}s"},
+                ],
+            }})
+        self.level -= 1
+        self.accepted += 1
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text="SAFE", usage_metadata=SimpleNamespace(total_token_count=500))
+
+
+async def naive(models, calls, concurrency, pause):
+    """What app.py used to do: on a 429, sleep a fixed time and try again."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.monotonic()
+            while True:
+                try:
+                    await models.generate_content(model="m", contents=str(i))
+                    break
+                except Exception as e:
+                    if not is_rate_limited(e):
+                        raise
+                    await asyncio.sleep(pause)
+            latencies.append(time.monotonic() - start)
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return {"normal": latencies}
+
+
+async def scheduled(models, calls, concurrency, urgent_every):
+    # Deliberately optimistic starting limit: the real quota is learned from the first 429
+    scheduler = GeminiScheduler(rpm=100000, tpm=10_000_000, max_retries=20, base_delay=0.2)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = {"urgent": [], "normal": []}
+
+    async def one(i):
+        priority = URGENT if i % urgent_every == 0 else BACKGROUND
+        async with semaphore:
+            start = time.monotonic()
+            await scheduler.acall(lambda: models.generate_content(model="m", contents=str(i)),
+                                  "m", tokens=500, priority=priority)
+            latencies["urgent" if priority == URGENT else "normal"].append(time.monotonic() - start)
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies
+
+
+def report(name, models, elapsed, calls, rpm, latencies):
+    achieved = calls / elapsed * 60
+    parts = [f"{name:<10} {elapsed:6.2f}s  {achieved:6.0f} calls/min ({achieved / rpm:4.0%} of quota)  "
+             f"429s: {models.rejected:<4}"]
+    for kind, values in latencies.items():
+        if values:
+            parts.append(f"{kind} p50 {statistics.median(values) * 1000:5.0f}ms")
+    print("  ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=60)
+    parser.add_argument("--rpm", type=int, default=600, help="quota enforced by the fake server")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pause", type=float, default=5.0, help="fixed pause for the naive strategy (60s in the old app)")
+    parser.add_argument("--urgent-every", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.calls} calls, quota {args.rpm} rpm (burst {args.burst}), concurrency {args.concurrency}")
+    ideal = max(0, args.calls - args.burst) * 60 / args.rpm
+    print(f"ideal       {ideal:6.2f}s")
+
+    models = FakeQuotaModels(args.rpm, args.burst, args.latency)
+    start = time.monotonic()
+    latencies = asyncio.run(naive(models, args.calls, args.concurrency, args.pause))
+    report("naive", models, time.monotonic() - start, args.calls, args.rpm, latencies)
+
+    models = FakeQuotaModels(args.rpm, args.burst, args.latency)
+    start = time.monotonic()
+    latencies = asyncio.run(scheduled(models, args.calls, args.concurrency, args.urgent_every))
+    report("scheduler", models, time.monotonic() - start, args.calls, args.rpm, latencies)
+
+
+if __name__ == "__main__":
+    main()
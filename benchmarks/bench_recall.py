@@ -0,0 +1,73 @@
+"""
+Long-term memory recall (FTS5) latency as the event log grows.
+
+The log is filled with synthetic agent events whose words follow a Zipf-like distribution
+(a few words everywhere, most words rare), spread over many sessions. Each query is a goal plus
+a latest step, as get_summarized_history() issues them; the indexing cost per insert is shown too.
+
+Run: python benchmarks/bench_recall.py [--sizes 10000 100000 1000000] [--queries 200]
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.memory import TaskMemory
+
+VOCABULARY = [f"w{i}" for i in range(50_000)]
+# Cumulative, so each draw is a bisect instead of a pass over the whole vocabulary
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+
+def sentence(rng, words=24):
+    return " ".join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=words))
+
+
+def populate(memory, n, rng, chunk=50_000):
+    inserted = 0
+    start = time.perf_counter()
+    while inserted < n:
+        rows = [(f"session-{(inserted + i) % 5000}", "model", f"Thought: {sentence(rng, 8)}\nStatus: {sentence(rng)}")
+                for i in range(min(chunk, n - inserted))]
+        with memory.conn:
+            memory.conn.executemany("INSERT INTO logs (session_id, role, content) VALUES (?, ?, ?)", rows)
+        inserted += len(rows)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def bench(n, queries, seed):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        with TaskMemory(os.path.join(tmp, "recall.db"), session_id="bench") as memory:
+            insert_us = populate(memory, n, rng)
+            latencies, found = [], 0
+            for _ in range(queries):
+                start = time.perf_counter()
+                lines = memory.recall(f"{sentence(rng, 12)}\n{sentence(rng)}")
+                latencies.append((time.perf_counter() - start) * 1000)
+                found += len(lines)
+    latencies.sort()
+    return insert_us, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1], found / queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'events':>10} | {'insert us/row':>13} | {'recall p50 ms':>13} | {'p95 ms':>8} | {'snippets':>8}")
+    for n in args.sizes:
+        insert_us, p50, p95, snippets = bench(n, args.queries, args.seed)
+        print(f"{n:>10} | {insert_us:>13.1f} | {p50:>13.2f} | {p95:>8.2f} | {snippets:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
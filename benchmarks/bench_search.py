@@ -0,0 +1,84 @@
+"""
+WebBrowser latency and cache hit rate against a local stand-in Serper server.
+
+The stand-in answers POST /search after a fixed delay, so no API key or network is needed.
+Run: python benchmarks/bench_search.py --delay 0.15
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.browser import WebBrowser, normalize_query
+
+# Queries that must keep cache keys of their own
+DISTINCT = ["北京 weather", "上海 weather", "café prices", "caf prices", "Müller", "Muller", "c++ tutorial", "c# tutorial"]
+
+
+def start_stand_in(delay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(delay)
+            payload = json.dumps({"organic": [
+                {"title": f"{body['q']} #{i}", "snippet": f"Snippet {i} about {body['q']}. " * 10} for i in range(5)
+            ]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.15, help="stand-in server latency in seconds")
+    args = parser.parse_args()
+
+    keys = [normalize_query(q) for q in DISTINCT]
+    assert len(set(keys)) == len(keys), f"queries share a cache key: {dict(zip(DISTINCT, keys))}"
+
+    server = start_stand_in(args.delay)
+    os.environ.setdefault("SERPER_API_KEY", "stand-in")
+    browser = WebBrowser(url=f"http://127.0.0.1:{server.server_port}/search")
+
+    queries = ["latest python version", "pandas read csv example", "numpy median axis", "sqlite fts5 tokenizer"]
+    reworded = ["What is the latest Python version?", "pandas read_csv example", "NumPy median, axis", "SQLite FTS5 tokenizer?"]
+
+    rows = [
+        ("cold, sequential", sum(timed(browser.search, q) for q in queries)),
+        ("reworded (cache)", sum(timed(browser.search, q) for q in reworded)),
+    ]
+    fresh = [f"{q} 2024" for q in queries]
+    rows.append(("cold, search_many", timed(browser.search_many, fresh)))
+
+    print(f"{'case':>18} | {'ms (4 queries)':>14}")
+    for name, ms in rows:
+        print(f"{name:>18} | {ms:>14.1f}")
+    print(f"cache hit rate: {browser.cache_hit_rate:.0%} ({browser.metrics['cache_hits']}/{browser.metrics['requests']}), "
+          f"fetches: {browser.metrics['fetches']}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
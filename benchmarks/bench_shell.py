@@ -0,0 +1,78 @@
+"""
+Cold subprocess vs. warm worker pool latency for typical generated scripts.
+
+Run: python benchmarks/bench_shell.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.shell import ShellTool
+
+SCRIPTS = {
+    "stdlib.py": "import math\nprint(sum(math.sqrt(i) for i in range(10000)))\n",
+    "numpy_stats.py": "import numpy as np\ndata = np.arange(1000)\nprint(data.mean(), data.std())\n",
+    "pandas_frame.py": (
+        "import pandas as pd\n"
+        "df = pd.DataFrame({'a': range(100), 'b': range(100)})\n"
+        "print(df.describe().loc['mean'])\n"
+    ),
+}
+
+# Each pair: a script that changes interpreter state, then one that must not see the change
+LEAKS = [
+    ("import io, sys\nsys.stdout = io.StringIO()\n", "print('hello from b')\n", "hello from b"),
+    ("import json\njson.dumps = lambda *a, **k: 'PATCHED'\n", "import json\nprint(json.dumps([1]))\n", "[1]"),
+    ("import os\nos.environ['OVERLORD_LEAK'] = '1'\n", "import os\nprint(os.environ.get('OVERLORD_LEAK'))\n", "None"),
+]
+
+
+def check_isolation(shell, tmp):
+    for i, (first, second, expected) in enumerate(LEAKS):
+        for name, code in ((f"leak_{i}.py", first), (f"after_{i}.py", second)):
+            with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                f.write(code)
+        shell.execute_python(f"leak_{i}.py")
+        output = shell.execute_python(f"after_{i}.py")
+        assert f"STDOUT: {expected}\n" in output, f"state leaked from leak_{i}.py:\n{output}"
+
+
+def median_ms(shell, file_name, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        shell.execute_python(file_name)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, code in SCRIPTS.items():
+            with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                f.write(code)
+
+        cold = ShellTool(tmp)
+        warm = ShellTool(tmp, warm_workers=1)
+        # First run waits for the preload; steady state is what matters
+        for name in SCRIPTS:
+            warm.execute_python(name)
+        check_isolation(warm, tmp)
+
+        print(f"{'script':>16} | {'cold ms':>8} | {'warm ms':>8}")
+        for name in SCRIPTS:
+            print(f"{name:>16} | {median_ms(cold, name, args.runs):>8.1f} | {median_ms(warm, name, args.runs):>8.1f}")
+        warm.close()
+
+
+if __name__ == "__main__":
+    main()
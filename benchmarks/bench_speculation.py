@@ -0,0 +1,132 @@
+"""
+Speculative RUN_CODE: a main.py-style loop (one model call per step) with and without
+ActionExecutor(speculate=True).
+
+Each round writes a script, asks the (mocked) model what to do next, runs the script and asks
+the model again; the script really runs and takes --script-seconds. With speculation the run
+starts right after the write, so it overlaps the model call that precedes RUN_CODE. The last
+round rewrites the file before running it, so its speculative run is discarded.
+
+Run: python benchmarks/bench_speculation.py [--rounds 4] [--model-latency 1.0] [--script-seconds 0.5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.executor import ActionExecutor
+from core.orchestrator import AgentAction
+from core.rate_limiter import GeminiScheduler
+from core.speculation import is_speculable
+from core.validator import CodeValidator
+from tools.file_manager import FileManager
+from tools.shell import ShellTool
+
+
+class MockValidator:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def avalidate_code(self, code):
+        await asyncio.sleep(self.latency)
+        return "SAFE"
+
+    def approved_by_model(self, code):
+        # Stands in for a model that reviewed and approved every script
+        return True
+
+
+# Scripts that once passed the static screen as SAFE and still reached the OS
+BYPASSES = [
+    "import typing\ndef f(x: \"__import__('os').system('echo PWNED')\"): pass\ntyping.get_type_hints(f)\n",
+    "import operator\nprint(operator.attrgetter('__class__.__base__.__subclasses__')(())())\n",
+    "import string\nprint(string.Formatter().get_field('0.__class__.__base__.__subclasses__', [()], {}))\n",
+    "import random\nprint('{0.__globals__[_os].environ}'.format(random.Random.seed))\n",
+]
+
+
+def check_gate():
+    """Only content the validator's model approved runs early; the static screen's SAFE is not enough."""
+    def verdicts(answer):
+        async def generate_content(**kwargs):
+            return SimpleNamespace(text=answer, usage_metadata=None)
+
+        models = SimpleNamespace(generate_content=generate_content)
+        return CodeValidator(cache_path=None, client=SimpleNamespace(aio=SimpleNamespace(models=models)),
+                             scheduler=GeminiScheduler(rpm=1_000_000, tpm=1_000_000_000))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rejecting = ActionExecutor(FileManager(tmp), ShellTool(tmp), browser=None, validator=verdicts("UNSAFE: escapes"))
+        for i, code in enumerate(BYPASSES):
+            rejecting.run_action(AgentAction(thought="", tool="WRITE_FILE", file_name=f"bypass_{i}.py", content=code))
+            # Written without any review: still not run
+            rejecting.files.write_file(f"direct_{i}.py", code)
+            assert not is_speculable(f"direct_{i}.py", code, rejecting.validator)
+        assert rejecting.speculator.metrics["started"] == 0, rejecting.speculator.metrics
+        rejecting.close()
+
+        approving = ActionExecutor(FileManager(tmp), ShellTool(tmp), browser=None, validator=verdicts("SAFE"))
+        # Statically SAFE: no model review, so no early run
+        approving.run_action(AgentAction(thought="", tool="WRITE_FILE", file_name="static.py", content="print(1)\n"))
+        assert approving.speculator.metrics["started"] == 0, approving.speculator.metrics
+        approving.run_action(AgentAction(thought="", tool="WRITE_FILE", file_name="reviewed.py",
+                                         content="import operator\nprint(operator.add(1, 2))\n"))
+        assert approving.speculator.metrics["started"] == 1, approving.speculator.metrics
+        approving.close()
+
+
+def script(round_number, seconds):
+    return f"import time\ntime.sleep({seconds})\nprint('round {round_number}:', sum(i * i for i in range(1000)))\n"
+
+
+def run(speculate, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        executor = ActionExecutor(FileManager(tmp), ShellTool(tmp), browser=None,
+                                  validator=MockValidator(args.validator_latency), speculate=speculate)
+        start = time.perf_counter()
+        for round_number in range(args.rounds):
+            file_name = f"round_{round_number}.py"
+            executor.run_action(AgentAction(thought="", tool="WRITE_FILE", file_name=file_name,
+                                            content=script(round_number, args.script_seconds)))
+            time.sleep(args.model_latency)  # model picks the next action
+            if round_number == args.rounds - 1:
+                # The model changes its mind and fixes the file first: the early run must not be used
+                executor.run_action(AgentAction(thought="", tool="WRITE_FILE", file_name=file_name,
+                                                content=script(round_number, args.script_seconds) + "print('fixed')\n"))
+                time.sleep(args.model_latency)
+            output = executor.run_action(AgentAction(thought="", tool="RUN_CODE", file_name=file_name))
+            assert f"round {round_number}:" in output, output
+            if round_number == args.rounds - 1:
+                assert "fixed" in output, output
+            time.sleep(args.model_latency)  # model reads the output
+        elapsed = time.perf_counter() - start
+        metrics = dict(executor.speculator.metrics) if executor.speculator else {}
+        executor.close()
+        return elapsed, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--model-latency", type=float, default=1.0)
+    parser.add_argument("--validator-latency", type=float, default=0.3)
+    parser.add_argument("--script-seconds", type=float, default=0.5)
+    args = parser.parse_args()
+
+    check_gate()
+    baseline, _ = run(False, args)
+    speculative, metrics = run(True, args)
+    print(f"{args.rounds} write -> model -> run rounds, model {args.model_latency}s, script {args.script_seconds}s\n")
+    print(f"sequential    {baseline:6.2f} s")
+    print(f"speculative   {speculative:6.2f} s  ({baseline - speculative:.2f} s faster)")
+    print(f"\nspeculative runs: {metrics['started']} started, {metrics['used']} used, {metrics['discarded']} discarded, "
+          f"{metrics['seconds_saved']:.2f} s of waiting saved ({metrics['seconds_saved'] / args.rounds:.2f} s per round)")
+
+
+if __name__ == "__main__":
+    main()
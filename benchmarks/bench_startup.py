@@ -0,0 +1,101 @@
+"""
+CLI cold start: import time of main.py (python -X importtime) and wall time from launching
+`python main.py` to the first prompt. Heavy modules that should stay out of startup are flagged.
+
+Run: python benchmarks/bench_startup.py [--runs 5] [--max-ms 1500] [--json out.json]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+
+# Loaded on demand (first model call, first async search, the web app), never before the first prompt
+LAZY_MODULES = ("streamlit", "google.genai", "httpx", "wsgiref")
+
+
+def _env():
+    # Dummy keys: startup must not need the network, only the keys' presence
+    return dict(os.environ, GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", "startup-bench"),
+                SERPER_API_KEY=os.getenv("SERPER_API_KEY", "startup-bench"), PYTHONPATH=ROOT)
+
+
+def import_profile():
+    """Returns (total import ms of main, {module: cumulative ms}) from one -X importtime run."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                          cwd=ROOT, env=_env(), capture_output=True, text=True)
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            modules[match.group(3)] = int(match.group(1)) / 1000
+    return modules.get("main", 0.0), modules
+
+
+def time_to_prompt(workdir):
+    """Launches main.py in an empty folder and times until the task prompt is printed."""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, MAIN], cwd=workdir, env=_env(),
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    seen = b""
+    try:
+        while b"[USER]:" not in seen:
+            chunk = os.read(proc.stdout.fileno(), 4096)
+            if not chunk:
+                raise RuntimeError("main.py exited before showing the prompt")
+            seen += chunk
+        return (time.perf_counter() - start) * 1000
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="slowest top-level imports to list")
+    parser.add_argument("--max-ms", type=float, help="fail if the median time to first prompt exceeds this")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    imports, prompts, profile = [], [], {}
+    for _ in range(args.runs):
+        total, profile = import_profile()
+        imports.append(total)
+        with tempfile.TemporaryDirectory() as tmp:
+            prompts.append(time_to_prompt(tmp))
+
+    result = {
+        "import_main_ms": statistics.median(imports),
+        "time_to_prompt_ms": statistics.median(prompts),
+        "lazy_modules_loaded": [m for m in LAZY_MODULES if m in profile],
+    }
+    print(f"import main          {result['import_main_ms']:7.1f} ms (median of {args.runs})")
+    print(f"launch -> prompt     {result['time_to_prompt_ms']:7.1f} ms")
+
+    # Direct imports of main/core/tools, by cumulative cost
+    top_level = sorted(((ms, name) for name, ms in profile.items() if "." not in name and name != "main"),
+                       reverse=True)[:args.top]
+    print("slowest imports:     " + ", ".join(f"{name} {ms:.0f}ms" for ms, name in top_level))
+
+    if result["lazy_modules_loaded"]:
+        print(f"WARNING: loaded at startup although they should be lazy: {', '.join(result['lazy_modules_loaded'])}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.max_ms and result["time_to_prompt_ms"] > args.max_ms:
+        print(f"FAILED: time to prompt {result['time_to_prompt_ms']:.0f}ms > {args.max_ms:.0f}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
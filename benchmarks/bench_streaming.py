@@ -0,0 +1,164 @@
+"""
+Streaming model responses: when the user first sees the thought, when the first tool starts,
+and how long a whole step takes, with get_next_step (blocking) and get_next_step_streaming.
+
+The mocked model answers every step with a thought, a web search, a ~2 KB script to write and a
+RUN_CODE for it. It produces text at a fixed rate after a first-token delay, as Gemini does;
+the search and the validator have fixed latencies, and the script really runs. While streaming,
+the search starts as soon as its action is complete, so it overlaps the rest of the generation.
+
+Run: python benchmarks/bench_streaming.py [--steps 4] [--ttft 0.4] [--chars-per-second 800]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.executor import ActionExecutor
+from core.orchestrator import AgentStep, ProjectOrchestrator
+from core.rate_limiter import GeminiScheduler
+from core.streaming import IncrementalJSONParser
+from tools.file_manager import FileManager
+from tools.shell import ShellTool
+
+CHUNK_CHARS = 12
+
+
+class Chunk:
+    def __init__(self, text, parsed=None):
+        self.text = text
+        self.parsed = parsed
+        self.usage_metadata = None
+
+
+class MockModels:
+    def __init__(self, args):
+        self.args = args
+        self.calls = 0
+
+    def _response(self):
+        self.calls += 1
+        body = "".join(f"values.append(({i} * 7919) % 104729)  # padding line {i}\n" for i in range(40))
+        return json.dumps({
+            "thought": "I need the current figures first, then a script to crunch them and its output. "
+                       "Searching while I write the script, then running it once it is saved.",
+            "actions": [
+                {"thought": "look it up", "tool": "SEARCH_WEB", "content": f"latest figures {self.calls}", "id": "s"},
+                {"thought": "write", "tool": "WRITE_FILE", "file_name": f"crunch_{self.calls}.py",
+                 "content": f"values = []\n{body}print(sum(values))\n", "id": "w"},
+                {"thought": "run", "tool": "RUN_CODE", "file_name": f"crunch_{self.calls}.py", "id": "r",
+                 "depends_on": ["w"]},
+            ],
+        })
+
+    def _chunk_seconds(self):
+        return CHUNK_CHARS / self.args.chars_per_second
+
+    def generate_content(self, *, model, contents, config=None):
+        text = self._response()
+        time.sleep(self.args.ttft + len(text) / CHUNK_CHARS * self._chunk_seconds())
+        return Chunk(text, AgentStep.model_validate_json(text))
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        text = self._response()
+        time.sleep(self.args.ttft)
+        for i in range(0, len(text), CHUNK_CHARS):
+            yield Chunk(text[i:i + CHUNK_CHARS])
+            time.sleep(self._chunk_seconds())
+
+
+class MockClient:
+    def __init__(self, args):
+        self.models = MockModels(args)
+
+
+class MockBrowser:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def asearch(self, query):
+        await asyncio.sleep(self.latency)
+        return f"Results for {query}: 42"
+
+
+class MockValidator:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def avalidate_code(self, code):
+        await asyncio.sleep(self.latency)
+        return "SAFE"
+
+
+def run(streaming, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        orchestrator = ProjectOrchestrator(client=MockClient(args), scheduler=GeminiScheduler(rpm=1_000_000, tpm=1_000_000_000))
+        executor = ActionExecutor(FileManager(tmp), ShellTool(tmp), MockBrowser(args.search_latency),
+                                  MockValidator(args.validator_latency), speculate=False)
+        history = [{"role": "user", "parts": [{"text": "Crunch the latest figures"}]}]
+        seen, started, steps = [], [], []
+        for _ in range(args.steps):
+            begin = time.perf_counter()
+            first_thought = []
+            actions = executor.stream()
+            if streaming:
+                def on_thought(text):
+                    if not first_thought:
+                        first_thought.append(time.perf_counter() - begin)
+
+                step = orchestrator.get_next_step_streaming(history, on_thought, actions.add)
+                started.append(orchestrator.last_stream.dispatch)
+            else:
+                step = orchestrator.get_next_step(history)
+                first_thought.append(time.perf_counter() - begin)
+                started.append(time.perf_counter() - begin)
+            results = actions.results(step.actions)
+            assert results[0].startswith("Results for"), results
+            assert results[2].startswith("STDOUT: "), results
+            steps.append(time.perf_counter() - begin)
+            seen.append(first_thought[0])
+        executor.close()
+        return statistics.median(seen), statistics.median(started), statistics.median(steps)
+
+
+def parser_overhead(args):
+    text = MockModels(args)._response()
+    pieces = [text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)]
+    rounds = 200
+    start = time.perf_counter()
+    for _ in range(rounds):
+        parser = IncrementalJSONParser(lambda path, value: None, lambda path, value: None, string_paths=[("thought",)])
+        for piece in pieces:
+            parser.feed(piece)
+        parser.close()
+    elapsed = (time.perf_counter() - start) / rounds
+    return elapsed * 1000, elapsed / len(pieces) * 1e6, len(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--ttft", type=float, default=0.4, help="seconds before the model's first token")
+    parser.add_argument("--chars-per-second", type=float, default=800, help="generation speed (~200 tokens/s)")
+    parser.add_argument("--search-latency", type=float, default=0.6)
+    parser.add_argument("--validator-latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    blocking = run(False, args)
+    streaming = run(True, args)
+    print(f"{args.steps} steps (search + write + run), first token {args.ttft}s, {args.chars_per_second:.0f} chars/s\n")
+    print(f"{'median seconds':16}{'thought shown':>15}{'first tool':>12}{'step done':>11}")
+    for name, (seen, started, done) in (("blocking", blocking), ("streaming", streaming)):
+        print(f"{name:16}{seen:>15.2f}{started:>12.2f}{done:>11.2f}")
+    total_ms, chunk_us, size = parser_overhead(args)
+    print(f"\nincremental parser: {total_ms:.2f} ms per {size}-char response ({chunk_us:.1f} us per {CHUNK_CHARS}-char chunk)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+CodeValidator: static screen, verdict cache and model calls on a mix of generated scripts, fully offline.
+
+The validator's model is a stub that answers SAFE after --model-latency seconds. Before timing, each
+script in SCREENED is checked against the verdict the static screen must give: code that can escape
+the AST's view (format-string traversal, loops that may never end) has to reach the model (None).
+
+Run: python benchmarks/bench_validator.py [--rounds 3] [--model-latency 0.05]
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.rate_limiter import GeminiScheduler
+from core.validator import CodeValidator, static_screen
+
+SCREENED = [
+    ("import math\nprint(math.sqrt(16))\n", "SAFE"),
+    ("print('{} + {name}'.format(1, name=2))\n", "SAFE"),
+    ("i = 0\nwhile True:\n    i += 1\n    if i > 3:\n        break\n", "SAFE"),
+    ("import shutil\nshutil.rmtree('/tmp/x')\n", "UNSAFE: deletes directory trees (shutil.rmtree)"),
+    ("while True:\n    pass\n", "UNSAFE: infinite loop (while True without break)"),
+    # An endless generator hands control back on every yield
+    ("import itertools\n\ndef naturals():\n    n = 1\n    while True:\n        yield n\n        n += 1\n\n"
+     "print(list(itertools.islice(naturals(), 5)))\n", "SAFE"),
+    # str.format walks attributes and items itself
+    ("import random\nprint('{0.__globals__[_os].environ}'.format(random.Random.seed))\n", None),
+    ("import random\nprint('{f.__globals__}'.format_map({'f': random.Random.seed}))\n", None),
+    ("print('{:{0.__class__}}'.format(1))\n", None),
+    ("template = '{0.real}'\nprint(template.format(1))\n", None),
+    ("import string\nprint(string.Formatter().get_field('0.__class__.__base__', [()], {}))\n", None),
+    # Attribute paths and code hidden in strings
+    ("import typing\ndef f(x: \"__import__('os').system('echo PWNED')\"): pass\ntyping.get_type_hints(f)\n", None),
+    ("import operator\nprint(operator.attrgetter('__class__.__base__.__subclasses__')(())())\n", None),
+    ("import operator\nprint(operator.add(1, 2))\n", None),
+    ("print('__class__')\n", None),
+    ("def main():\n    print(1)\n\n\nif __name__ == '__main__':\n    main()\n", "SAFE"),
+    # Loops that only end if the condition changes, or never
+    ("while not False:\n    pass\n", None),
+    ("running = True\nwhile running:\n    pass\n", None),
+    ("import itertools\nfor i in itertools.count():\n    pass\n", None),
+    ("from itertools import cycle\nfor i in cycle([1, 2]):\n    pass\n", None),
+    ("from itertools import repeat\nfor i in repeat(0):\n    pass\n", None),
+]
+
+
+def check_screen():
+    for code, expected in SCREENED:
+        verdict = static_screen(code)
+        assert verdict == expected, f"static_screen gave {verdict!r}, expected {expected!r} for:\n{code}"
+
+
+def run(rounds, latency):
+    calls = []
+
+    def generate_content(model, contents, config=None):
+        calls.append(contents)
+        time.sleep(latency)
+        return SimpleNamespace(text="SAFE", usage_metadata=None)
+
+    validator = CodeValidator(cache_path=None, client=SimpleNamespace(models=SimpleNamespace(
+        generate_content=generate_content)), scheduler=GeminiScheduler(rpm=1_000_000, tpm=1_000_000_000))
+    # Without a cache every undecided script costs a model call each round
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for code, _ in SCREENED:
+            validator.validate_code(code)
+    return time.perf_counter() - start, validator.metrics, len(calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--model-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    check_screen()
+    print(f"static screen: {len(SCREENED)} scripts checked")
+
+    elapsed, metrics, calls = run(args.rounds, args.model_latency)
+    print(f"{metrics['requests']} validations in {elapsed:.2f} s: {metrics['static_verdicts']} decided statically, "
+          f"{calls} model calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+INSTALL_PACKAGE latency and disk use: pip from the package index for every task (what a plain
+'pip install' costs a task that does not have the package yet) against per-task venvs from
+tools.venv_pool installing from the local wheelhouse.
+
+Each task installs --packages and runs a script importing them. The first pooled task starts the
+pool and fills the wheelhouse (the only download); the rest copy the same wheels in without
+running pip. The last round repeats the tasks with the package index unreachable and downloads
+disabled, to show installs work offline once the wheels are cached.
+
+Run: python benchmarks/bench_venv_pool.py [--tasks 4] [--packages tabulate humanize] [--seed tabulate]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.shell import ShellTool
+from tools.venv_pool import VenvPool, Wheelhouse, disk_usage
+
+UNREACHABLE_INDEX = "http://127.0.0.1:9/simple"
+
+
+def index_install(tmp, packages, tasks):
+    """Baseline: every task downloads and installs its packages (into its own --target, the host stays clean)."""
+    seconds, sizes = [], []
+    for i in range(tasks):
+        target = os.path.join(tmp, f"target-{i}")
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "pip", "install", "--quiet", "--disable-pip-version-check",
+                        "--no-cache-dir", "--target", target, *packages], check=True, stderr=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+        sizes.append(disk_usage(target))
+    return seconds, sizes
+
+
+def wait_until_ready(pool, timeout=120):
+    # The pool starts seeding and filling at the first checkout; the first task gets a venv made on the spot
+    deadline = time.monotonic() + timeout
+    while pool._started and pool._idle.qsize() < pool.size and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def pooled_install(tmp, root, wheelhouse, packages, seed, tasks, script):
+    pool = VenvPool(os.path.join(root, "venvs"), size=2, seed=seed, wheelhouse=wheelhouse)
+    shell = ShellTool(tmp, venv_pool=pool)
+    seconds, checkouts, sizes, outputs = [], [], [], []
+    try:
+        for _ in range(tasks):
+            wait_until_ready(pool)
+            task_shell = shell.for_workspace(tmp)
+            start = time.perf_counter()
+            result = task_shell.install_package(" ".join(packages))
+            seconds.append(time.perf_counter() - start)
+            assert result.startswith("Installed package"), result
+            # A second install of the same packages in the same task
+            start = time.perf_counter()
+            task_shell.install_package(" ".join(packages))
+            checkouts.append(time.perf_counter() - start)
+            outputs.append(task_shell.execute_python(script))
+            sizes.append(disk_usage(task_shell.venv.path))
+            task_shell.close()
+        usage = pool.disk_usage()
+        metrics = dict(pool.metrics, seed_error=pool.seed_error)
+    finally:
+        shell.close()
+    return seconds, checkouts, sizes, outputs, usage, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=4)
+    parser.add_argument("--packages", nargs="+", default=["tabulate", "humanize"])
+    parser.add_argument("--seed", nargs="*", default=["tabulate"], help="packages pre-installed for every venv")
+    args = parser.parse_args()
+
+    modules = [p.replace("-", "_") for p in args.packages]
+    with tempfile.TemporaryDirectory() as tmp:
+        script = "check_imports.py"
+        with open(os.path.join(tmp, script), "w") as f:
+            f.write(f"import {', '.join(modules)}\nprint('imported', {len(modules)})\n")
+
+        baseline, baseline_sizes = index_install(tmp, args.packages, args.tasks)
+
+        wheelhouse = Wheelhouse(os.path.join(tmp, "wheelhouse"))
+        online = pooled_install(tmp, tmp, wheelhouse, args.packages, args.seed, args.tasks, script)
+
+        # No network from here on: every index is unreachable and the wheelhouse may not download
+        os.environ["PIP_INDEX_URL"] = os.environ["PIP_EXTRA_INDEX_URL"] = UNREACHABLE_INDEX
+        offline_house = Wheelhouse(wheelhouse.path, allow_download=False)
+        offline = pooled_install(tmp, os.path.join(tmp, "offline"), offline_house, args.packages, args.seed,
+                                 args.tasks, script)
+
+    for _, _, _, outputs, _, metrics in (online, offline):
+        assert all("imported" in out for out in outputs), outputs
+        assert metrics["failed"] == 0 and metrics["seed_error"] is None, metrics
+
+    kb = lambda n: n / 1024
+    print(f"{args.tasks} tasks installing {' '.join(args.packages)} (seed: {' '.join(args.seed) or 'none'})\n")
+    print(f"{'':34}{'first task s':>13}{'median s':>10}{'disk/task KB':>14}")
+    print(f"{'pip install from the index':34}{baseline[0]:>13.2f}{statistics.median(baseline):>10.2f}"
+          f"{statistics.median(baseline_sizes) / 1024:>14.0f}")
+    for name, (seconds, _, sizes, _, _, _) in (("venv pool + wheelhouse", online), ("venv pool, offline", offline)):
+        print(f"{name:34}{seconds[0]:>13.2f}{statistics.median(seconds[1:] or seconds):>10.2f}"
+              f"{statistics.median(sizes) / 1024:>14.0f}")
+    print(f"{'same install again in a task':34}{'':>13}{statistics.median(online[1]) * 1000:>9.1f}m")
+
+    usage = online[4]
+    print(f"\nshared: wheelhouse {kb(usage['wheelhouse']):.0f} KB, seed {kb(usage['seed']):.0f} KB; "
+          f"{online[5]['fetched']} download(s) for {args.tasks} tasks online, {offline[5]['fetched']} offline")
+
+
+if __name__ == "__main__":
+    main()
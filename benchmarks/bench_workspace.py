@@ -0,0 +1,87 @@
+"""
+Workspace listing and ranged reads.
+
+Listing: a full os.walk + hash of every file (what an uncached listing with hashes costs) vs.
+WorkspaceIndex.refresh() after the first scan, with a few files changed in between.
+Reading: FileManager.read_range on a large file vs. reading the whole file and slicing lines.
+
+Run: python benchmarks/bench_workspace.py [--files 2000] [--big-mb 100]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.file_manager import FileManager
+from tools.workspace_index import WorkspaceIndex, file_digest
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def full_listing(base_dir):
+    listing = {}
+    for root, _, names in os.walk(base_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            listing[os.path.relpath(path, base_dir)] = (stat.st_size, stat.st_mtime_ns, file_digest(path))
+    return listing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--big-mb", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(args.files):
+            folder = os.path.join(tmp, f"pkg{i % 20}")
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, f"mod{i}.py"), "w") as f:
+                f.write(f"VALUE = {i}\n" * 200)
+
+        index = WorkspaceIndex(tmp, min_interval=0)
+        cold = timed(lambda: index.refresh(force=True) and index.list(with_hashes=True), repeat=1)
+
+        def touch_and_refresh():
+            for i in range(5):
+                with open(os.path.join(tmp, "pkg0", f"mod{i * 20}.py"), "a") as f:
+                    f.write("# edit\n")
+            index.list(with_hashes=True)
+
+        print(f"listing {args.files} files")
+        print(f"  os.walk + hash everything   {timed(lambda: full_listing(tmp)):8.1f} ms")
+        print(f"  index, first scan           {cold:8.1f} ms")
+        print(f"  index, 5 files changed      {timed(touch_and_refresh):8.1f} ms")
+        index.min_interval = 60
+        print(f"  index, UI rerun (cached)    {timed(index.list):8.3f} ms")
+
+        files = FileManager(tmp)
+        line = "x" * 79 + "\n"
+        with open(os.path.join(tmp, "big.log"), "w") as f:
+            f.write(line * (args.big_mb * 1024 * 1024 // len(line)))
+        middle = args.big_mb * 1024 * 1024 // len(line) // 2
+
+        def read_all():
+            with open(os.path.join(tmp, "big.log"), encoding="utf-8") as f:
+                return f.read().splitlines()[middle:middle + 40]
+
+        print(f"\nreading 40 lines from the middle of a {args.big_mb} MB file")
+        print(f"  read whole file + slice     {timed(read_all, repeat=3):8.1f} ms")
+        print(f"  read_range (mmap)           {timed(lambda: files.read_range('big.log', (middle, middle + 39)), repeat=3):8.1f} ms")
+        print(f"  read_range bytes (mmap)     {timed(lambda: files.read_range('big.log', byte_range=(2 ** 20, 2 ** 20 + 4095))):8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import re
+import time
+
+from core.engine import AgentEngine
+from core.memory import TaskMemory
+
+
+def load_tasks(path):
+    """
+    Reads a JSONL task file. Each line is {"id": ..., "task": ...} or just a JSON string;
+    lines without an id are named after their line number, so keep ids stable to resume.
+    """
+    tasks = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, str):
+                entry = {"task": entry}
+            task_id = str(entry.get("id") or f"line-{number}")
+            if task_id in seen:
+                raise ValueError(f"Duplicate task id '{task_id}' on line {number} of {path}")
+            seen.add(task_id)
+            tasks.append({"id": task_id, "task": entry["task"]})
+    return tasks
+
+
+def load_results(path):
+    """Latest result per task id from a results file (missing file = nothing done yet)."""
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut off by the interruption; that task simply runs again
+                continue
+            results[result["id"]] = result
+    return results
+
+
+def _slug(task_id):
+    return re.sub(r"[^\w.-]", "_", task_id)[:64] or "task"
+
+
+class BatchRunner:
+    """
+    Headless runner for many tasks. Every task gets its own memory session and workspace
+    subfolder; the orchestrator, validator and browser (and so the genai client and the rate
+    limiter) are shared. Results are appended to a JSONL file as tasks finish, and tasks that
+    already have a result there are skipped, so an interrupted batch picks up where it stopped.
+    """
+
+    def __init__(self, orchestrator, validator, browser, files, shell, workers=4,
+                 db_path="overlord_memory.db", max_steps=10, tracer=None, plan_cache=None):
+        self.orchestrator = orchestrator
+        self.validator = validator
+        self.browser = browser
+        self.files = files
+        self.shell = shell
+        self.workers = workers
+        self.db_path = db_path
+        self.max_steps = max_steps
+        self.tracer = tracer
+        self.plan_cache = plan_cache
+
+    def pending(self, tasks, results, retry_failed=False):
+        return [t for t in tasks if t["id"] not in results
+                or (retry_failed and results[t["id"]]["status"] != "done")]
+
+    async def _run_one(self, entry):
+        files = self.files.subdir(_slug(entry["id"]))
+        shell = self.shell.for_workspace(files.base_dir)
+        memory = TaskMemory(self.db_path, session_id=f"batch:{entry['id']}")
+        # Anything left in the session belongs to an interrupted attempt; start the task over
+        memory.clear_memory()
+        if self.tracer:
+            self.tracer.instrument_agent(shell=shell, memory=memory)
+        engine = AgentEngine(self.orchestrator, self.validator, files, shell, self.browser,
+                             max_steps=self.max_steps, tracer=self.tracer, plan_cache=self.plan_cache)
+
+        result = {"id": entry["id"], "task": entry["task"], "workspace": files.base_dir}
+        start = time.perf_counter()
+        try:
+            outcome = await engine.run_task(entry["task"], memory)
+            result.update(status=outcome["status"], answer=outcome["answer"], steps=outcome["steps"])
+            for key in ("llm_calls_saved", "speculation_saved"):
+                if key in outcome:
+                    result[key] = outcome[key]
+            if outcome["status"] == "done":
+                # Same report main.py writes for interactive runs
+                content = f"### Result\n{outcome['answer']}\n\n### Process\n"
+                for event in memory.get_recent(5):
+                    content += f"- {event['parts'][0]['text']}\n"
+                files.save_report(entry["task"][:30], content)
+                memory.add_report(entry["task"], content)
+                result["report"] = files.report_name(entry["task"][:30])
+        except Exception as e:
+            result.update(status="error", answer=None, error=str(e))
+        finally:
+            memory.close()
+            engine.close()
+            shell.close()
+        result["elapsed"] = round(time.perf_counter() - start, 3)
+        return result
+
+    async def arun(self, tasks_path, results_path, retry_failed=False, on_result=None) -> dict:
+        """Runs every pending task, `workers` at a time. on_result(result) is called as each one finishes."""
+        tasks = load_tasks(tasks_path)
+        todo = self.pending(tasks, load_results(results_path), retry_failed)
+        summary = {"total": len(tasks), "skipped": len(tasks) - len(todo), "statuses": {}}
+        start = time.perf_counter()
+        queue = asyncio.Queue()
+        for entry in todo:
+            queue.put_nowait(entry)
+
+        with open(results_path, "a", encoding="utf-8") as out:
+            async def worker():
+                while not queue.empty():
+                    result = await self._run_one(queue.get_nowait())
+                    # One line per finished task, flushed right away so a crash loses nothing
+                    out.write(json.dumps(result) + "\n")
+                    out.flush()
+                    summary["statuses"][result["status"]] = summary["statuses"].get(result["status"], 0) + 1
+                    if on_result:
+                        on_result(result)
+
+            await asyncio.gather(*(worker() for _ in range(min(self.workers, len(todo)) or 1)))
+
+        # The browser's async HTTP client belongs to this event loop
+        await self.browser.aclose()
+        if self.tracer:
+            self.tracer.flush()
+        summary["elapsed"] = time.perf_counter() - start
+        return summary
+
+    def run(self, tasks_path, results_path, retry_failed=False, on_result=None) -> dict:
+        return asyncio.run(self.arun(tasks_path, results_path, retry_failed, on_result))
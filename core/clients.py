@@ -0,0 +1,62 @@
+import threading
+
+from core.config import get_secret
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def gemini_api_key(api_key=None):
+    api_key = api_key or get_secret("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("No GEMINI_API_KEY found. Check Streamlit Secrets or .env file.")
+    return api_key
+
+
+def get_genai_client(api_key=None):
+    """
+    The one genai.Client per API key that every component shares (connection pools included).
+    google.genai is imported on first use, so starting the CLI does not pay for it.
+    """
+    api_key = gemini_api_key(api_key)
+    with _lock:
+        if api_key not in _clients:
+            from google import genai
+            _clients[api_key] = genai.Client(api_key=api_key)
+        return _clients[api_key]
+
+
+def prefetch(api_key=None):
+    """Builds the shared client on a background thread, e.g. while the user is still typing."""
+    def build():
+        try:
+            get_genai_client(api_key)
+        except Exception:
+            # The first real call will report the problem
+            pass
+
+    thread = threading.Thread(target=build, daemon=True)
+    thread.start()
+    return thread
+
+
+class SharedClient:
+    """
+    Class attribute for components that talk to Gemini: an injected client is used as is,
+    otherwise the shared client is fetched from the registry the first time it is needed.
+    """
+
+    def __set_name__(self, owner, name):
+        self.attr = f"_{name}"
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        client = instance.__dict__.get(self.attr)
+        if client is None:
+            client = get_genai_client(instance.__dict__.get("_api_key"))
+            instance.__dict__[self.attr] = client
+        return client
+
+    def __set__(self, instance, client):
+        instance.__dict__[self.attr] = client
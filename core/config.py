@@ -0,0 +1,63 @@
+import os
+import sys
+import threading
+
+# Same places Streamlit looks for secrets, read directly so the CLI never has to import Streamlit
+SECRETS_FILES = (
+    os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+    os.path.join(os.getcwd(), ".streamlit", "secrets.toml"),
+)
+
+_lock = threading.Lock()
+_file_secrets = None
+_dotenv_loaded = False
+
+
+def _load_file_secrets():
+    global _file_secrets
+    with _lock:
+        if _file_secrets is None:
+            secrets = {}
+            for path in SECRETS_FILES:
+                if os.path.exists(path):
+                    try:
+                        import tomllib
+                    except ImportError:
+                        # Python < 3.11: secrets.toml is only read through Streamlit, the environment still works
+                        break
+                    try:
+                        with open(path, "rb") as f:
+                            secrets.update(tomllib.load(f))
+                    except (OSError, ValueError):
+                        pass
+            _file_secrets = secrets
+        return _file_secrets
+
+
+def _load_dotenv():
+    global _dotenv_loaded
+    with _lock:
+        if not _dotenv_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _dotenv_loaded = True
+
+
+def get_secret(name, default=None):
+    """
+    Looks a setting up in Streamlit secrets, then the environment (.env included).
+    Inside the Streamlit app st.secrets is used as is; elsewhere secrets.toml is read without Streamlit.
+    """
+    if "streamlit" in sys.modules:
+        try:
+            value = sys.modules["streamlit"].secrets.get(name)
+            if value:
+                return value
+        except Exception:
+            # No secrets.toml: Streamlit raises instead of returning None
+            pass
+    value = _load_file_secrets().get(name)
+    if value:
+        return value
+    _load_dotenv()
+    return os.getenv(name, default)
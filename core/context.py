@@ -0,0 +1,157 @@
+import itertools
+import re
+from dataclasses import dataclass
+
+# Rough chars-per-token ratio for Gemini on English text and code; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def clip_text(text: str, max_tokens: int, head_ratio: float = 0.6) -> str:
+    """Keeps the head and tail of an oversized message and drops the middle."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    head = int(max_chars * head_ratio)
+    tail = max_chars - head
+    clipped = len(text) - head - tail
+    return f"{text[:head]}\n...[{clipped} chars clipped]...\n{text[-tail:]}"
+
+
+def digest(role: str, text: str, max_chars: int = 160) -> str:
+    """One-line digest of an event, used when folding it into the rolling summary."""
+    line = re.sub(r"\s+", " ", text).strip()
+    if len(line) > max_chars:
+        line = line[:max_chars] + "..."
+    return f"- {role}: {line}"
+
+
+@dataclass
+class ContextStats:
+    raw_tokens: int = 0
+    prompt_tokens: int = 0
+    folded_events: int = 0
+    recalled_snippets: int = 0
+    recalled_tokens: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.raw_tokens - self.prompt_tokens, 0)
+
+
+class ContextBuilder:
+    """
+    Fills a token budget with: the goal, a rolling summary of older steps, snippets recalled
+    from long-term memory (if any), and as many recent steps as fit (newest first). Steps that
+    fall out of the window are folded into the summary exactly once; the summary state is owned
+    by the caller so it can be persisted.
+    """
+
+    def __init__(self, budget_tokens=6000, max_message_tokens=1000, summary_tokens=600, recall_tokens=800):
+        self.budget_tokens = budget_tokens
+        self.max_message_tokens = max_message_tokens
+        self.summary_tokens = summary_tokens
+        # Share of the budget for long-term memory snippets; 0 turns recall off
+        self.recall_tokens = recall_tokens
+
+    @property
+    def max_window_events(self) -> int:
+        """No more steps than this can be in the window: each one costs at least a token."""
+        return self.budget_tokens
+
+    @staticmethod
+    def new_summary_state() -> dict:
+        return {"upto_id": 0, "text": "", "raw_tokens": 0}
+
+    def build(self, goal, events, summary_state, recalled=None):
+        """
+        goal: (id, role, text) of the original request.
+        events: (id, role, text) tuples newer than summary_state["upto_id"], in chronological order.
+        summary_state: dict from new_summary_state(); updated in place when events are folded.
+        recalled: snippet lines from long-term memory, best first; kept while they fit recall_tokens.
+        Returns (history, stats) with history formatted for the Orchestrator.
+        """
+        stats = ContextStats()
+        goal_id, goal_role, goal_text = goal
+        goal_text = clip_text(goal_text, self.max_message_tokens)
+
+        stats.raw_tokens = estimate_tokens(goal[2]) + summary_state["raw_tokens"]
+        stats.raw_tokens += sum(estimate_tokens(text) for _, _, text in events)
+
+        recall_lines, recall_cost = [], 0
+        for line in recalled or []:
+            cost = estimate_tokens(line)
+            if recall_cost + cost > self.recall_tokens:
+                break
+            recall_lines.append(line)
+            recall_cost += cost
+        stats.recalled_snippets, stats.recalled_tokens = len(recall_lines), recall_cost
+
+        # Reserve room for the goal, the summary and recalled snippets, spend the rest on recent steps
+        remaining = self.budget_tokens - estimate_tokens(goal_text) - self.summary_tokens - recall_cost
+        window = []
+        for event in reversed(events):
+            text = clip_text(event[2], self.max_message_tokens)
+            cost = estimate_tokens(text)
+            # Always keep the latest step, even if it alone is over budget
+            if window and cost > remaining:
+                break
+            window.append((event[0], event[1], text))
+            remaining -= cost
+        window.reverse()
+
+        # Everything older than the window is folded into the summary
+        cutoff = window[0][0] if window else None
+        folded = [e for e in events if cutoff is None or e[0] < cutoff]
+        if folded:
+            self._fold(summary_state, folded)
+            stats.folded_events = len(folded)
+
+        history = [{"role": goal_role, "parts": [{"text": goal_text}]}]
+        if summary_state["text"]:
+            history.append({
+                "role": "user",
+                "parts": [{"text": f"[SUMMARY OF EARLIER STEPS]\n{summary_state['text']}"}]
+            })
+        if recall_lines:
+            history.append({
+                "role": "user",
+                "parts": [{"text": "[RELEVANT MEMORY: results from earlier steps and past sessions, "
+                                   "reuse them instead of searching or running again]\n" + "\n".join(recall_lines)}]
+            })
+        history += [{"role": role, "parts": [{"text": text}]} for _, role, text in window]
+
+        stats.prompt_tokens = sum(estimate_tokens(h["parts"][0]["text"]) for h in history)
+        return history, stats
+
+    def build_from_messages(self, messages, summary_state):
+        """Same as build() for a plain chat list like st.session_state.messages."""
+        if not messages:
+            return [], ContextStats()
+        # List positions act as ids; offset by one so the goal is never confused with 'nothing folded'
+        items = [(i + 1, "model" if m["role"] == "assistant" else "user", m["content"])
+                 for i, m in enumerate(messages)]
+        events = [e for e in items[1:] if e[0] > summary_state["upto_id"]]
+        return self.build(items[0], events, summary_state)
+
+    def _fold(self, summary_state, folded):
+        # Rolling: keep the newest digests that fit the summary's share of the budget (at least one).
+        # Walking back from the newest step means a large backlog costs no more than the summary holds.
+        existing = summary_state["text"].splitlines() if summary_state["text"] else []
+        newest_first = itertools.chain((digest(role, text) for _, role, text in reversed(folded)), reversed(existing))
+        lines, length = [], 0
+        for line in newest_first:
+            # Length of the joined text with this line added (a newline between lines)
+            joined = length + len(line) + (1 if lines else 0)
+            if lines and joined // CHARS_PER_TOKEN + 1 > self.summary_tokens:
+                break
+            lines.append(line)
+            length = joined
+        lines.reverse()
+
+        summary_state["text"] = "\n".join(lines)
+        summary_state["upto_id"] = folded[-1][0]
+        summary_state["raw_tokens"] += sum(estimate_tokens(text) for _, _, text in folded)
@@ -0,0 +1,181 @@
+import asyncio
+import time
+
+from core.executor import FAILURE_PREFIXES, ActionStream, ToolDispatcher, merge_observation
+
+
+class _TaskStream(ActionStream):
+    """ActionStream on the event loop: every action is a task that first awaits the ones it depends on."""
+
+    def __init__(self, engine, hold=None):
+        super().__init__(hold)
+        self.engine = engine
+        self._tasks = {}
+
+    def _start(self, action_id, action, needs):
+        waits = {d: self._tasks[d] for d in needs}
+        self._tasks[action_id] = asyncio.ensure_future(self._run(action, waits))
+
+    async def _run(self, action, waits):
+        outcomes = {d: await task for d, task in waits.items()}
+        blocked = sorted(d for d, r in outcomes.items() if str(r).startswith(FAILURE_PREFIXES))
+        if blocked:
+            return f"SKIPPED: depends on {', '.join(blocked)}, which did not succeed."
+        try:
+            return await self.engine.dispatch(action)
+        except Exception as e:
+            return f"Error: {e}"
+
+    async def results(self, actions):
+        ids = self.finish(actions)
+        return list(await asyncio.gather(*(self._tasks[i] for i in ids)))
+
+    def cancel(self):
+        for task in self._tasks.values():
+            task.cancel()
+
+
+class AgentEngine:
+    """
+    Asyncio version of the Think-Act-Observe loop in main.py.
+    Every model, search and subprocess call is awaited, so many tasks can share one thread.
+    """
+
+    def __init__(self, orchestrator, validator, files, shell, browser, max_steps=10,
+                 quota_backoff=None, on_event=None, tracer=None, plan_cache=None, speculate=True, stream=False):
+        self.orchestrator = orchestrator
+        self.validator = validator
+        self.files = files
+        self.shell = shell
+        self.browser = browser
+        self.max_steps = max_steps
+        # Seconds to park a task whose quota stayed exhausted after retries; None asks the scheduler
+        self.quota_backoff = quota_backoff
+        # on_event(kind, data) lets a UI follow along ('thinking', 'thought', 'output', 'result', 'answer')
+        self.on_event = on_event or (lambda kind, data: None)
+        # Optional core.telemetry.Tracer; spans get tagged with the task and step they ran in
+        self.tracer = tracer
+        # Optional core.plan_cache.PlanCache; repeated tasks replay their recorded steps
+        self.plan_cache = plan_cache
+        # Written scripts start running while the next model call is in flight
+        self.tools = ToolDispatcher(files, shell, browser, validator, speculate=speculate)
+        self.speculator = self.tools.speculator
+        # Stream model responses: the thought shows up as it is written ('thinking' events) and
+        # actions start as soon as they are complete, while the model is still writing the rest
+        self.stream = stream
+
+    def _quota_wait(self):
+        if self.quota_backoff is not None:
+            return self.quota_backoff
+        scheduler = getattr(self.orchestrator, "scheduler", None)
+        return max(1.0, scheduler.cooldown(self.orchestrator.model_id)) if scheduler else 60
+
+    async def dispatch(self, action) -> str:
+        """Executes one AgentAction and returns the tool result; RUN_CODE output goes out as 'output' events."""
+        on_output = lambda stream, text: self.on_event(
+            "output", {"file_name": action.file_name, "stream": stream, "text": text}
+        )
+        return await self.tools.dispatch(action, on_output)
+
+    async def execute(self, actions):
+        """Runs a batch of actions; each starts as soon as the actions it depends on are done."""
+        return await _TaskStream(self).results(actions)
+
+    async def run_task(self, task, memory) -> dict:
+        start = time.perf_counter()
+        if self.tracer:
+            self.tracer.set_scope(task=task, step=0)
+        memory.add_event("user", task)
+        outcome = {"task": task, "status": "max_steps", "answer": None, "steps": 0}
+        plan = self.plan_cache.start(task) if self.plan_cache else None
+        saved_before = self.speculator.metrics["seconds_saved"] if self.speculator else 0.0
+
+        last_signature = None
+        step_count = 0
+        while step_count < self.max_steps:
+            step_count += 1
+            if self.tracer:
+                self.tracer.set_scope(step=step_count)
+            actions = _TaskStream(self, hold=last_signature)
+            try:
+                step = plan.next_step() if plan else None
+                if step is None:
+                    history = memory.get_summarized_history()
+                    if self.stream:
+                        on_thought = lambda text, n=step_count: self.on_event(
+                            "thinking", {"task": task, "step": n, "text": text}
+                        )
+                        step = await self.orchestrator.aget_next_step_streaming(history, on_thought, actions.add)
+                    else:
+                        step = await self.orchestrator.aget_next_step(history)
+            except Exception as e:
+                actions.cancel()
+                if "QUOTA_LIMIT_REACHED" not in str(e):
+                    raise
+                # Only this task waits; the others keep going
+                await asyncio.sleep(self._quota_wait())
+                step_count -= 1
+                continue
+
+            if not step:
+                outcome["status"] = "failed"
+                break
+
+            signature = [(a.tool, a.file_name) for a in step.actions]
+            if signature == last_signature:
+                actions.cancel()
+                memory.add_event("user", "You just attempted the exact same action. Do not repeat. Move to the next step.")
+                continue
+            last_signature = signature
+            self.on_event("thought", {"task": task, "step": step_count, "step_plan": step})
+
+            results = await actions.results(step.actions)
+            if plan:
+                step, results = plan.observe(step, results)
+            final = step.actions[-1]
+            if final.tool == "FINAL_ANSWER" and not results[-1].startswith("SKIPPED"):
+                outcome.update(status="done", answer=final.content)
+                self.on_event("answer", {"task": task, "answer": final.content})
+                break
+
+            observation = merge_observation(step.actions, results)
+            self.on_event("result", {"task": task, "step": step_count, "result": observation})
+            memory.add_event("model", f"Thought: {step.thought}\nAction: {', '.join(a.tool for a in step.actions)}\nStatus: [SYSTEM NOTIFICATION]: {observation}")
+
+        memory.flush()
+        if self.speculator:
+            self.speculator.invalidate()
+            outcome["speculation_saved"] = round(self.speculator.metrics["seconds_saved"] - saved_before, 3)
+        if plan:
+            plan.finish(outcome["status"])
+            outcome["llm_calls_saved"] = plan.llm_calls_saved
+        outcome["steps"] = step_count
+        outcome["elapsed"] = time.perf_counter() - start
+        return outcome
+
+    async def run_many(self, tasks, memory_factory, concurrency=4) -> list:
+        """
+        Runs several tasks side by side, at most `concurrency` at a time.
+        memory_factory(index, task) must return a TaskMemory with its own session.
+        A task that raises gets an 'error' outcome; the others keep going.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(index, task):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    return await self.run_task(task, memory_factory(index, task))
+                except Exception as e:
+                    return {"task": task, "status": "error", "answer": None, "steps": 0, "error": str(e),
+                            "elapsed": time.perf_counter() - start}
+
+        return await asyncio.gather(*(run_one(i, t) for i, t in enumerate(tasks)))
+
+    def run(self, task, memory) -> dict:
+        """Synchronous entry point for callers without an event loop."""
+        return asyncio.run(self.run_task(task, memory))
+
+    def close(self):
+        if self.speculator:
+            self.speculator.close()
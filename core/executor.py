@@ -0,0 +1,281 @@
+import abc
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.speculation import SpeculativeRunner
+from tools.file_manager import parse_read_range
+from tools.patch import PatchError
+
+# Results starting with these mean the action did not do its job; dependents are skipped
+FAILURE_PREFIXES = ("SECURITY REJECTION", "Error", "Failed", "SKIPPED")
+# Tools that change a workspace file
+WRITE_TOOLS = ("WRITE_FILE", "APPLY_PATCH")
+# Tools that touch one workspace file; within a batch they stay in order per file
+FILE_TOOLS = WRITE_TOOLS + ("RUN_CODE", "READ_FILE")
+
+
+def action_ids(actions):
+    """Ids of a batch, falling back to positional ids for actions the model left unnamed."""
+    ids = []
+    for i, action in enumerate(actions):
+        action_id = action.id or f"a{i + 1}"
+        if action_id in ids:
+            action_id = f"{action_id}#{i + 1}"
+        ids.append(action_id)
+    return ids
+
+
+def plan_dependencies(actions):
+    """
+    Returns {id: set(ids it must wait for)} for a batch of actions.
+    Explicit depends_on is honoured for earlier actions (so the graph can never have a cycle);
+    on top of that the batch keeps file and package order:
+    a RUN_CODE or READ_FILE waits for writes of its file and earlier installs, actions on one file stay in order,
+    and installs run one at a time.
+    """
+    ids = action_ids(actions)
+    deps = {}
+    for i, action in enumerate(actions):
+        needs = {d for d in action.depends_on if d in ids[:i]}
+        for j in range(i):
+            earlier = actions[j]
+            same_file = action.file_name and earlier.file_name == action.file_name
+            if action.tool in FILE_TOOLS and same_file and earlier.tool in FILE_TOOLS:
+                needs.add(ids[j])
+            if earlier.tool == "INSTALL_PACKAGE" and action.tool in ("RUN_CODE", "INSTALL_PACKAGE"):
+                needs.add(ids[j])
+            if action.tool == "FINAL_ANSWER":
+                needs.add(ids[j])
+        deps[ids[i]] = needs
+    return deps
+
+
+def merge_observation(actions, results):
+    """Folds the results of a batch into one observation for memory."""
+    if len(actions) == 1:
+        return results[0]
+    lines = []
+    for action_id, action, result in zip(action_ids(actions), actions, results):
+        target = action.file_name or (action.content or "")[:60]
+        lines.append(f"[{action_id}] {action.tool} {target}: {result}")
+    return "\n".join(lines)
+
+
+class ActionStream(abc.ABC):
+    """
+    A step whose actions arrive one at a time, from a streamed model response. Each action starts
+    as soon as it has arrived and the actions it depends on are done; dependencies only point at
+    earlier actions, so later arrivals never change them.
+    hold is the (tool, file_name) signature of the previous step: while the actions so far repeat
+    it they are held back, so a duplicated step never runs. They start once the step differs.
+    """
+
+    def __init__(self, hold=None):
+        self.actions = []
+        self._hold = hold
+        self._started = 0
+
+    def add(self, action):
+        self.actions.append(action)
+        if self._hold is not None:
+            so_far = [(a.tool, a.file_name) for a in self.actions]
+            if so_far == self._hold[:len(so_far)]:
+                return
+            self._hold = None
+        self._start_pending()
+
+    def _start_pending(self):
+        ids = action_ids(self.actions)
+        deps = plan_dependencies(self.actions)
+        while self._started < len(self.actions):
+            action_id = ids[self._started]
+            self._start(action_id, self.actions[self._started], deps[action_id])
+            self._started += 1
+
+    @abc.abstractmethod
+    def _start(self, action_id, action, needs):
+        """Starts one action once the actions in needs (ids) are done."""
+
+    def finish(self, actions):
+        """Takes the complete list of the step's actions, starts whatever has not started yet and returns their ids."""
+        self.actions.extend(actions[len(self.actions):])
+        self._hold = None
+        self._start_pending()
+        return action_ids(self.actions)
+
+
+class _ThreadedActionStream(ActionStream):
+    def __init__(self, executor, on_output=None, hold=None):
+        super().__init__(hold)
+        self.executor = executor
+        self.on_output = on_output
+        self._futures = {}
+        # Actions are queued in arrival order and only wait for earlier ones, so blocked workers cannot deadlock
+        self._pool = ThreadPoolExecutor(max_workers=executor.max_workers)
+
+    def _start(self, action_id, action, needs):
+        waits = {d: self._futures[d] for d in needs}
+        # Copy the caller's context so tracing spans know which task and step they belong to
+        context = contextvars.copy_context()
+        self._futures[action_id] = self._pool.submit(context.run, self._run, action, waits)
+
+    def _run(self, action, waits):
+        blocked = sorted(d for d, f in waits.items() if str(f.result()).startswith(FAILURE_PREFIXES))
+        if blocked:
+            return f"SKIPPED: depends on {', '.join(blocked)}, which did not succeed."
+        try:
+            return self.executor.run_action(action, self.on_output)
+        except Exception as e:
+            return f"Error: {e}"
+
+    def results(self, actions):
+        """Runs the rest of the step and returns all results in the order of `actions`."""
+        ids = self.finish(actions)
+        try:
+            return [self._futures[i].result() for i in ids]
+        finally:
+            self._pool.shutdown(wait=False)
+
+    def cancel(self):
+        """Drops a step that will not be run (held actions never start)."""
+        self._pool.shutdown(wait=False)
+
+
+class ToolDispatcher:
+    """
+    The tools behind AgentActions, in one place. AgentEngine awaits dispatch on its own loop;
+    ActionExecutor runs it on a private loop thread for its synchronous callers.
+    """
+
+    def __init__(self, files, shell, browser, validator, allow_install=True, speculate=True):
+        self.files = files
+        self.shell = shell
+        self.browser = browser
+        self.validator = validator
+        self.allow_install = allow_install
+        # Written scripts start running while the model decides what to do next
+        self.speculator = SpeculativeRunner(shell, files, validator) if speculate else None
+
+    async def _write(self, action):
+        # The file is staged on disk while the validator decides; only a SAFE verdict moves it into place
+        staging = asyncio.ensure_future(asyncio.to_thread(self.files.stage_write, action.file_name, action.content))
+        try:
+            check = await self.validator.avalidate_code(action.content)
+        except BaseException:
+            (await staging).discard()
+            raise
+        staged = await staging
+        if "UNSAFE" in check.upper():
+            staged.discard()
+            return f"SECURITY REJECTION: {check}. Please rewrite the code safely."
+        result = staged.commit()
+        if self.speculator:
+            self.speculator.astart(action.file_name, action.content)
+        return result
+
+    async def dispatch(self, action, on_output=None) -> str:
+        """Executes one AgentAction and returns the tool result. on_output(stream, text) receives RUN_CODE output live."""
+        if action.tool == "WRITE_FILE":
+            return await self._write(action)
+
+        elif action.tool == "APPLY_PATCH":
+            try:
+                content, ranges = self.files.patch_file(action.file_name, action.content or "")
+            except (PatchError, FileNotFoundError, PermissionError) as e:
+                return f"Error: {e}"
+            check = await self.validator.avalidate_change(content, ranges, label=action.file_name)
+            if "UNSAFE" in check.upper():
+                return f"SECURITY REJECTION: {check}. Please rewrite the code safely."
+            changed = sum(end - start for start, end in ranges)
+            result = self.files.write_patched(action.file_name, content, action.content, changed)
+            if self.speculator:
+                self.speculator.astart(action.file_name, content)
+            return result
+
+        elif action.tool == "READ_FILE":
+            try:
+                return self.files.read_range(action.file_name, *parse_read_range(action.content))
+            except (ValueError, PermissionError) as e:
+                return f"Error: {e}"
+
+        elif action.tool == "RUN_CODE":
+            if self.speculator:
+                result = await self.speculator.atake(action.file_name, on_output)
+                if result is not None:
+                    return result
+            return await self.shell.aexecute_python(action.file_name, on_output=on_output)
+
+        elif action.tool == "INSTALL_PACKAGE":
+            if not self.allow_install:
+                return "Error: INSTALL_PACKAGE is disabled in this interface."
+            return await self.shell.ainstall_package(action.content)
+
+        elif action.tool == "SEARCH_WEB":
+            queries = [q for q in (action.content or "").splitlines() if q.strip()]
+            if len(queries) > 1:
+                return await self.browser.asearch_many(queries)
+            return await self.browser.asearch(action.content)
+
+        elif action.tool == "FINAL_ANSWER":
+            return action.content or ""
+
+        return f"Error: Unknown tool {action.tool}"
+
+    async def aclose(self):
+        if self.speculator:
+            await self.speculator.aclose()
+        aclose = getattr(self.browser, "aclose", None)
+        if aclose:
+            await aclose()
+
+
+class ActionExecutor:
+    """
+    Runs the tools behind AgentActions for synchronous callers (main.py, app.py).
+    A batch is executed in a thread pool: actions start as soon as everything they depend on has finished.
+    The tools themselves are ToolDispatcher's, awaited on one event loop that lives in a background thread.
+    """
+
+    def __init__(self, files, shell, browser, validator, max_workers=4, allow_install=True, speculate=True):
+        self.files = files
+        self.shell = shell
+        self.browser = browser
+        self.validator = validator
+        self.max_workers = max_workers
+        self.allow_install = allow_install
+        self.tools = ToolDispatcher(files, shell, browser, validator, allow_install, speculate)
+        self.speculator = self.tools.speculator
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="overlord-actions", daemon=True)
+        self._thread.start()
+
+    def _await(self, coro):
+        # The caller's context travels with the coroutine, so tracing spans know their task and step
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def run_action(self, action, on_output=None) -> str:
+        """Executes one AgentAction; on_output(stream, text) is called from the loop thread."""
+        return self._await(self.tools.dispatch(action, on_output))
+
+    def execute(self, actions, on_output=None):
+        """
+        Runs a batch and returns the results in the order the actions were given.
+        on_output(stream, text) receives RUN_CODE output live, from whichever thread produces it.
+        """
+        return _ThreadedActionStream(self, on_output).results(actions)
+
+    def stream(self, on_output=None, hold=None) -> ActionStream:
+        """
+        For a step that is still being generated: pass add as on_action to
+        ProjectOrchestrator.get_next_step_streaming, then results(step.actions) once it is complete.
+        """
+        return _ThreadedActionStream(self, on_output, hold)
+
+    def close(self):
+        if not self._loop.is_closed():
+            self._await(self.tools.aclose())
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
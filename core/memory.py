@@ -1,69 +1,394 @@
+import re
 import sqlite3
-import json
+import threading
+import time
+
+from core.context import ContextBuilder
+
+# Words too common in agent logs to say anything about relevance
+RECALL_STOPWORDS = {
+    "the", "and", "for", "that", "this", "with", "from", "are", "was", "you", "not", "but", "have",
+    "has", "what", "use", "using", "then", "them", "its", "into", "your", "will", "can", "all",
+    "thought", "action", "status", "system", "notification", "confirmed", "step", "file", "need",
+}
+# Labels of a logged step; a recalled snippet keeps the result but must not read like a step of this run
+STEP_LABELS = re.compile(r"\b(?:Thought|Action|Status):\s*|\[SYSTEM NOTIFICATION\]:\s*")
 
 
 class TaskMemory:
-    def __init__(self, db_path="overlord_memory.db"):
+    """
+    Session-scoped event log backed by a single long-lived SQLite connection.
+    Writes are buffered and flushed in batches; reads only touch the rows they need.
+    Events and task reports are also full-text indexed (FTS5, kept up to date by triggers), so
+    each context can recall relevant results from earlier steps and past sessions.
+    """
+
+    def __init__(self, db_path="overlord_memory.db", session_id="default", batch_size=32, context_builder=None,
+                 recall_k=5, recall_max_matches=1000, recall_count_refresh=1000):
         self.db_path = db_path
+        self.session_id = session_id
+        self.batch_size = batch_size
+        self.context_builder = context_builder or ContextBuilder()
+        self.last_context_stats = None
+        self.recall_k = recall_k
+        # Recall ranks at most this many rows in total (the rarest words first, words matching more
+        # are left out), so its cost stays flat however large the log grows
+        self.recall_max_matches = recall_max_matches
+        # Per-word match counts are cached; counts only drift as rows come in, so the cache is
+        # dropped after this many new rows
+        self.recall_count_refresh = recall_count_refresh
+        self._term_counts = {}
+        self._rows_since_counts = 0
+        self.recall_metrics = {"queries": 0, "snippets": 0, "total_ms": 0.0}
+        self._pending = []
+        self._lock = threading.RLock()
+
+        # One connection for the lifetime of the memory object (shared across threads, guarded by the lock)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         self._init_db()
 
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('''
-                         CREATE TABLE IF NOT EXISTS logs
-                         (
-                             id
-                             INTEGER
-                             PRIMARY
-                             KEY
-                             AUTOINCREMENT,
-                             role
-                             TEXT,
-                             content
-                             TEXT,
-                             timestamp
-                             DATETIME
-                             DEFAULT
-                             CURRENT_TIMESTAMP
-                         )
-                         ''')
-            conn.commit()
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute('''
+                              CREATE TABLE IF NOT EXISTS logs
+                              (
+                                  id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                                  role       TEXT,
+                                  content    TEXT,
+                                  timestamp  DATETIME DEFAULT CURRENT_TIMESTAMP,
+                                  session_id TEXT DEFAULT 'default'
+                              )
+                              ''')
+
+            # Older databases were created without sessions, add the column in place
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(logs)")]
+            if "session_id" not in columns:
+                self.conn.execute("ALTER TABLE logs ADD COLUMN session_id TEXT DEFAULT 'default'")
+
+            # (session_id, id) lets 'first row' and 'last N rows' be answered straight from the index
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_session ON logs (session_id, id)")
+
+            # Rolling summary of the steps that no longer fit in the context window
+            self.conn.execute('''
+                              CREATE TABLE IF NOT EXISTS summaries
+                              (
+                                  session_id TEXT PRIMARY KEY,
+                                  upto_id    INTEGER,
+                                  text       TEXT,
+                                  raw_tokens INTEGER
+                              )
+                              ''')
+
+            # Final reports, kept so later sessions can find earlier answers
+            self.conn.execute('''
+                              CREATE TABLE IF NOT EXISTS reports
+                              (
+                                  id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                                  session_id TEXT,
+                                  task       TEXT,
+                                  content    TEXT,
+                                  timestamp  DATETIME DEFAULT CURRENT_TIMESTAMP
+                              )
+                              ''')
+            self._init_fts("logs")
+            self._init_fts("reports")
+            self.conn.commit()
+
+    def _init_fts(self, table):
+        """External-content FTS5 index over table.content, maintained by triggers on insert and delete."""
+        fts = f"{table}_fts"
+        exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)).fetchone()
+        self.conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5"
+            f"(content, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        self.conn.execute(f'''
+                          CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                              INSERT INTO {fts} (rowid, content) VALUES (new.id, new.content);
+                          END
+                          ''')
+        self.conn.execute(f'''
+                          CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                              INSERT INTO {fts} ({fts}, rowid, content) VALUES ('delete', old.id, old.content);
+                          END
+                          ''')
+        if not exists:
+            # A database from before the index: index what is already there
+            self.conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
 
     def add_event(self, role: str, text: str):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                "INSERT INTO logs (role, content) VALUES (?, ?)",
-                (role, text)
+        with self._lock:
+            self._pending.append((self.session_id, role, text))
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        """Writes any buffered events to disk in a single transaction."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO logs (session_id, role, content) VALUES (?, ?, ?)",
+                self._pending
             )
-            conn.commit()
+        self._count_new_rows(len(self._pending))
+        self._pending = []
 
-    # CHECK THIS NAME CAREFULLY:
-    def get_history(self):
-        """Retrieves history and formats it for Gemini's SDK."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("SELECT role, content FROM logs ORDER BY id ASC")
-            rows = cursor.fetchall()
+    def _count_new_rows(self, n):
+        self._rows_since_counts += n
+        if self._rows_since_counts >= self.recall_count_refresh:
+            self._term_counts.clear()
+            self._rows_since_counts = 0
 
+    def _query(self, sql, params=()):
+        with self._lock:
+            # Reads must see buffered writes
+            self._flush_locked()
+            return self.conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _format(rows):
         # Return as the list of dicts the Orchestrator expects
         return [{"role": r, "parts": [{"text": c}]} for r, c in rows]
 
+    # CHECK THIS NAME CAREFULLY:
+    def get_history(self):
+        """Retrieves the full history of the current session, formatted for Gemini's SDK."""
+        rows = self._query(
+            "SELECT role, content FROM logs WHERE session_id = ? ORDER BY id ASC",
+            (self.session_id,)
+        )
+        return self._format(rows)
+
+    def has_history(self):
+        rows = self._query("SELECT 1 FROM logs WHERE session_id = ? LIMIT 1", (self.session_id,))
+        return bool(rows)
+
+    def get_goal(self):
+        """Returns the first event of the session (the user's original request)."""
+        rows = self._query(
+            "SELECT role, content FROM logs WHERE session_id = ? ORDER BY id ASC LIMIT 1",
+            (self.session_id,)
+        )
+        return self._format(rows)
+
+    def get_recent(self, n: int):
+        """Returns the last n events of the session in chronological order."""
+        rows = self._query(
+            "SELECT role, content FROM logs WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (self.session_id, n)
+        )
+        return self._format(reversed(rows))
+
+    def add_report(self, task, content):
+        """Keeps a finished task's report searchable for later sessions."""
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO reports (session_id, task, content) VALUES (?, ?, ?)",
+                    (self.session_id, task, content)
+                )
+            self._count_new_rows(1)
+
+    def _recall_query(self, text):
+        """FTS5 MATCH expression of the most selective words in text (None if nothing is worth searching)."""
+        words = []
+        for word in re.findall(r"[^\W_]{3,}", text.lower()):
+            if word not in RECALL_STOPWORDS and not word.isdigit() and word not in words:
+                words.append(word)
+        if not words:
+            return None
+        # Matches per word, counted only up to the budget (a LIMIT stops FTS5 early; exact document
+        # counts would walk whole posting lists). Words at the budget are too common to rank on.
+        counts = {}
+        for word in words[:24]:
+            matches = self._term_counts.get(word)
+            if matches is None:
+                matches = sum(
+                    self.conn.execute(
+                        f"SELECT count(*) FROM (SELECT 1 FROM {fts} WHERE {fts} MATCH ? LIMIT ?)",
+                        (f'"{word}"', self.recall_max_matches)
+                    ).fetchone()[0]
+                    for fts in ("logs_fts", "reports_fts")
+                )
+                self._term_counts[word] = matches
+            if 0 < matches < self.recall_max_matches:
+                counts[word] = matches
+        # The rarest words say the most; stop before the rows to rank exceed the budget
+        terms, budget = [], self.recall_max_matches
+        for term in sorted(counts, key=counts.get)[:8]:
+            if terms and counts[term] > budget:
+                break
+            terms.append(term)
+            budget -= counts[term]
+        return " OR ".join(f'"{term}"' for term in terms) or None
+
+    def _recall_logs(self, query, k, exclude_between):
+        """
+        Ranks on the FTS index alone (joining every match to logs costs as much as the ranking),
+        fetching enough extra rows to make up for the ones of this session that are excluded.
+        """
+        hidden = 0
+        if exclude_between:
+            low, high = exclude_between
+            # Two index ranges (an OR would scan the whole session), each counted no further than the
+            # query can match: about recall_max_matches rows
+            hidden = self.conn.execute(
+                """
+                SELECT (SELECT count(*) FROM (SELECT 1 FROM logs WHERE session_id = ?1 AND id <= ?2 LIMIT ?4))
+                     + (SELECT count(*) FROM (SELECT 1 FROM logs WHERE session_id = ?1 AND id > ?3 LIMIT ?4))
+                """,
+                (self.session_id, low, high, self.recall_max_matches)
+            ).fetchone()[0]
+        ranked = self.conn.execute(
+            """
+            SELECT rowid, bm25(logs_fts) AS score, snippet(logs_fts, 0, '', '', ' ... ', 48)
+            FROM logs_fts WHERE logs_fts MATCH ?
+            ORDER BY score LIMIT ?
+            """,
+            (query, k + hidden)
+        ).fetchall()
+        if not ranked:
+            return []
+        origins = {
+            row_id: (session_id, role)
+            for row_id, session_id, role in self.conn.execute(
+                f"SELECT id, session_id, role FROM logs WHERE id IN ({', '.join('?' * len(ranked))})",
+                [row_id for row_id, _, _ in ranked]
+            )
+        }
+        rows = []
+        for row_id, score, snippet in ranked:
+            if row_id not in origins:
+                continue
+            session_id, role = origins[row_id]
+            if exclude_between and session_id == self.session_id and not low < row_id <= high:
+                continue
+            rows.append((score, session_id, role, snippet))
+        return rows[:k]
+
+    def recall(self, text, k=None, exclude_between=None):
+        """
+        Top-k snippets of past events and reports matching text, best first, as lines for the
+        context. exclude_between=(first, last) limits the current session to rows with
+        first < id <= last: the goal and the steps still in the window are in the context already.
+        """
+        k = self.recall_k if k is None else k
+        if not k:
+            return []
+        start = time.perf_counter()
+        rows = []
+        with self._lock:
+            self._flush_locked()
+            query = self._recall_query(text)
+            if query:
+                rows = self._recall_logs(query, k, exclude_between)
+                rows += self.conn.execute(
+                    """
+                    SELECT bm25(reports_fts) AS score, r.session_id, 'report',
+                           snippet(reports_fts, 0, '', '', ' ... ', 48)
+                    FROM reports_fts JOIN reports r ON r.id = reports_fts.rowid
+                    WHERE reports_fts MATCH ?
+                    ORDER BY score LIMIT ?
+                    """,
+                    (query, k)
+                ).fetchall()
+
+        lines, seen = [], set()
+        for _, session_id, source, snippet in sorted(rows)[:k]:
+            snippet = re.sub(r"\s+", " ", STEP_LABELS.sub("", snippet)).strip()
+            if not snippet or snippet in seen:
+                continue
+            seen.add(snippet)
+            origin = "this session" if session_id == self.session_id else f"session {session_id}"
+            lines.append(f"- ({origin}, {source}) {snippet}")
+
+        self.recall_metrics["queries"] += 1
+        self.recall_metrics["snippets"] += len(lines)
+        self.recall_metrics["total_ms"] += (time.perf_counter() - start) * 1000
+        return lines
+
     def clear_memory(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM logs")
-            conn.commit()
+        with self._lock:
+            self._pending = []
+            with self.conn:
+                self.conn.execute("DELETE FROM logs WHERE session_id = ?", (self.session_id,))
+                self.conn.execute("DELETE FROM summaries WHERE session_id = ?", (self.session_id,))
+                # Reports too, or a cleared session's answers would come back through recall
+                self.conn.execute("DELETE FROM reports WHERE session_id = ?", (self.session_id,))
+            self._term_counts.clear()
 
     def get_summarized_history(self):
         """
-        Returns a pruned version of history to stay under quota limits.
-        Always keeps the original user request and the most recent context.
+        Returns a token-budgeted version of history to stay under quota limits.
+        Always keeps the original user request and the most recent context; older steps are
+        folded into a stored rolling summary. At most a window's worth of unfolded steps is read per
+        call, so a long session costs the same as a short one. Savings are left in self.last_context_stats.
         """
-        history = self.get_history()
+        with self._lock:
+            self._flush_locked()
+            goal = self.conn.execute(
+                "SELECT id, role, content FROM logs WHERE session_id = ? ORDER BY id ASC LIMIT 1",
+                (self.session_id,)
+            ).fetchone()
+            if goal is None:
+                return []
+
+            state = self._load_summary()
+            upto_before = state["upto_id"]
+            # Only steps that have not been folded yet are read back, newest first and no more than
+            # could fit in the window: a long session that was never summarized costs no more
+            limit = self.context_builder.max_window_events
+            events = self.conn.execute(
+                "SELECT id, role, content FROM logs WHERE session_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+                (self.session_id, max(goal[0], upto_before), limit + 1)
+            ).fetchall()
+            events.reverse()
+            if len(events) > limit:
+                # Older unfolded steps are skipped unread; the rolling summary only keeps the newest digests
+                state["upto_id"] = events.pop(0)[0]
+
+            recalled = None
+            if self.recall_k and self.context_builder.recall_tokens:
+                # Search with the goal and the latest step; skip what is still verbatim in the window
+                latest = events[-1][2] if events else ""
+                recalled = self.recall(f"{goal[2]}\n{latest}", exclude_between=(goal[0], state["upto_id"]))
+            history, stats = self.context_builder.build(goal, events, state, recalled)
+            if state["upto_id"] != upto_before:
+                self._save_summary(state)
+
+        self.last_context_stats = stats
+        return history
+
+    def _load_summary(self):
+        row = self.conn.execute(
+            "SELECT upto_id, text, raw_tokens FROM summaries WHERE session_id = ?",
+            (self.session_id,)
+        ).fetchone()
+        if row is None:
+            return ContextBuilder.new_summary_state()
+        return {"upto_id": row[0], "text": row[1], "raw_tokens": row[2]}
+
+    def _save_summary(self, state):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries (session_id, upto_id, text, raw_tokens) VALUES (?, ?, ?, ?)",
+                (self.session_id, state["upto_id"], state["text"], state["raw_tokens"])
+            )
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self.conn.close()
 
-        # If history is short, just return it
-        if len(history) <= 6:
-            return history
+    def __enter__(self):
+        return self
 
-        # If history is getting long, we 'compress' it
-        # Keep the very first message (the goal) and the last 5 interactions
-        pruned_history = [history[0]] + history[-5:]
-        return pruned_history
\ No newline at end of file
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,72 +1,218 @@
-import os
-from pydantic import BaseModel, Field
-from typing import List, Literal, Optional
-from google import genai
-from dotenv import load_dotenv
-from google.genai import types
-import streamlit as st
 import time
+from dataclasses import dataclass
+
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Literal, Optional
 
-load_dotenv()
+from core.clients import SharedClient, gemini_api_key
+from core.context import estimate_tokens
+from core.rate_limiter import NORMAL, get_scheduler, is_rate_limited
+from core.streaming import IncrementalJSONParser, JSONStreamError
+from core.telemetry import record_usage
 
 # 1. Define the 'Action' structure the AI MUST follow
 class AgentAction(BaseModel):
     thought: str = Field(description="The AI's reasoning for this step")
-    tool: Literal["WRITE_FILE", "RUN_CODE", "INSTALL_PACKAGE","SEARCH_WEB", "FINAL_ANSWER"]
+    tool: Literal["WRITE_FILE", "APPLY_PATCH", "READ_FILE", "RUN_CODE", "INSTALL_PACKAGE","SEARCH_WEB", "FINAL_ANSWER"]
     file_name: Optional[str] = None
     content: Optional[str] = Field(None, description="The code or command to execute")
+    id: Optional[str] = Field(None, description="Short id other actions in the same step can depend on")
+    depends_on: List[str] = Field(default_factory=list, description="Ids of actions in this step that must finish first")
 
-class ProjectOrchestrator:
-    def __init__(self):
-        api_key = st.secrets.get("GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY")
+# 2. A step may batch several actions; independent ones are executed in parallel
+class AgentStep(BaseModel):
+    thought: str = Field(description="The AI's reasoning for this step")
+    actions: List[AgentAction]
+
+@dataclass
+class StreamStats:
+    # Seconds from sending the request (after any rate-limit wait) to...
+    ttft: Optional[float] = None  # the first chunk of the response
+    dispatch: Optional[float] = None  # the first action handed to on_action
+    total: float = 0.0  # the end of the response
+    chunks: int = 0
+    actions: int = 0  # actions handed out before the response was complete
+
+
+class _StepStream:
+    """Runs the chunks of a streamed AgentStep through the incremental parser and reports early."""
+
+    def __init__(self, on_thought=None, on_action=None):
+        self.on_thought = on_thought
+        self.on_action = on_action
+        self.stats = StreamStats()
+        self.started = time.perf_counter()
+        self.thought = ""
+        self.actions = []
+        # The last chunk carries the usage metadata of the whole response
+        self.last = None
+        self._text = []
+        self._parser = IncrementalJSONParser(self._on_string, self._on_value, string_paths=[("thought",)])
+        self._broken = False
 
-        if not api_key:
-            raise ValueError("No GEMINI_API_KEY found. Check Streamlit Secrets or .env file.")
+    def feed(self, chunk):
+        if chunk is None:
+            return
+        self.last = chunk
+        text = chunk.text
+        if not text:
+            return
+        if self.stats.ttft is None:
+            self.stats.ttft = time.perf_counter() - self.started
+        self.stats.chunks += 1
+        self._text.append(text)
+        if not self._broken:
+            try:
+                self._parser.feed(text)
+            except JSONStreamError:
+                # No more early results; the full response is still parsed (and reported) at the end
+                self._broken = True
 
-        self.client = genai.Client(api_key=api_key)
+    def _on_string(self, path, text):
+        self.thought = text
+        if self.on_thought:
+            self.on_thought(text)
+
+    def _on_value(self, path, value):
+        if path == ("thought",):
+            self._on_string(path, value)
+        elif len(path) == 2 and path[0] == "actions" and isinstance(value, dict):
+            try:
+                action = AgentAction.model_validate(value)
+            except ValidationError:
+                return
+            if self.stats.dispatch is None:
+                self.stats.dispatch = time.perf_counter() - self.started
+            self.stats.actions += 1
+            self.actions.append(action)
+            if self.on_action:
+                self.on_action(action)
+
+    def finish(self) -> Optional[AgentStep]:
+        self.stats.total = time.perf_counter() - self.started
+        try:
+            step = AgentStep.model_validate_json("".join(self._text))
+        except ValueError:
+            step = None
+        if step and step.actions:
+            return step
+        if self.actions:
+            # Actions that were handed out are running already: they are the step, whatever followed them
+            return AgentStep(thought=self.thought, actions=self.actions)
+        return None
+
+
+class ProjectOrchestrator:
+    # Injected (e.g. core.replay for offline runs) or the shared genai.Client, built on first use
+    client = SharedClient()
+
+    def __init__(self, client=None, scheduler=None, priority=NORMAL):
+        # A missing key is still reported up front, only the SDK client itself is deferred
+        self._api_key = None if client is not None else gemini_api_key()
+        self.client = client
+        # Every Gemini call goes through the process-wide scheduler (rate limits, 429 backoff, priorities)
+        self.scheduler = scheduler or get_scheduler()
+        self.priority = priority
+        # Streaming calls: timings of the latest one, and running totals
+        self.last_stream = None
+        self.stream_metrics = {"calls": 0, "ttft_seconds": 0.0, "dispatched": 0, "dispatch_seconds": 0.0,
+                               "total_seconds": 0.0}
         self.model_id = "gemini-2.5-flash" # High speed for iterative tasks
         self.system_prompt = (
             "You are Overlord, an autonomous engineer. "
             "Execute tasks efficiently. If you write a file, move immediately to the next step (like running it). "
-            "Always provide the file_name when using WRITE_FILE or RUN_CODE tools. "
+            "Always provide the file_name when using WRITE_FILE, APPLY_PATCH, READ_FILE or RUN_CODE tools. "
+            "READ_FILE shows part of a workspace file: content is a range such as 'lines 40-80' or "
+            "'bytes 0-4096' (empty reads the first 200 lines). Read only what you need before patching. "
+            "To fix or change a file that already exists, use APPLY_PATCH instead of rewriting it: content is "
+            "one or more blocks of '<<<<<<< SEARCH', the exact lines to replace, '=======', the new lines, "
+            "'>>>>>>> REPLACE' (a unified diff with @@ hunks also works). Only send the lines that change "
+            "plus enough context to be unique; if the patch does not match, nothing is changed. "
             "Once you have the final result, use the FINAL_ANSWER tool."
             "EFFICIENCY RULE: Never repeat an action that has already succeeded. "
             "If 'Tool Result' confirms a file was written, move IMMEDIATELY to execution. "
             "If 'Tool Result' provides a numeric output, move IMMEDIATELY to FINAL_ANSWER. "
             "Do not second-guess successful tool outputs."
             "You have access to a SEARCH_WEB tool. Use it if you need real-time information or "
-            "if you are unsure about a specific library or fact."
+            "if you are unsure about a specific library or fact. "
+            "SEARCH_WEB accepts several queries in content, one per line; they are fetched in parallel."
             "You are Overlord. TOKEN EFFICIENCY IS CRITICAL. "
             "When you receive SEARCH_WEB results, extract the key data immediately and "
             "do not repeat the raw snippets in your future thoughts. "
             "If you hit a quota error, your next response must be extremely brief."
         )
+        self.step_prompt = (
+            "You may return SEVERAL actions in one step when you already know what they are "
+            "(e.g. two searches, or writing several files and running one of them). "
+            "Give each action a short id and list in depends_on the ids of earlier actions it needs first. "
+            "Independent actions run in parallel; RUN_CODE automatically waits for a WRITE_FILE "
+            "of the same file in the same step. Keep each action's thought to a few words. "
+            "FINAL_ANSWER must be the last action of a step."
+        )
 
-    def get_next_action(self, task_history: List[dict]) -> Optional[AgentAction]:
-        try:
+    def _build_request(self, task_history: List[dict], schema=AgentAction):
+        from google.genai import types
 
-            # 1. Properly construct the list using the SDK's internal types
-            formatted_history: List[types.Content] = []
-            for entry in task_history:
-                formatted_history.append(
-                    types.Content(
-                        role=entry["role"],
-                        parts=[types.Part(text=entry["parts"][0]["text"])]
-                    )
+        # 1. Properly construct the list using the SDK's internal types
+        formatted_history: List[types.Content] = []
+        for entry in task_history:
+            formatted_history.append(
+                types.Content(
+                    role=entry["role"],
+                    parts=[types.Part(text=entry["parts"][0]["text"])]
                 )
-
-            config = types.GenerateContentConfig(
-                system_instruction=self.system_prompt,
-                response_mime_type="application/json",
-                response_schema=AgentAction,
             )
 
-            # 2. Call the model
-            response = self.client.models.generate_content(
+        system_instruction = self.system_prompt
+        if schema is AgentStep:
+            system_instruction = f"{self.system_prompt} {self.step_prompt}"
+
+        config = types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            response_mime_type="application/json",
+            response_schema=schema,
+        )
+        return formatted_history, config
+
+    def _estimate(self, task_history: List[dict], schema) -> int:
+        system = self.system_prompt if schema is AgentAction else f"{self.system_prompt} {self.step_prompt}"
+        return estimate_tokens(system) + sum(estimate_tokens(e["parts"][0]["text"]) for e in task_history)
+
+    def _generate(self, task_history, schema):
+        formatted_history, config = self._build_request(task_history, schema)
+        return self.scheduler.call(
+            lambda: self.client.models.generate_content(
                 model=self.model_id,
                 contents=formatted_history,  # PyCharm should now see List[types.Content]
                 config=config,
-            )
+            ),
+            self.model_id, tokens=self._estimate(task_history, schema), priority=self.priority
+        )
+
+    async def _agenerate(self, task_history, schema):
+        formatted_history, config = self._build_request(task_history, schema)
+        return await self.scheduler.acall(
+            lambda: self.client.aio.models.generate_content(
+                model=self.model_id,
+                contents=formatted_history,
+                config=config,
+            ),
+            self.model_id, tokens=self._estimate(task_history, schema), priority=self.priority
+        )
+
+    @staticmethod
+    def _handle_error(e: Exception):
+        if is_rate_limited(e):
+            # The scheduler already backed off and retried; the quota is still exhausted
+            raise Exception("QUOTA_LIMIT_REACHED")
+        print(f"DEBUG: AI Generation failed: {e}")
+        return None
+
+    def get_next_action(self, task_history: List[dict]) -> Optional[AgentAction]:
+        try:
+            # Call the model
+            response = self._generate(task_history, AgentAction)
+            record_usage(response)
 
             # If the response is empty, we still want to be safe
             if not response or not response.parsed:
@@ -75,9 +221,113 @@ class ProjectOrchestrator:
             return response.parsed
 
         except Exception as e:
-            if "429" in str(e):
-                # JUST RAISE THE ERROR. DO NOT SLEEP. DO NOT RECURSE.
-                raise Exception("QUOTA_LIMIT_REACHED")
-            else:
-                print(f"DEBUG: AI Generation failed: {e}")
-                return None
\ No newline at end of file
+            return self._handle_error(e)
+
+    async def aget_next_action(self, task_history: List[dict]) -> Optional[AgentAction]:
+        """Same as get_next_action, on the SDK's async client so other tasks keep running meanwhile."""
+        try:
+            response = await self._agenerate(task_history, AgentAction)
+            record_usage(response)
+            if not response or not response.parsed:
+                return None
+            return response.parsed
+
+        except Exception as e:
+            return self._handle_error(e)
+
+    def get_next_step(self, task_history: List[dict]) -> Optional[AgentStep]:
+        """Like get_next_action, but the model may batch several actions into one step."""
+        try:
+            response = self._generate(task_history, AgentStep)
+            record_usage(response)
+            if not response or not response.parsed or not response.parsed.actions:
+                return None
+            return response.parsed
+
+        except Exception as e:
+            return self._handle_error(e)
+
+    async def aget_next_step(self, task_history: List[dict]) -> Optional[AgentStep]:
+        try:
+            response = await self._agenerate(task_history, AgentStep)
+            record_usage(response)
+            if not response or not response.parsed or not response.parsed.actions:
+                return None
+            return response.parsed
+
+        except Exception as e:
+            return self._handle_error(e)
+
+    def _finish_stream(self, stream, tokens) -> Optional[AgentStep]:
+        step = stream.finish()
+        record_usage(stream.last)
+        self.scheduler.settle(self.model_id, tokens, stream.last)
+        stats = self.last_stream = stream.stats
+        self.stream_metrics["calls"] += 1
+        self.stream_metrics["ttft_seconds"] += stats.ttft or 0.0
+        self.stream_metrics["total_seconds"] += stats.total
+        if stats.dispatch is not None:
+            self.stream_metrics["dispatched"] += 1
+            self.stream_metrics["dispatch_seconds"] += stats.dispatch
+        return step
+
+    def get_next_step_streaming(self, task_history: List[dict], on_thought=None, on_action=None) -> Optional[AgentStep]:
+        """
+        get_next_step over the streaming API. on_thought(text so far) is called while the thought
+        arrives, and on_action(action) as soon as an action object is complete, while the model is
+        still writing the rest of the step. Timings end up in last_stream and stream_metrics.
+        """
+        stream = _StepStream(on_thought, on_action)
+        tokens = self._estimate(task_history, AgentStep)
+        try:
+            formatted_history, config = self._build_request(task_history, AgentStep)
+
+            def start():
+                stream.started = time.perf_counter()
+                chunks = iter(self.client.models.generate_content_stream(
+                    model=self.model_id,
+                    contents=formatted_history,
+                    config=config,
+                ))
+                # A 429 arrives with the first chunk, inside the scheduler's retry loop
+                return chunks, next(chunks, None)
+
+            chunks, first = self.scheduler.call(start, self.model_id, tokens=tokens, priority=self.priority)
+            stream.feed(first)
+            for chunk in chunks:
+                stream.feed(chunk)
+            return self._finish_stream(stream, tokens)
+
+        except Exception as e:
+            if stream.actions:
+                # Actions handed out are running already; even on a 429 they are the step, and the caller
+                # collects their results. The next call meets the quota in the scheduler.
+                return self._finish_stream(stream, tokens)
+            return self._handle_error(e)
+
+    async def aget_next_step_streaming(self, task_history: List[dict], on_thought=None, on_action=None) -> Optional[AgentStep]:
+        stream = _StepStream(on_thought, on_action)
+        tokens = self._estimate(task_history, AgentStep)
+        try:
+            formatted_history, config = self._build_request(task_history, AgentStep)
+
+            async def start():
+                stream.started = time.perf_counter()
+                chunks = await self.client.aio.models.generate_content_stream(
+                    model=self.model_id,
+                    contents=formatted_history,
+                    config=config,
+                )
+                chunks = aiter(chunks)
+                return chunks, await anext(chunks, None)
+
+            chunks, first = await self.scheduler.acall(start, self.model_id, tokens=tokens, priority=self.priority)
+            stream.feed(first)
+            async for chunk in chunks:
+                stream.feed(chunk)
+            return self._finish_stream(stream, tokens)
+
+        except Exception as e:
+            if stream.actions:
+                return self._finish_stream(stream, tokens)
+            return self._handle_error(e)
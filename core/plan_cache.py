@@ -0,0 +1,154 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from core.executor import FAILURE_PREFIXES, WRITE_TOOLS
+from core.orchestrator import AgentStep
+from tools.output import mask_artifact_stamps
+
+
+def task_fingerprint(task: str) -> str:
+    """Key for a task: case, whitespace, quotes and closing punctuation do not matter, numbers and words do."""
+    normalized = re.sub(r"\s+", " ", task.casefold()).strip().strip("\"'`").rstrip(" .!?")
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def same_outcome(action, recorded: str, actual: str) -> bool:
+    """
+    Whether a replayed action observed what the recorded run observed. Writes only have to
+    succeed (or fail) again, since the wording differs when the file already had the content;
+    everything else (program output, file reads, search results) has to match exactly, except for
+    the names of saved output files, which are new on every run.
+    """
+    if action.tool == "FINAL_ANSWER":
+        return True
+    if action.tool in WRITE_TOOLS:
+        return recorded.startswith(FAILURE_PREFIXES) == actual.startswith(FAILURE_PREFIXES)
+    return mask_artifact_stamps(recorded).strip() == mask_artifact_stamps(actual).strip()
+
+
+class PlanCache:
+    """
+    Action sequences of tasks that reached FINAL_ANSWER, keyed by task fingerprint (SQLite,
+    next to the validator's verdicts by default). A repeated task replays them step by step
+    instead of asking the model, and hands back to the model at the first observation that
+    differs from the recorded one.
+    """
+
+    def __init__(self, db_path="overlord_cache.db", max_entries=2000):
+        self.max_entries = max_entries
+        self.metrics = {"lookups": 0, "hits": 0, "replayed_steps": 0, "llm_calls_saved": 0,
+                        "fallbacks": 0, "stored": 0}
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute('''
+                              CREATE TABLE IF NOT EXISTS plans
+                              (
+                                  key       TEXT PRIMARY KEY,
+                                  task      TEXT,
+                                  steps     TEXT,
+                                  uses      INTEGER DEFAULT 0,
+                                  last_used REAL
+                              )
+                              ''')
+            self.conn.commit()
+
+    def lookup(self, task):
+        """The recorded steps for this task ([{"step": ..., "results": [...]}]) or None."""
+        key = task_fingerprint(task)
+        with self._lock:
+            self.metrics["lookups"] += 1
+            row = self.conn.execute("SELECT steps FROM plans WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.metrics["hits"] += 1
+            with self.conn:
+                self.conn.execute("UPDATE plans SET uses = uses + 1, last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def store(self, task, steps):
+        with self._lock:
+            self.metrics["stored"] += 1
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO plans (key, task, steps, uses, last_used) VALUES (?, ?, ?, 0, ?)",
+                    (task_fingerprint(task), task, json.dumps(steps), time.time())
+                )
+                self.conn.execute(
+                    "DELETE FROM plans WHERE key IN "
+                    "(SELECT key FROM plans ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+    def start(self, task) -> "PlanRun":
+        return PlanRun(self, task, self.lookup(task))
+
+    @property
+    def hit_rate(self) -> float:
+        return self.metrics["hits"] / self.metrics["lookups"] if self.metrics["lookups"] else 0.0
+
+    def close(self):
+        self.conn.close()
+
+
+class PlanRun:
+    """
+    One task's use of the plan cache. The agent loop asks next_step() before calling the model
+    (None means: ask the model), reports every executed step to observe(), and calls finish()
+    with the task status; a successful run that was not a complete replay is stored.
+    """
+
+    def __init__(self, cache, task, plan):
+        self.cache = cache
+        self.task = task
+        self.plan = plan or []
+        self.position = 0
+        self.diverged = False
+        self.llm_calls_saved = 0
+        self._replaying = False
+        self._recorded = []
+
+    @property
+    def hit(self) -> bool:
+        return bool(self.plan)
+
+    def next_step(self):
+        self._replaying = not self.diverged and self.position < len(self.plan)
+        if not self._replaying:
+            return None
+        return AgentStep.model_validate(self.plan[self.position]["step"])
+
+    def observe(self, step, results):
+        """
+        Records an executed step and returns (step, results) to go on with. When a replayed step
+        diverges, a FINAL_ANSWER in it answered the recorded observations, not these: it is dropped
+        so the observation goes back to the model instead of ending the task.
+        """
+        if self._replaying:
+            expected = self.plan[self.position]["results"]
+            self.position += 1
+            self.llm_calls_saved += 1
+            self.cache.metrics["replayed_steps"] += 1
+            self.cache.metrics["llm_calls_saved"] += 1
+            matches = len(expected) == len(results) and all(
+                same_outcome(action, old, new) for action, old, new in zip(step.actions, expected, results)
+            )
+            if not matches:
+                # The world changed (different output, failing write...): the model takes it from here
+                self.diverged = True
+                self.cache.metrics["fallbacks"] += 1
+                if len(step.actions) > 1 and step.actions[-1].tool == "FINAL_ANSWER":
+                    step = step.model_copy(update={"actions": step.actions[:-1]})
+                    results = results[:-1]
+        self._recorded.append({"step": step.model_dump(), "results": list(results)})
+        return step, results
+
+    def finish(self, status):
+        complete_replay = self.hit and not self.diverged and self.position == len(self.plan)
+        if status == "done" and not complete_replay:
+            self.cache.store(self.task, self._recorded)
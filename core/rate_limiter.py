@@ -0,0 +1,271 @@
+import asyncio
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+
+from core.config import get_secret
+
+# Lower number = served first. Validation of a pending write blocks an action, so it goes ahead of planning.
+URGENT, NORMAL, BACKGROUND = 0, 1, 2
+
+
+def is_rate_limited(error) -> bool:
+    return getattr(error, "code", None) == 429 or "429" in str(error) or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def parse_quota_hints(error):
+    """
+    Pulls what a Gemini 429 tells us: the suggested retry delay and, if present, the quota that was hit.
+    Returns (retry_after_seconds or None, {"rpm": n} / {"tpm": n} / {}).
+    """
+    text = str(getattr(error, "details", None) or error)
+    retry_after = None
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", text)
+    if match:
+        retry_after = float(match.group(1))
+
+    limits = {}
+    for metric, value in re.findall(r"quotaMetric['\"]?\s*[:=]\s*['\"]?([\w./-]+).*?quotaValue['\"]?\s*[:=]\s*['\"]?(\d+)", text):
+        if "token" in metric:
+            limits["tpm"] = int(value)
+        elif "request" in metric:
+            limits["rpm"] = int(value)
+    return retry_after, limits
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding at most one minute's worth of budget."""
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.clock = clock
+        self.per_minute = float(per_minute)
+        self.level = self.per_minute
+        self.updated = clock()
+
+    def _refill(self, now):
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now) -> float:
+        self._refill(now)
+        # A single call larger than the whole bucket only has to wait for a full bucket
+        need = min(amount, self.per_minute)
+        return 0.0 if self.level >= need else (need - self.level) * 60 / self.per_minute
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+    def set_limit(self, per_minute):
+        self.per_minute = max(1.0, float(per_minute))
+        self.level = min(self.level, self.per_minute)
+
+
+class _ModelState:
+    def __init__(self, rpm, tpm, clock):
+        self.requests = TokenBucket(rpm, clock)
+        self.tokens = TokenBucket(tpm, clock)
+        # Ceilings: what we are allowed to grow back to after backing off
+        self.max_rpm = rpm
+        self.max_tpm = tpm
+        self.paused_until = 0.0
+        self.waiting = []
+
+
+class GeminiScheduler:
+    """
+    Process-wide gate in front of every Gemini call. Calls wait for request and token budget
+    (token buckets per model), are served in priority order, and are retried on 429 with jittered
+    exponential backoff. Limits shrink when a 429 arrives (using the quota it reports, if any)
+    and grow back slowly while calls succeed.
+    """
+
+    def __init__(self, rpm=None, tpm=None, max_retries=5, base_delay=2.0, max_delay=60.0,
+                 clock=time.monotonic, rng=random.random):
+        self.rpm = rpm or int(get_secret("OVERLORD_GEMINI_RPM", "10"))
+        self.tpm = tpm or int(get_secret("OVERLORD_GEMINI_TPM", "250000"))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.rng = rng
+        self.metrics = {"calls": 0, "rate_limited": 0, "retries": 0, "wait_seconds": 0.0}
+        self._models = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _state(self, model):
+        if model not in self._models:
+            self._models[model] = _ModelState(self.rpm, self.tpm, self.clock)
+        return self._models[model]
+
+    # --- admission -----------------------------------------------------------
+
+    def _enqueue(self, model, tokens, priority):
+        ticket = [priority, next(self._seq), tokens]
+        heapq.heappush(self._state(model).waiting, ticket)
+        return ticket
+
+    def _dequeue(self, model, ticket):
+        waiting = self._state(model).waiting
+        if ticket in waiting:
+            waiting.remove(ticket)
+            heapq.heapify(waiting)
+        self._cond.notify_all()
+
+    def _try_acquire(self, model, ticket):
+        """0 when the call may go now, the seconds to wait when it is next in line, None when it is not."""
+        state = self._state(model)
+        if state.waiting[0] is not ticket:
+            return None
+        now = self.clock()
+        wait = max(state.paused_until - now, state.requests.wait_time(1, now), state.tokens.wait_time(ticket[2], now))
+        if wait > 0:
+            return wait
+        state.requests.take(1, now)
+        state.tokens.take(ticket[2], now)
+        self._dequeue(model, ticket)
+        return 0.0
+
+    def acquire(self, model, tokens=0, priority=NORMAL):
+        started = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(model, tokens, priority)
+            try:
+                while True:
+                    wait = self._try_acquire(model, ticket)
+                    if wait == 0:
+                        break
+                    self._cond.wait(timeout=wait)
+            except BaseException:
+                self._dequeue(model, ticket)
+                raise
+            self.metrics["wait_seconds"] += time.monotonic() - started
+
+    async def aacquire(self, model, tokens=0, priority=NORMAL):
+        # Same queue as acquire(); the event loop is never blocked on the condition, waiters poll instead
+        started = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(model, tokens, priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_acquire(model, ticket)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait, 0.5) if wait is not None else 0.05)
+        except BaseException:
+            with self._cond:
+                self._dequeue(model, ticket)
+            raise
+        with self._cond:
+            self.metrics["wait_seconds"] += time.monotonic() - started
+
+    # --- feedback ------------------------------------------------------------
+
+    def _on_success(self, model, estimated_tokens, response):
+        with self._cond:
+            state = self._state(model)
+            self.metrics["calls"] += 1
+            self.settle(model, estimated_tokens, response)
+            # Additive increase back towards the ceiling
+            if state.requests.per_minute < state.max_rpm:
+                state.requests.set_limit(min(state.max_rpm, state.requests.per_minute + 0.5))
+            if state.tokens.per_minute < state.max_tpm:
+                state.tokens.set_limit(min(state.max_tpm, state.tokens.per_minute * 1.05))
+
+    def settle(self, model, estimated_tokens, response):
+        """
+        Charges the difference between the tokens reserved for a call and what it really used.
+        call() does it with the response; a stream only has the totals in its last chunk, so the
+        caller settles once the stream is done.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", None) if usage else None
+        if actual:
+            with self._cond:
+                self._state(model).tokens.take(actual - estimated_tokens, self.clock())
+
+    def _on_rate_limited(self, model, error, attempt):
+        retry_after, limits = parse_quota_hints(error)
+        with self._cond:
+            state = self._state(model)
+            self.metrics["rate_limited"] += 1
+            if "rpm" in limits:
+                state.max_rpm = min(state.max_rpm, limits["rpm"])
+                state.requests.set_limit(state.max_rpm)
+            if "tpm" in limits:
+                state.max_tpm = min(state.max_tpm, limits["tpm"])
+                state.tokens.set_limit(state.max_tpm)
+            if not limits:
+                # Multiplicative decrease when the server does not say which limit we hit
+                state.requests.set_limit(state.requests.per_minute * 0.7)
+            # The bucket is spent either way
+            state.requests.level = min(state.requests.level, 0.0)
+
+            backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+            if retry_after is not None:
+                # Honour the hint, plus a little jitter so waiting callers do not all return at once
+                delay = retry_after + self.rng() * self.base_delay
+            else:
+                delay = backoff / 2 + self.rng() * backoff / 2
+            state.paused_until = max(state.paused_until, self.clock() + delay)
+            self._cond.notify_all()
+            return delay
+
+    def cooldown(self, model) -> float:
+        """Seconds until the model accepts calls again after a 429 (0 if it is not paused)."""
+        with self._cond:
+            return max(0.0, self._state(model).paused_until - self.clock())
+
+    # --- calls ---------------------------------------------------------------
+
+    def call(self, fn, model, tokens=0, priority=NORMAL):
+        """Runs fn() once budget allows; retries 429s up to max_retries times before re-raising."""
+        attempt = 0
+        while True:
+            self.acquire(model, tokens, priority)
+            try:
+                response = fn()
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= self.max_retries:
+                    raise
+                self._on_rate_limited(model, e, attempt)
+                self.metrics["retries"] += 1
+                attempt += 1
+                continue
+            self._on_success(model, tokens, response)
+            return response
+
+    async def acall(self, fn, model, tokens=0, priority=NORMAL):
+        """Async version of call(); fn() must return an awaitable."""
+        attempt = 0
+        while True:
+            await self.aacquire(model, tokens, priority)
+            try:
+                response = await fn()
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= self.max_retries:
+                    raise
+                self._on_rate_limited(model, e, attempt)
+                self.metrics["retries"] += 1
+                attempt += 1
+                continue
+            self._on_success(model, tokens, response)
+            return response
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_scheduler() -> GeminiScheduler:
+    """The scheduler every Gemini caller in this process shares, so they all see the same quota."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = GeminiScheduler()
+        return _shared
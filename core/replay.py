@@ -0,0 +1,258 @@
+import hashlib
+import json
+import threading
+from collections import defaultdict, deque
+
+from core.validator import CodeValidator
+from tools.browser import normalize_query
+
+
+class ReplayMissError(Exception):
+    """Raised when a replayed run asks for something that was never recorded."""
+
+
+def _model_key(contents):
+    # Orchestrator calls are keyed by the task goal (first message) and replayed in call order
+    first = contents[0] if isinstance(contents, list) else contents
+    text = first.parts[0].text if hasattr(first, "parts") else str(first)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _kind(config):
+    # The orchestrator asks for structured JSON, the validator for plain text
+    return "model" if config is not None and getattr(config, "response_schema", None) else "validator"
+
+
+def _key(kind, contents):
+    return _model_key(contents) if kind == "model" else _text_key(str(contents))
+
+
+class ReplayResponse:
+    """Just enough of a genai response for the Orchestrator and CodeValidator."""
+
+    def __init__(self, text, schema=None):
+        self.text = text
+        self.parsed = schema.model_validate_json(text) if schema is not None and text else None
+        self.usage_metadata = None
+
+
+class ReplayHTTPResponse:
+    """Just enough of a requests/httpx response for WebBrowser."""
+
+    def __init__(self, data):
+        self._data = data
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+class Fixture:
+    """
+    One JSONL file of recorded calls: {"kind": ..., "key": ..., "response": ...} per line.
+    A {"kind": "task", "task": ...} line names the task the recording belongs to.
+    Hand-written fixtures may give the readable source of the key instead:
+    "task" for model turns, "code" for validator verdicts, "query" for searches.
+    """
+
+    def __init__(self, path, mode="r"):
+        self.path = path
+        self.tasks = []
+        self._responses = defaultdict(deque)
+        self._lock = threading.Lock()
+        self.misses = 0
+        if mode == "r":
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry["kind"] == "task":
+                        self.tasks.append(entry["task"])
+                    else:
+                        self._responses[(entry["kind"], self._entry_key(entry))].append(entry["response"])
+        else:
+            # Recording always starts a fresh file
+            open(path, "w", encoding="utf-8").close()
+
+    @staticmethod
+    def _entry_key(entry):
+        if "key" in entry:
+            return entry["key"]
+        if entry["kind"] == "model":
+            return _text_key(entry["task"])
+        if entry["kind"] == "validator":
+            return _text_key(CodeValidator.review_prompt(entry["code"]))
+        return normalize_query(entry["query"])
+
+    def record(self, kind, key, response):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"kind": kind, "key": key, "response": response}) + "\n")
+
+    def record_task(self, task):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"kind": "task", "task": task}) + "\n")
+
+    def next(self, kind, key):
+        with self._lock:
+            queue = self._responses.get((kind, key))
+            if not queue:
+                self.misses += 1
+                raise ReplayMissError(f"No recorded {kind} response for key {key}")
+            # Validator verdicts and search results are reusable; model turns are consumed in order
+            return queue.popleft() if kind == "model" or len(queue) > 1 else queue[0]
+
+
+# --- genai client stand-ins -------------------------------------------------
+
+# Replayed responses are streamed in pieces of about this many characters
+STREAM_CHUNK_CHARS = 32
+
+
+class _ReplayModels:
+    def __init__(self, fixture):
+        self._fixture = fixture
+
+    def generate_content(self, *, model, contents, config=None):
+        kind = _kind(config)
+        text = self._fixture.next(kind, _key(kind, contents))
+        return ReplayResponse(text, getattr(config, "response_schema", None))
+
+    def _chunks(self, contents, config):
+        text = self._fixture.next(_kind(config), _key(_kind(config), contents))
+        return [ReplayResponse(text[i:i + STREAM_CHUNK_CHARS]) for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        return iter(self._chunks(contents, config))
+
+
+class _AsyncReplayModels(_ReplayModels):
+    async def generate_content(self, *, model, contents, config=None):
+        return _ReplayModels.generate_content(self, model=model, contents=contents, config=config)
+
+    async def generate_content_stream(self, *, model, contents, config=None):
+        chunks = self._chunks(contents, config)
+
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+
+        return stream()
+
+
+class _RecordingModels:
+    def __init__(self, models, fixture):
+        self._models = models
+        self._fixture = fixture
+
+    def generate_content(self, *, model, contents, config=None):
+        response = self._models.generate_content(model=model, contents=contents, config=config)
+        kind = _kind(config)
+        self._fixture.record(kind, _key(kind, contents), response.text)
+        return response
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        # Recorded as one response once the stream is done, so replays can stream or not
+        text = []
+        for chunk in self._models.generate_content_stream(model=model, contents=contents, config=config):
+            text.append(chunk.text or "")
+            yield chunk
+        kind = _kind(config)
+        self._fixture.record(kind, _key(kind, contents), "".join(text))
+
+
+class _AsyncRecordingModels(_RecordingModels):
+    async def generate_content(self, *, model, contents, config=None):
+        response = await self._models.generate_content(model=model, contents=contents, config=config)
+        kind = _kind(config)
+        self._fixture.record(kind, _key(kind, contents), response.text)
+        return response
+
+    async def generate_content_stream(self, *, model, contents, config=None):
+        chunks = await self._models.generate_content_stream(model=model, contents=contents, config=config)
+
+        async def stream():
+            text = []
+            async for chunk in chunks:
+                text.append(chunk.text or "")
+                yield chunk
+            kind = _kind(config)
+            self._fixture.record(kind, _key(kind, contents), "".join(text))
+
+        return stream()
+
+
+class _Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def replay_client(fixture):
+    """Drop-in for genai.Client that answers from a fixture, for ProjectOrchestrator(client=...) and CodeValidator(client=...)."""
+    return _Namespace(models=_ReplayModels(fixture), aio=_Namespace(models=_AsyncReplayModels(fixture)))
+
+
+def recording_client(client, fixture):
+    """Wraps a real genai.Client and records every response into the fixture."""
+    return _Namespace(
+        models=_RecordingModels(client.models, fixture),
+        aio=_Namespace(models=_AsyncRecordingModels(client.aio.models, fixture)),
+    )
+
+
+# --- HTTP stand-ins for WebBrowser ------------------------------------------
+
+def _search_key(payload):
+    return normalize_query(payload["q"])
+
+
+class ReplaySession:
+    """Drop-in for requests.Session in WebBrowser(session=...)."""
+
+    def __init__(self, fixture):
+        self._fixture = fixture
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        return ReplayHTTPResponse(self._fixture.next("search", _search_key(json)))
+
+
+class AsyncReplaySession(ReplaySession):
+    """Drop-in for httpx.AsyncClient in WebBrowser(async_client=...)."""
+
+    async def post(self, url, headers=None, json=None, timeout=None):
+        return ReplaySession.post(self, url, headers=headers, json=json)
+
+    async def aclose(self):
+        pass
+
+
+class RecordingSession:
+    def __init__(self, session, fixture):
+        self._session = session
+        self._fixture = fixture
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        response = self._session.post(url, headers=headers, json=json, timeout=timeout)
+        if response.status_code == 200:
+            self._fixture.record("search", _search_key(json), response.json())
+        return response
+
+
+class AsyncRecordingSession(RecordingSession):
+    async def post(self, url, headers=None, json=None, timeout=None):
+        response = await self._session.post(url, headers=headers, json=json)
+        if response.status_code == 200:
+            self._fixture.record("search", _search_key(json), response.json())
+        return response
+
+    async def aclose(self):
+        await self._session.aclose()
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from tools.worker_pool import WorkersBusy
+
+
+def is_speculable(file_name, code, validator) -> bool:
+    """
+    Scripts that may run before the model asks for it: Python files whose exact content the
+    validator's model approved. The static screen's SAFE alone is not enough, since then nothing
+    but the local AST pass would stand between a WRITE_FILE and running the code. Validators
+    without approved_by_model (test doubles) never allow it.
+    """
+    approved = getattr(validator, "approved_by_model", None)
+    return bool(file_name) and file_name.endswith(".py") and approved is not None and approved(code or "")
+
+
+class _Run:
+    def __init__(self, digest, artifact_dir):
+        self.digest = digest
+        self.started = time.perf_counter()
+        self.finished = None
+        self.chunks = []
+        self.future = None
+        self.cancel = threading.Event()
+        # Output over the caps is spilled here until the run is claimed
+        self.artifact_dir = artifact_dir
+        self.staging_dir = os.path.join(tempfile.gettempdir(), f"overlord-speculate-{uuid.uuid4().hex}")
+
+    def on_output(self, stream, text):
+        self.chunks.append((stream, text))
+
+    def ended(self):
+        """Called by the run itself when it stops: a run dropped meanwhile cleans up after itself."""
+        self.finished = time.perf_counter()
+        if self.cancel.is_set():
+            self.discard()
+
+    def stop(self):
+        """Drops the run: kills the process (or worker) and deletes any spilled output."""
+        self.cancel.set()
+        if self.finished is not None:
+            self.discard()
+
+    def discard(self):
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def publish(self):
+        """The result is used: spilled output moves to the artifacts directory its text points at."""
+        names = os.listdir(self.staging_dir) if os.path.isdir(self.staging_dir) else []
+        if names:
+            os.makedirs(self.artifact_dir, exist_ok=True)
+        for name in names:
+            shutil.move(os.path.join(self.staging_dir, name), os.path.join(self.artifact_dir, name))
+        self.discard()
+
+
+class SpeculativeRunner:
+    """
+    Runs a freshly written script in the background right after the write, while the agent
+    waits for its next model call. When the model then asks for RUN_CODE on that file and the
+    file still has the same content, the finished (or still running) result is used instead of
+    starting over; otherwise it is dropped. metrics["seconds_saved"] is the run time the agent
+    did not have to wait for. Dropped runs are killed and leave no artifacts behind, and a run
+    only starts when a warm worker is free (with warm workers on), so it never makes a real
+    RUN_CODE queue behind it.
+    """
+
+    def __init__(self, shell, files, validator=None):
+        self.shell = shell
+        self.files = files
+        # Decides which scripts may run early, see is_speculable
+        self.validator = validator
+        self.metrics = {"started": 0, "used": 0, "discarded": 0, "busy": 0, "seconds_saved": 0.0}
+        self._runs = {}
+        # Every run still going, claimed or dropped; aclose waits for them
+        self._live = set()
+        self._lock = threading.Lock()
+
+    def _register(self, file_name, run):
+        with self._lock:
+            self._drop(file_name)
+            self._runs[file_name] = run
+            self.metrics["started"] += 1
+
+    def _new_run(self, file_name):
+        return _Run(self.files.content_hash(file_name), os.path.join(self.shell.workspace_dir, "artifacts"))
+
+    def astart(self, file_name, code):
+        """
+        Starts a run of file_name (just written with `code`) if it is safe to run it early.
+        The run is a task on the running loop; it inherits the caller's tracing scope.
+        """
+        if not is_speculable(file_name, code, self.validator):
+            return
+        run = self._new_run(file_name)
+
+        async def execute():
+            try:
+                return await self.shell.aexecute_python(file_name, on_output=run.on_output, cancel=run.cancel,
+                                                        staging_dir=run.staging_dir, wait_for_worker=False)
+            except WorkersBusy:
+                return None
+            finally:
+                run.ended()
+
+        run.future = asyncio.ensure_future(execute())
+        self._live.add(run.future)
+        run.future.add_done_callback(self._live.discard)
+        self._register(file_name, run)
+
+    def _drop(self, file_name):
+        run = self._runs.pop(file_name, None)
+        if run is not None:
+            run.stop()
+            self.metrics["discarded"] += 1
+
+    def _claim(self, file_name):
+        with self._lock:
+            run = self._runs.pop(file_name, None)
+            if run is None:
+                return None
+            if run.digest is None or run.digest != self.files.content_hash(file_name):
+                # The file changed since the run started (or the run started on a missing file)
+                run.stop()
+                self.metrics["discarded"] += 1
+                return None
+            return run
+
+    def _settle(self, run, result, claimed_at, on_output):
+        if result is None:
+            # No warm worker was free when it started: RUN_CODE runs it the usual way
+            run.discard()
+            self.metrics["busy"] += 1
+            return None
+        run.publish()
+        duration = run.finished - run.started
+        # Without speculation the run would have started when it was asked for
+        self.metrics["seconds_saved"] += duration - max(0.0, run.finished - claimed_at)
+        self.metrics["used"] += 1
+        if on_output:
+            for stream, text in run.chunks:
+                on_output(stream, text)
+        return result
+
+    async def atake(self, file_name, on_output=None):
+        """The speculative result for RUN_CODE on file_name, or None if there is none to use."""
+        run = self._claim(file_name)
+        if run is None:
+            return None
+        claimed_at = time.perf_counter()
+        result = await run.future
+        return self._settle(run, result, claimed_at, on_output)
+
+    def invalidate(self, file_name=None):
+        """Drops the pending run of one file, or all of them (e.g. when the task ends)."""
+        with self._lock:
+            for name in [file_name] if file_name else list(self._runs):
+                self._drop(name)
+
+    def close(self):
+        self.invalidate()
+
+    async def aclose(self):
+        """close() that also waits for the dropped runs to be killed, before their loop goes away."""
+        self.close()
+        await asyncio.gather(*self._live, return_exceptions=True)
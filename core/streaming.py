@@ -0,0 +1,203 @@
+import json
+import re
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+# Everything up to the next quote or backslash is copied into a string in one go
+_STRING_RUN = re.compile(r'[^"\\]+')
+_LITERAL_CHARS = frozenset("0123456789+-.eEtrufalsn")
+_WHITESPACE = frozenset(" \t\r\n")
+
+# Parser states
+_VALUE, _FIRST_VALUE, _KEY, _FIRST_KEY, _COLON, _AFTER, _STRING, _ESCAPE, _UNICODE, _LITERAL = range(10)
+
+
+class JSONStreamError(ValueError):
+    """The text is not valid JSON."""
+
+
+class IncrementalJSONParser:
+    """
+    Parses one JSON document that arrives in pieces (a streamed model response) and reports
+    progress while it does: on_string(path, text) with the text of a string value received so
+    far (once per feed, while the string is still open), and on_value(path, value) as soon as any
+    value is complete. path is the tuple of keys and list indexes from the root, e.g.
+    ("actions", 0, "tool"). string_paths limits on_string to those paths (partial text is
+    rebuilt on every feed, which adds up for long code strings nobody displays).
+    After the closing brace, done is True and value holds the document.
+    """
+
+    def __init__(self, on_string=None, on_value=None, string_paths=None):
+        self.on_string = on_string
+        self.on_value = on_value
+        self.string_paths = set(string_paths) if string_paths is not None else None
+        self.done = False
+        self.value = None
+        # One [container, key] per open object or array; key is the pending key of an object
+        self._stack = []
+        self._state = _VALUE
+        self._chars = []
+        self._is_key = False
+        self._hex = ""
+        self._surrogates = False
+        self._literal = ""
+
+    def _path(self):
+        return tuple(key if isinstance(container, dict) else len(container) for container, key in self._stack)
+
+    def _complete(self, value):
+        if not self._stack:
+            self.done = True
+            self.value = value
+            self._state = _AFTER
+            if self.on_value:
+                self.on_value((), value)
+            return
+        path = self._path()
+        container, key = self._stack[-1]
+        if isinstance(container, dict):
+            container[key] = value
+        else:
+            container.append(value)
+        self._state = _AFTER
+        if self.on_value:
+            self.on_value(path, value)
+
+    def _string_text(self):
+        text = "".join(self._chars)
+        if self._surrogates:
+            # \uXXXX surrogate pairs were decoded one half at a time
+            text = text.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+        return text
+
+    def _end_string(self):
+        text = self._string_text()
+        self._chars = []
+        self._surrogates = False
+        if self._is_key:
+            self._stack[-1][1] = text
+            self._state = _COLON
+        else:
+            self._complete(text)
+
+    def _end_literal(self):
+        try:
+            value = json.loads(self._literal)
+        except ValueError:
+            raise JSONStreamError(f"Invalid literal {self._literal!r}") from None
+        self._literal = ""
+        self._complete(value)
+
+    def _close(self, char):
+        if not self._stack:
+            raise JSONStreamError(f"Unexpected {char!r}")
+        container, _ = self._stack.pop()
+        if isinstance(container, dict) != (char == "}"):
+            raise JSONStreamError(f"Mismatched {char!r}")
+        self._complete(container)
+
+    def feed(self, text):
+        i, n = 0, len(text)
+        while i < n:
+            state = self._state
+            char = text[i]
+
+            if state == _STRING:
+                run = _STRING_RUN.match(text, i)
+                if run:
+                    self._chars.append(run.group())
+                    i = run.end()
+                    continue
+                if char == '"':
+                    self._end_string()
+                else:
+                    self._state = _ESCAPE
+                i += 1
+                continue
+
+            if state == _ESCAPE:
+                if char == "u":
+                    self._hex = ""
+                    self._state = _UNICODE
+                elif char in _ESCAPES:
+                    self._chars.append(_ESCAPES[char])
+                    self._state = _STRING
+                else:
+                    raise JSONStreamError(f"Invalid escape \\{char}")
+                i += 1
+                continue
+
+            if state == _UNICODE:
+                self._hex += char
+                if len(self._hex) == 4:
+                    code = int(self._hex, 16)
+                    self._surrogates = self._surrogates or 0xD800 <= code <= 0xDFFF
+                    self._chars.append(chr(code))
+                    self._state = _STRING
+                i += 1
+                continue
+
+            if state == _LITERAL:
+                if char in _LITERAL_CHARS:
+                    self._literal += char
+                    i += 1
+                else:
+                    # The character after the literal is read again in the _AFTER state
+                    self._end_literal()
+                continue
+
+            if char in _WHITESPACE:
+                i += 1
+                continue
+
+            if state in (_VALUE, _FIRST_VALUE):
+                if self.done:
+                    raise JSONStreamError("Data after the end of the document")
+                if char == "]" and state == _FIRST_VALUE:
+                    self._close(char)
+                elif char == "{":
+                    self._stack.append([{}, None])
+                    self._state = _FIRST_KEY
+                elif char == "[":
+                    self._stack.append([[], None])
+                    self._state = _FIRST_VALUE
+                elif char == '"':
+                    self._is_key = False
+                    self._state = _STRING
+                elif char in _LITERAL_CHARS:
+                    self._literal = char
+                    self._state = _LITERAL
+                else:
+                    raise JSONStreamError(f"Unexpected {char!r}")
+            elif state in (_KEY, _FIRST_KEY):
+                if char == "}" and state == _FIRST_KEY:
+                    self._close(char)
+                elif char == '"':
+                    self._is_key = True
+                    self._state = _STRING
+                else:
+                    raise JSONStreamError(f"Expected a key, got {char!r}")
+            elif state == _COLON:
+                if char != ":":
+                    raise JSONStreamError(f"Expected ':', got {char!r}")
+                self._state = _VALUE
+            else:  # _AFTER
+                if char in "}]":
+                    self._close(char)
+                elif char == "," and self._stack:
+                    self._state = _KEY if isinstance(self._stack[-1][0], dict) else _VALUE
+                else:
+                    raise JSONStreamError(f"Unexpected {char!r}")
+            i += 1
+
+        if self.on_string and self._state in (_STRING, _ESCAPE, _UNICODE) and not self._is_key:
+            path = self._path()
+            if self.string_paths is None or path in self.string_paths:
+                self.on_string(path, self._string_text())
+
+    def close(self):
+        """Call at the end of the stream: a top-level number is only complete once nothing follows."""
+        if self._state == _LITERAL and not self._stack:
+            self._end_literal()
+        if not self.done:
+            raise JSONStreamError("Incomplete JSON document")
+        return self.value
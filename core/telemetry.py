@@ -0,0 +1,317 @@
+import asyncio
+import contextvars
+import functools
+import math
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Innermost open span and the (task, step) it belongs to; asyncio tasks and copied contexts get their own
+_current_span = contextvars.ContextVar("overlord_span", default=None)
+_current_scope = contextvars.ContextVar("overlord_scope", default=None)
+
+
+class Span:
+    __slots__ = ("name", "detail", "task", "step", "start", "duration", "prompt_tokens", "output_tokens", "status")
+
+    def __init__(self, name, detail, task, step):
+        self.name = name
+        self.detail = detail
+        self.task = task
+        self.step = step
+        self.start = time.time()
+        self.duration = 0.0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.status = "ok"
+
+
+def record_usage(response):
+    """Adds a genai response's token counts to the span that is currently open, if any."""
+    span = _current_span.get()
+    usage = getattr(response, "usage_metadata", None)
+    if span is None or usage is None:
+        return
+    span.prompt_tokens += usage.prompt_token_count or 0
+    # Thinking tokens are billed as output
+    span.output_tokens += (usage.candidates_token_count or 0) + (getattr(usage, "thoughts_token_count", None) or 0)
+
+
+class Tracer:
+    """
+    Records timed spans (model, validate, search, execute, memory...) into a `spans` table
+    next to TaskMemory's `logs`. Spans are buffered and written in batches, so tracing a call
+    costs a few microseconds. on_span(span) is called after every span, e.g. to refresh a live panel.
+    """
+
+    def __init__(self, db_path="overlord_memory.db", session_id="default", batch_size=64, on_span=None):
+        self.db_path = db_path
+        self.session_id = session_id
+        self.batch_size = batch_size
+        self.on_span = on_span
+        self.recent = deque(maxlen=8)
+        self.totals = defaultdict(lambda: {"count": 0, "seconds": 0.0, "prompt_tokens": 0, "output_tokens": 0})
+        self._scope = ("", 0)
+        self._pending = []
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute('''
+                              CREATE TABLE IF NOT EXISTS spans
+                              (
+                                  id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                                  session_id    TEXT,
+                                  task          TEXT,
+                                  step          INTEGER,
+                                  name          TEXT,
+                                  detail        TEXT,
+                                  started_at    REAL,
+                                  duration_ms   REAL,
+                                  prompt_tokens INTEGER,
+                                  output_tokens INTEGER,
+                                  status        TEXT
+                              )
+                              ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_session ON spans (session_id, id)")
+            self.conn.commit()
+
+    def set_scope(self, task=None, step=None):
+        """
+        Tags the spans that follow with a task and step. Inside asyncio tasks the scope is per task;
+        threads that were not started from a copied context fall back to the last scope set.
+        """
+        current_task, current_step = _current_scope.get() or self._scope
+        scope = (current_task if task is None else task, current_step if step is None else step)
+        self._scope = scope
+        _current_scope.set(scope)
+
+    @contextmanager
+    def span(self, name, detail=None):
+        task, step = _current_scope.get() or self._scope
+        span = Span(name, detail, task, step)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            span.status = "error"
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self._finish(span)
+
+    def _finish(self, span):
+        with self._lock:
+            totals = self.totals[span.name]
+            totals["count"] += 1
+            totals["seconds"] += span.duration
+            totals["prompt_tokens"] += span.prompt_tokens
+            totals["output_tokens"] += span.output_tokens
+            self.recent.append(span)
+            self._pending.append((
+                self.session_id, span.task[:200], span.step, span.name, span.detail, span.start,
+                span.duration * 1000, span.prompt_tokens, span.output_tokens, span.status
+            ))
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+        if self.on_span:
+            self.on_span(span)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO spans (session_id, task, step, name, detail, started_at, duration_ms, "
+                "prompt_tokens, output_tokens, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pending
+            )
+        self._pending = []
+
+    @staticmethod
+    def _nested(name):
+        # e.g. aexecute_python handing off to execute_python: one call, one span
+        span = _current_span.get()
+        return span is not None and span.name == name
+
+    def instrument(self, obj, method, name, detail=None):
+        """
+        Replaces obj.method with a traced version. detail(args) may pick a label out of the call's
+        arguments (a file name, a query...).
+        """
+        original = getattr(obj, method)
+
+        if asyncio.iscoroutinefunction(original):
+            @functools.wraps(original)
+            async def traced(*args, **kwargs):
+                if self._nested(name):
+                    return await original(*args, **kwargs)
+                with self.span(name, detail(args) if detail else None):
+                    return await original(*args, **kwargs)
+        else:
+            @functools.wraps(original)
+            def traced(*args, **kwargs):
+                if self._nested(name):
+                    return original(*args, **kwargs)
+                with self.span(name, detail(args) if detail else None):
+                    return original(*args, **kwargs)
+
+        setattr(obj, method, traced)
+
+    def instrument_agent(self, orchestrator=None, validator=None, browser=None, shell=None, memory=None):
+        """Traces the calls the agent loop spends its time in, on whichever components are given."""
+        label = lambda args: str(args[0])[:80] if args else None
+        if orchestrator is not None:
+            for method in ("get_next_action", "aget_next_action", "get_next_step", "aget_next_step",
+                           "get_next_step_streaming", "aget_next_step_streaming"):
+                self.instrument(orchestrator, method, "model")
+        if validator is not None:
+            self.instrument(validator, "validate_code", "validate")
+            self.instrument(validator, "avalidate_code", "validate")
+            self.instrument(validator, "validate_change", "validate")
+            self.instrument(validator, "avalidate_change", "validate")
+        if browser is not None:
+            # search_many/asearch_many fan out to these, so each query gets its own span
+            self.instrument(browser, "search", "search", label)
+            self.instrument(browser, "asearch", "search", label)
+        if shell is not None:
+            self.instrument(shell, "execute_python", "execute", label)
+            self.instrument(shell, "aexecute_python", "execute", label)
+            self.instrument(shell, "install_package", "install", label)
+            self.instrument(shell, "ainstall_package", "install", label)
+        if memory is not None:
+            for method in ("get_summarized_history", "add_event", "flush"):
+                self.instrument(memory, method, "memory", lambda args, m=method: m)
+
+    def render_panel(self):
+        """A Rich renderable with running totals per stage and the latest spans."""
+        from rich.console import Group
+        from rich.panel import Panel
+        from rich.table import Table
+
+        table = Table(expand=True, box=None, padding=(0, 1))
+        for column in ("stage", "calls", "total", "avg", "tokens in/out"):
+            table.add_column(column, justify="left" if column == "stage" else "right")
+        with self._lock:
+            totals = sorted(self.totals.items(), key=lambda item: -item[1]["seconds"])
+            recent = list(self.recent)
+        for name, t in totals:
+            table.add_row(name, str(t["count"]), f"{t['seconds']:.2f}s", f"{t['seconds'] / t['count'] * 1000:.0f}ms",
+                          f"{t['prompt_tokens']}/{t['output_tokens']}")
+        lines = "\n".join(
+            f"[dim]step {s.step}[/dim] {s.name} {s.duration * 1000:.0f}ms {s.detail or ''}".rstrip() for s in recent
+        )
+        return Panel(Group(table, lines), title="Telemetry", border_style="cyan")
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self.conn.close()
+
+
+def _percentile(values, pct):
+    # Nearest-rank, so p95 of a handful of spans is still an observed value
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct * len(ordered) / 100) - 1)]
+
+
+def load_spans(db_path="overlord_memory.db", session_id=None, last_tasks=None):
+    """Reads spans back as dicts, optionally for one session and/or only the most recent tasks."""
+    conn = sqlite3.connect(db_path)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='spans'").fetchone():
+            return []
+        sql = "SELECT session_id, task, step, name, detail, started_at, duration_ms, prompt_tokens, output_tokens, status FROM spans"
+        params = ()
+        if session_id:
+            sql += " WHERE session_id = ?"
+            params = (session_id,)
+        rows = conn.execute(sql + " ORDER BY id ASC", params).fetchall()
+    finally:
+        conn.close()
+    keys = ("session_id", "task", "step", "name", "detail", "started_at", "duration_ms", "prompt_tokens", "output_tokens", "status")
+    spans = [dict(zip(keys, row)) for row in rows]
+    if last_tasks:
+        tasks = list(dict.fromkeys((s["session_id"], s["task"]) for s in spans))[-last_tasks:]
+        spans = [s for s in spans if (s["session_id"], s["task"]) in set(tasks)]
+    return spans
+
+
+def summarize_spans(spans):
+    """Per-task and per-stage latency percentiles and token spend."""
+    by_stage = defaultdict(list)
+    by_task = defaultdict(list)
+    for s in spans:
+        by_stage[s["name"]].append(s)
+        by_task[(s["session_id"], s["task"])].append(s)
+
+    stages = []
+    for name, group in sorted(by_stage.items()):
+        durations = [s["duration_ms"] for s in group]
+        stages.append({
+            "stage": name, "calls": len(group),
+            "p50_ms": _percentile(durations, 50), "p95_ms": _percentile(durations, 95),
+            "total_ms": sum(durations), "errors": sum(s["status"] != "ok" for s in group),
+            "prompt_tokens": sum(s["prompt_tokens"] for s in group),
+            "output_tokens": sum(s["output_tokens"] for s in group),
+        })
+
+    tasks = []
+    for (session_id, task), group in by_task.items():
+        model = [s["duration_ms"] for s in group if s["name"] == "model"]
+        steps = [s["step"] for s in group if s["name"] == "model"]
+        # Wall time, not the sum of spans: parallel actions overlap
+        wall = max(s["started_at"] * 1000 + s["duration_ms"] for s in group) - min(s["started_at"] for s in group) * 1000
+        tasks.append({
+            "session_id": session_id, "task": task, "steps": max(steps) if steps else 0,
+            "wall_ms": wall, "model_calls": len(model),
+            "model_p50_ms": _percentile(model, 50) if model else 0.0,
+            "model_p95_ms": _percentile(model, 95) if model else 0.0,
+            "prompt_tokens": sum(s["prompt_tokens"] for s in group),
+            "output_tokens": sum(s["output_tokens"] for s in group),
+        })
+    return {"stages": stages, "tasks": tasks}
+
+
+def print_report(db_path="overlord_memory.db", session_id=None, last_tasks=None, console=None):
+    from rich.console import Console
+    from rich.table import Table
+
+    console = console or Console()
+    spans = load_spans(db_path, session_id, last_tasks)
+    if not spans:
+        console.print(f"[yellow]No telemetry recorded in {db_path}.[/yellow]")
+        return
+    summary = summarize_spans(spans)
+
+    tasks = Table(title="Per task (p50/p95 of model calls)")
+    tasks.add_column("task", no_wrap=True, max_width=30, overflow="ellipsis")
+    for column in ("steps", "wall", "calls", "p50", "p95", "tok in", "tok out"):
+        tasks.add_column(column, justify="right")
+    for t in summary["tasks"]:
+        tasks.add_row(
+            t["task"] or t["session_id"], str(t["steps"]), f"{t['wall_ms'] / 1000:.1f}s", str(t["model_calls"]),
+            f"{t['model_p50_ms']:.0f}ms", f"{t['model_p95_ms']:.0f}ms", str(t["prompt_tokens"]), str(t["output_tokens"])
+        )
+
+    stages = Table(title="Per stage")
+    for column in ("stage", "calls", "p50", "p95", "total", "errors", "tok in", "tok out"):
+        stages.add_column(column, justify="left" if column == "stage" else "right")
+    for s in summary["stages"]:
+        stages.add_row(
+            s["stage"], str(s["calls"]), f"{s['p50_ms']:.1f}ms", f"{s['p95_ms']:.1f}ms", f"{s['total_ms'] / 1000:.2f}s",
+            str(s["errors"]), str(s["prompt_tokens"]), str(s["output_tokens"])
+        )
+
+    console.print(tasks)
+    console.print(stages)
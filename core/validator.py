@@ -1,16 +1,288 @@
-import os
-from google import genai
-from google.genai import types
-import streamlit as st
+import ast
+import hashlib
+import importlib
+import sqlite3
+import string
+import threading
+from collections import OrderedDict
+from types import ModuleType
 
-class CodeValidator:
+from core.clients import SharedClient, gemini_api_key
+from core.context import estimate_tokens
+from core.rate_limiter import URGENT, get_scheduler
+from core.telemetry import record_usage
+from tools.patch import change_excerpt
+
+# Calls the auditor prompt treats as dangerous, matched on their fully-qualified name
+DANGEROUS_CALLS = {
+    "os.remove": "deletes files (os.remove)",
+    "os.unlink": "deletes files (os.unlink)",
+    "os.rmdir": "deletes directories (os.rmdir)",
+    "os.removedirs": "deletes directories (os.removedirs)",
+    "shutil.rmtree": "deletes directory trees (shutil.rmtree)",
+    "os.system": "runs shell commands (os.system)",
+    "os.getenv": "reads environment variables (os.getenv)",
+}
+SENSITIVE_ATTRIBUTES = {
+    "os.environ": "accesses environment variables (os.environ)",
+}
+
+# Code that only touches these modules and none of the risky builtins needs no audit
+SAFE_MODULES = {
+    "math", "cmath", "random", "statistics", "decimal", "fractions", "numbers",
+    "itertools", "functools", "collections", "heapq", "bisect", "array",
+    "string", "re", "textwrap", "json", "datetime", "calendar", "time",
+    "dataclasses", "enum", "copy", "pprint",
+}
+RISKY_BUILTINS = {
+    "open", "exec", "eval", "compile", "__import__", "getattr", "setattr", "delattr",
+    "globals", "locals", "vars", "input", "breakpoint", "memoryview",
+    "__builtins__", "builtins", "sys",
+}
+EXIT_CALLS = {"exit", "quit", "sys.exit", "os._exit"}
+# Iterators that never run out unless the loop breaks
+ENDLESS_ITERATORS = {"itertools.count", "itertools.cycle", "itertools.repeat"}
+# str.format and friends resolve '{0.attr}' and '{0[key]}' themselves, out of the AST's sight
+FORMAT_METHODS = {"format", "format_map", "vformat"}
+# Functions that look up attributes or evaluate code from strings, matched on the last name part
+INTROSPECTION_NAMES = {"get_type_hints", "attrgetter", "methodcaller", "get_field", "vformat", "format_map"}
+
+
+def _reaches_other_module(name):
+    """
+    True when a dotted name on a safe module leads to another module: 'random._os' or 'typing.sys'
+    hand out os and sys. Submodules of the same package ('collections.abc') are fine.
+    """
+    parts = name.split(".")
+    if parts[0] not in SAFE_MODULES:
+        return False
+    obj = importlib.import_module(parts[0])
+    for attr in parts[1:]:
+        obj = getattr(obj, attr, None)
+        if obj is None:
+            return False
+        if isinstance(obj, ModuleType) and obj.__name__.split(".")[0] != parts[0]:
+            return True
+    return False
+
+
+def _plain_format_string(node):
+    """True for a constant format string whose fields only name or number arguments: no '.', '[' or dunders."""
+    if not (isinstance(node, ast.Constant) and isinstance(node.value, str)):
+        return False
+    pending = [node.value]
+    while pending:
+        try:
+            fields = list(string.Formatter().parse(pending.pop()))
+        except ValueError:
+            return False
+        for _, field_name, format_spec, _ in fields:
+            if field_name and ("." in field_name or "[" in field_name or "__" in field_name):
+                return False
+            # '{0:{1.x}}' nests fields inside the spec
+            if format_spec:
+                pending.append(format_spec)
+    return True
+
+
+class _SafetyVisitor(ast.NodeVisitor):
     def __init__(self):
-        api_key = st.secrets.get("GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY")
+        self.aliases = {}
+        self.unsafe_reason = None
+        self.trivially_safe = True
+
+    def _qualified(self, node):
+        # Resolves 'shutil.rmtree', 'sh.rmtree' (import shutil as sh) and 'rmtree' (from shutil import rmtree)
+        if isinstance(node, ast.Name):
+            return self.aliases.get(node.id, node.id)
+        if isinstance(node, ast.Attribute):
+            base = self._qualified(node.value)
+            return f"{base}.{node.attr}" if base else None
+        return None
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            root = alias.name.split(".")[0]
+            # 'import os.path' binds 'os', 'import os.path as p' binds 'p' to os.path
+            self.aliases[alias.asname or root] = alias.name if alias.asname else root
+            if root not in SAFE_MODULES:
+                self.trivially_safe = False
+
+    def visit_ImportFrom(self, node):
+        module = node.module or ""
+        for alias in node.names:
+            self.aliases[alias.asname or alias.name] = f"{module}.{alias.name}"
+            if alias.name.startswith("_") or _reaches_other_module(f"{module}.{alias.name}"):
+                self.trivially_safe = False
+        if node.level or module.split(".")[0] not in SAFE_MODULES:
+            self.trivially_safe = False
+
+    def visit_Call(self, node):
+        name = self._qualified(node.func)
+        if name in DANGEROUS_CALLS and not self.unsafe_reason:
+            self.unsafe_reason = DANGEROUS_CALLS[name]
+        if name in RISKY_BUILTINS or name in ENDLESS_ITERATORS:
+            self.trivially_safe = False
+        self.generic_visit(node)
+
+    def visit_Constant(self, node):
+        # '__class__', '__globals__'... in a string are attribute paths waiting for a lookup
+        # ('__main__' of the usual entry-point guard leads nowhere)
+        value = node.value
+        if isinstance(value, bytes):
+            value = value.decode("latin-1")
+        if isinstance(value, str) and "__" in value and value != "__main__":
+            self.trivially_safe = False
+
+    def visit_Attribute(self, node):
+        name = self._qualified(node)
+        if name in SENSITIVE_ATTRIBUTES and not self.unsafe_reason:
+            self.unsafe_reason = SENSITIVE_ATTRIBUTES[name]
+        # Private attributes ('random._os') and modules re-exported by a safe one ('typing.sys') lead out of it
+        if node.attr.startswith("_") or (name and _reaches_other_module(name)):
+            self.trivially_safe = False
+        # '"{0.__globals__}".format(f)' walks attributes without a single Attribute node
+        if node.attr in FORMAT_METHODS and not _plain_format_string(node.value):
+            self.trivially_safe = False
+        if node.attr in INTROSPECTION_NAMES:
+            self.trivially_safe = False
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        name = self.aliases.get(node.id)
+        if name in SENSITIVE_ATTRIBUTES and not self.unsafe_reason:
+            self.unsafe_reason = SENSITIVE_ATTRIBUTES[name]
+        if node.id in RISKY_BUILTINS or (name or node.id).split(".")[-1] in INTROSPECTION_NAMES:
+            self.trivially_safe = False
+
+    def visit_While(self, node):
+        if not _has_own_break(node):
+            # 'while not False' or 'while flag' can spin just as well; only a literal is certain
+            self.trivially_safe = False
+            if isinstance(node.test, ast.Constant) and node.test.value and not self.unsafe_reason:
+                self.unsafe_reason = "infinite loop (while True without break)"
+        self.generic_visit(node)
+
+
+def _has_own_break(loop):
+    # A break inside a nested loop does not end this one; return/raise/exit do, and a yield hands
+    # control back to the consumer (an endless generator is fine with islice or next)
+    stack = list(loop.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.Break, ast.Return, ast.Raise, ast.Yield, ast.YieldFrom)):
+            return True
+        if isinstance(node, ast.Call) and ast.unparse(node.func) in EXIT_CALLS:
+            return True
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            continue
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            # Only the else branch of a nested loop belongs to the outer loop; a yield anywhere in it still counts
+            stack.extend(node.orelse)
+            if any(isinstance(n, (ast.Yield, ast.YieldFrom)) for n in _own_nodes(node.body)):
+                return True
+            continue
+        stack.extend(ast.iter_child_nodes(node))
+    return False
+
+
+def _own_nodes(body):
+    """Nodes of body, not descending into nested functions, classes or lambdas."""
+    stack = list(body)
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            stack.extend(ast.iter_child_nodes(node))
+
+
+def static_screen(code: str):
+    """
+    Fast local pass over the AST.
+    Returns 'UNSAFE: [reason]' or 'SAFE' when the verdict is obvious, None when the model should decide.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    visitor = _SafetyVisitor()
+    visitor.visit(tree)
+    if visitor.unsafe_reason:
+        return f"UNSAFE: {visitor.unsafe_reason}"
+    if visitor.trivially_safe:
+        return "SAFE"
+    return None
+
+
+def code_fingerprint(code: str) -> str:
+    """Hash of the normalized code: comments and formatting do not change the key."""
+    try:
+        normalized = ast.dump(ast.parse(code))
+    except SyntaxError:
+        normalized = "\n".join(line.rstrip() for line in code.strip().splitlines() if line.strip())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """Persistent LRU of validator verdicts keyed by code fingerprint."""
 
-        if not api_key:
-            raise ValueError("No GEMINI_API_KEY found. Check Streamlit Secrets or .env file.")
+    def __init__(self, db_path="overlord_cache.db", max_entries=5000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute('''
+                              CREATE TABLE IF NOT EXISTS verdicts
+                              (
+                                  key       TEXT PRIMARY KEY,
+                                  verdict   TEXT,
+                                  last_used INTEGER
+                              )
+                              ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_verdicts_lru ON verdicts (last_used)")
+            self.conn.commit()
+            row = self.conn.execute("SELECT MAX(last_used) FROM verdicts").fetchone()
+            self._clock = row[0] or 0
 
-        self.client = genai.Client(api_key=api_key)
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def get(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT verdict FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE verdicts SET last_used = ? WHERE key = ?", (self._tick(), key))
+            return row[0]
+
+    def put(self, key, verdict):
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO verdicts (key, verdict, last_used) VALUES (?, ?, ?)",
+                    (key, verdict, self._tick())
+                )
+                # Evict the least recently used entries beyond capacity
+                self.conn.execute(
+                    "DELETE FROM verdicts WHERE key IN "
+                    "(SELECT key FROM verdicts ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+
+class CodeValidator:
+    # Same shared genai.Client as the orchestrator unless one is injected
+    client = SharedClient()
+
+    def __init__(self, cache_path="overlord_cache.db", client=None, scheduler=None):
+        self._api_key = None if client is not None else gemini_api_key()
+        self.client = client
+        # Shared with the orchestrator so both stay inside one quota
+        self.scheduler = scheduler or get_scheduler()
         self.model_id = "gemini-2.5-flash"
         self.system_prompt = (
             "You are a Security Auditor. Review the provided Python code. "
@@ -24,11 +296,137 @@ class CodeValidator:
             "accessing files outside the workspace) or infinite loops, respond with 'UNSAFE: [reason]'. "
             "Otherwise, respond with 'SAFE'."
         )
+        # Verdicts are only valid for the prompt/model that produced them
+        self._key_salt = hashlib.sha256(f"{self.model_id}\n{self.system_prompt}".encode("utf-8")).hexdigest()[:16]
+        self.cache = VerdictCache(cache_path) if cache_path else None
+        self.metrics = {"requests": 0, "cache_hits": 0, "static_verdicts": 0, "llm_calls": 0,
+                        "review_chars_saved": 0}
+        # Hashes of recent contents the model (or its cached verdict) called SAFE; see approved_by_model
+        self._model_approved = OrderedDict()
+        self._approved_lock = threading.Lock()
 
-    def validate_code(self, code: str) -> str:
-        response = self.client.models.generate_content(
-            model=self.model_id,
-            contents=f"Code to review:\n\n{code}",
-            config=types.GenerateContentConfig(system_instruction=self.system_prompt)
+    @staticmethod
+    def review_prompt(code: str) -> str:
+        return f"Code to review:\n\n{code}"
+
+    def _precheck(self, code: str):
+        """Static screen, then cache. Returns (verdict or None, cache key)."""
+        self.metrics["requests"] += 1
+
+        verdict = static_screen(code)
+        if verdict:
+            self.metrics["static_verdicts"] += 1
+            return verdict, None
+        return self._cached(code)
+
+    def _cached(self, code: str):
+        """Cache only, for code the static screen has no say on. Returns (verdict or None, cache key)."""
+        key = f"{self._key_salt}:{code_fingerprint(code)}"
+        if self.cache:
+            verdict = self.cache.get(key)
+            if verdict:
+                self.metrics["cache_hits"] += 1
+                return verdict, key
+
+        self.metrics["llm_calls"] += 1
+        return None, key
+
+    def _estimate(self, prompt):
+        return estimate_tokens(self.system_prompt) + estimate_tokens(prompt)
+
+    def _remember(self, key, response):
+        verdict = response.text.strip()
+        if self.cache:
+            self.cache.put(key, verdict)
+        return verdict
+
+    def _review(self, code, key):
+        from google.genai import types
+
+        prompt = self.review_prompt(code)
+        # A pending write is blocked on this verdict, so it goes ahead of planning calls
+        response = self.scheduler.call(
+            lambda: self.client.models.generate_content(
+                model=self.model_id,
+                contents=prompt,
+                config=types.GenerateContentConfig(system_instruction=self.system_prompt)
+            ),
+            self.model_id, tokens=self._estimate(prompt), priority=URGENT
+        )
+        record_usage(response)
+        return self._remember(key, response)
+
+    async def _areview(self, code, key):
+        from google.genai import types
+
+        prompt = self.review_prompt(code)
+        response = await self.scheduler.acall(
+            lambda: self.client.aio.models.generate_content(
+                model=self.model_id,
+                contents=prompt,
+                config=types.GenerateContentConfig(system_instruction=self.system_prompt)
+            ),
+            self.model_id, tokens=self._estimate(prompt), priority=URGENT
         )
-        return response.text.strip()
\ No newline at end of file
+        record_usage(response)
+        return self._remember(key, response)
+
+    def _note(self, content, verdict, key):
+        # key is None for static verdicts: only a model's review counts as approval
+        if key is None or "UNSAFE" in verdict.upper():
+            return verdict
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self._approved_lock:
+            self._model_approved[digest] = True
+            self._model_approved.move_to_end(digest)
+            while len(self._model_approved) > 256:
+                self._model_approved.popitem(last=False)
+        return verdict
+
+    def approved_by_model(self, content: str) -> bool:
+        """True when this exact content was recently let through by the model, not by the static screen alone."""
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self._approved_lock:
+            return digest in self._model_approved
+
+    def validate_code(self, code: str) -> str:
+        verdict, key = self._precheck(code)
+        return self._note(code, verdict or self._review(code, key), key)
+
+    async def avalidate_code(self, code: str) -> str:
+        verdict, key = self._precheck(code)
+        return self._note(code, verdict or await self._areview(code, key), key)
+
+    def _change_precheck(self, content, ranges, label):
+        """
+        A patched file is screened statically as a whole (cheap, and a dangerous call elsewhere still counts),
+        but only the changed lines plus context go to the cache and the model. The excerpt itself is never
+        screened: without the file's imports, 'socket.create_connection(...)' would look trivially safe.
+        Returns (verdict, excerpt, cache key).
+        """
+        self.metrics["requests"] += 1
+        verdict = static_screen(content)
+        if verdict:
+            self.metrics["static_verdicts"] += 1
+            return verdict, None, None
+        excerpt = change_excerpt(content, ranges, label=label)
+        self.metrics["review_chars_saved"] += max(0, len(content) - len(excerpt))
+        verdict, key = self._cached(excerpt)
+        return verdict, excerpt, key
+
+    def validate_change(self, content: str, ranges, label="file") -> str:
+        verdict, excerpt, key = self._change_precheck(content, ranges, label)
+        return self._note(content, verdict or self._review(excerpt, key), key)
+
+    async def avalidate_change(self, content: str, ranges, label="file") -> str:
+        verdict, excerpt, key = self._change_precheck(content, ranges, label)
+        return self._note(content, verdict or await self._areview(excerpt, key), key)
+
+    @property
+    def cache_hit_rate(self) -> float:
+        lookups = self.metrics["requests"] - self.metrics["static_verdicts"]
+        return self.metrics["cache_hits"] / lookups if lookups else 0.0
+
+    @property
+    def llm_calls_avoided(self) -> int:
+        return self.metrics["requests"] - self.metrics["llm_calls"]
@@ -1,110 +1,283 @@
+import argparse
 import os
-from wsgiref.validate import validator
-
-import dotenv
-from dotenv import load_dotenv
 
+from core.clients import prefetch
+from core.config import get_secret
 from core.orchestrator import ProjectOrchestrator
 from core.memory import TaskMemory
 from core.validator import CodeValidator
+from core.executor import ActionExecutor, merge_observation
+from core.plan_cache import PlanCache
+from core.telemetry import Tracer, print_report
 from tools.file_manager import FileManager
 from tools.shell import ShellTool
+from tools.venv_pool import DEFAULT_SEED, VenvPool, Wheelhouse
 from rich.console import Console
+from rich.markup import escape
 from rich.panel import Panel
 from tools.browser import WebBrowser
 
-load_dotenv()
-
 def main():
+    parser = argparse.ArgumentParser(description="Project Overlord autonomous loop")
+    parser.add_argument("--record", metavar="FIXTURE",
+                        help="record model turns, validator verdicts and search results to a JSONL fixture for offline replay")
+    parser.add_argument("--live", action="store_true", help="show a live telemetry panel while the agent runs")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="wait for each complete model response instead of streaming it (thought and actions show up at the end)")
+    parser.add_argument("--report", action="store_true",
+                        help="print per-task and per-stage latency (p50/p95) and token spend, then exit")
+    parser.add_argument("--last", type=int, metavar="N", help="with --report, only the last N tasks")
+    parser.add_argument("--batch", metavar="TASKS",
+                        help="run a JSONL file of tasks headless ({\"id\": ..., \"task\": ...} per line)")
+    parser.add_argument("--out", metavar="RESULTS", help="with --batch, where results are appended (default: TASKS.results.jsonl)")
+    parser.add_argument("--workers", type=int, default=4, help="with --batch, tasks run at the same time")
+    parser.add_argument("--retry-failed", action="store_true", help="with --batch, rerun tasks whose last result was not 'done'")
+    args = parser.parse_args()
+
     #initialize our system
     console = Console()
+    if args.report:
+        print_report("overlord_memory.db", last_tasks=args.last, console=console)
+        return
+
     orchestrator = ProjectOrchestrator()
     memory = TaskMemory()
     files = FileManager()
-    shell = ShellTool()
-    browser = WebBrowser()
+    # INSTALL_PACKAGE goes into a per-task venv from a local wheelhouse (OVERLORD_VENV_POOL=0 installs into this
+    # interpreter); the pool is only seeded and filled once the first package is installed
+    venv_pool = None
+    if int(get_secret("OVERLORD_VENV_POOL", "2")):
+        seed = get_secret("OVERLORD_VENV_SEED")
+        venv_pool = VenvPool(
+            size=int(get_secret("OVERLORD_VENV_POOL", "2")),
+            seed=DEFAULT_SEED if seed is None else [p for p in seed.replace(",", " ").split() if p],
+            wheelhouse=Wheelhouse(allow_download=get_secret("OVERLORD_OFFLINE", "0").lower() not in ("1", "true", "yes")),
+        )
+    shell = ShellTool(warm_workers=int(get_secret("OVERLORD_WARM_WORKERS", "0")), venv_pool=venv_pool)
+    # Caches are off while recording, otherwise hits would never reach the fixture
+    browser = WebBrowser(cache_path=None if args.record else "overlord_search_cache.json")
+    validator = CodeValidator(cache_path=None if args.record else "overlord_cache.db")
+    executor = ActionExecutor(files, shell, browser, validator)
+    # Replaying cached plans would keep model turns out of a recording too
+    plan_cache = None if args.record else PlanCache()
+    tracer = Tracer(session_id=memory.session_id)
+    tracer.instrument_agent(orchestrator, validator, browser, shell, memory)
+
+    fixture = None
+    if args.record:
+        from core.replay import AsyncRecordingSession, Fixture, RecordingSession, recording_client
+        fixture = Fixture(args.record, mode="w")
+        orchestrator.client = recording_client(orchestrator.client, fixture)
+        validator.client = recording_client(validator.client, fixture)
+        browser.session = RecordingSession(browser.session, fixture)
+        browser.async_client = AsyncRecordingSession(browser.async_client, fixture)
+
+    # Buffered memory writes, workers and venvs are cleaned up however the session ends (Ctrl-C included)
+    live = None
+    try:
+        if args.batch:
+            run_batch(args, console, orchestrator, validator, browser, files, shell, tracer, plan_cache)
+            return
+
+        console.print(Panel("[bold cyan] PROJECT OVERLORD ONLINE [/bold cyan] \n [base] Autonomous System Architech Initialized"))
 
-    console.print(Panel("[bold cyan] PROJECT OVERLORD ONLINE [/bold cyan] \n [base] Autonomous System Architech Initialized"))
+        # Ask the user if they want to resume
+        if memory.has_history():
+            choice = input("Previous memory found. Resume session? (y/n): ").lower()
+            if choice != 'y':
+                memory.clear_memory()
+                console.print("[yellow]Memory cleared. Starting fresh.[/yellow]")
 
-    # Ask the user if they want to resume
-    if memory.get_history():
-        choice = input("Previous memory found. Resume session? (y/n): ").lower()
-        if choice != 'y':
-            memory.clear_memory()
-            console.print("[yellow]Memory cleared. Starting fresh.[/yellow]")
+        # get the users task; the Gemini SDK loads in the background meanwhile
+        prefetch()
+        user_task = input("\n[USER]: ")
+        tracer.set_scope(task=user_task)
+        memory.add_event("user", user_task)
+        if fixture:
+            fixture.record_task(memory.get_goal()[0]["parts"][0]["text"])
 
-    # get the users task
-    user_task = input("\n[USER]: ")
-    memory.add_event("user", user_task)
+        if args.live:
+            from rich.live import Live
+            # Everything printed through the console scrolls above the panel
+            live = Live(tracer.render_panel(), console=console, refresh_per_second=4)
+            tracer.on_span = lambda span: live.update(tracer.render_panel())
+            live.start()
+
+        run_task(user_task, console, orchestrator, memory, executor, files, validator, plan_cache,
+                 streaming=not args.no_stream, tracer=tracer)
+
+        streamed = orchestrator.stream_metrics
+        if streamed["calls"]:
+            dispatch = streamed["dispatch_seconds"] / streamed["dispatched"] if streamed["dispatched"] else None
+            console.print(f"[dim]Streaming: {streamed['calls']} responses, first token after "
+                          f"{streamed['ttft_seconds'] / streamed['calls']:.2f}s on average"
+                          + (f", first action after {dispatch:.2f}s" if dispatch is not None else "")
+                          + f" (complete after {streamed['total_seconds'] / streamed['calls']:.2f}s)[/dim]")
+        packages = venv_pool.metrics if venv_pool else None
+        if packages and packages["installs"]:
+            console.print(f"[dim]Packages: {packages['installs']} installs ({packages['already_installed']} already there, "
+                          f"{packages['fetched']} downloaded into the wheelhouse, {packages['copied']} wheels copied in without pip), "
+                          f"{packages['install_seconds']:.1f}s spent installing[/dim]")
+        speculation = executor.speculator.metrics
+        if speculation["used"]:
+            console.print(f"[dim]Speculative runs: {speculation['used']} of {speculation['started']} used, "
+                          f"{speculation['seconds_saved']:.2f}s of waiting saved[/dim]")
+    finally:
+        if live:
+            live.stop()
+        if plan_cache:
+            plan_cache.close()
+        executor.close()
+        memory.close()
+        tracer.close()
+        shell.close()
+
+def run_task(user_task, console, orchestrator, memory, executor, files, validator, plan_cache=None,
+             streaming=True, tracer=None, max_steps=10) -> dict:
+    """
+    The Think-Act-Observe loop for a task that is already in memory. max_steps is the safety limit
+    that keeps a confused model from looping forever. Returns {"status", "answer", "steps"}.
+    """
+    plan = plan_cache.start(user_task) if plan_cache else None
+    if plan and plan.hit:
+        console.print(f"[dim]Plan cache: this task was solved before, replaying {len(plan.plan)} recorded steps[/dim]")
 
     running = True
+    status = "max_steps"
+    answer = None
     step_count = 0
-    max_steps = 10 #safety limit to prevent infinite loop
-    last_action = None
+    last_signature = None
+
+    def show_output(stream, text):
+        console.print(text, end="", style="red" if stream == "stderr" else "dim", markup=False, highlight=False)
+
+    # Text of the current step's thought printed so far, while the response streams in
+    thought_shown = []
+
+    def show_thought(text):
+        if not thought_shown:
+            console.print("[bold blue]AI Thought:[/bold blue] ", end="")
+            thought_shown.append("")
+        console.print(text[len(thought_shown[0]):], end="", style="italic blue", markup=False, highlight=False)
+        thought_shown[0] = text
 
     while running and step_count < max_steps:
         step_count += 1
+        if tracer:
+            tracer.set_scope(step=step_count)
         console.print(f"\n[bold yellow]Step #{step_count}: AI is thinking...[/bold yellow]")
 
-        #ask the brain what to do next
-        summarized_context = memory.get_summarized_history()
-        action = orchestrator.get_next_action(summarized_context)
+        #ask the brain what to do next, unless a cached plan already knows
+        # Streamed actions start running as soon as the model has written them
+        actions = executor.stream(on_output=show_output, hold=last_signature)
+        thought_shown.clear()
+        step = plan.next_step() if plan else None
+        if step is None:
+            summarized_context = memory.get_summarized_history()
+            stats = memory.last_context_stats
+            console.print(f"[dim]Context: {stats.prompt_tokens} tokens (saved {stats.saved_tokens}, "
+                          f"recalled {stats.recalled_snippets} snippets)[/dim]")
+            if not streaming:
+                step = orchestrator.get_next_step(summarized_context)
+            else:
+                step = orchestrator.get_next_step_streaming(summarized_context, show_thought, actions.add)
+                timing = orchestrator.last_stream
+                if thought_shown:
+                    console.print()
+                if timing and timing.ttft is not None:
+                    started = f"first action started {timing.dispatch:.2f}s, " if timing.dispatch is not None else ""
+                    console.print(f"[dim]Stream: first token {timing.ttft:.2f}s, {started}"
+                                  f"complete {timing.total:.2f}s[/dim]")
 
-        if not action:
+        if not step:
+            actions.cancel()
             console.print("[bold red]ERROR: Brain failed to respond.[/bold red]")
             break
 
-        if last_action and action.tool == last_action.tool and action.file_name == last_action.file_name:
+        signature = [(a.tool, a.file_name) for a in step.actions]
+        if signature == last_signature:
+            actions.cancel()
             console.print("[bold red]SYSTEM INTERVENTION: Duplicate action detected.[/bold red]")
             memory.add_event("user", "You just attempted the exact same action. Do not repeat. Move to the next step.")
             continue
 
-        last_action = action  # Update the tracker
-
-        console.print(Panel(f"[italic]{action.thought}[/italic]", title="AI Thought Process", border_style="blue"))
+        last_signature = signature  # Update the tracker
 
-        # execute the tool chosen by the AI
-        result = ""
-        if action.tool == "WRITE_FILE":
-            validator = CodeValidator()
-            check = validator.validate_code(action.content)
+        if not thought_shown:
+            console.print(Panel(f"[italic]{step.thought}[/italic]", title="AI Thought Process", border_style="blue"))
+        for action in step.actions:
+            if action.tool == "SEARCH_WEB":
+                console.print(f"[yellow]Searching the web for: {action.content}...[/yellow]")
+            elif action.tool != "FINAL_ANSWER":
+                console.print(f"[yellow]{action.tool}[/yellow] {action.file_name or action.content or ''}")
 
-            if "UNSAFE" in check.upper():
-                result = f"SECURITY REJECTION: {check}. Please rewrite the code safely."
+        # execute the tools chosen by the AI (independent ones in parallel, streamed ones may be running already)
+        results = actions.results(step.actions)
+        for result in results:
+            if result.startswith("SECURITY REJECTION"):
                 console.print(f"[bold red]{result}[/bold red]")
-            else:
-                result = files.write_file(action.file_name, action.content)
-
-        elif action.tool == "RUN_CODE":
-            result = shell.execute_python(action.file_name)
-
-        elif action.tool == "INSTALL_PACKAGE":
-            result = shell.install_package(action.content)
-
-        elif action.tool == "SEARCH_WEB":
-            console.print(f"[yellow]Searching the web for: {action.content}...[/yellow]")
-            result = browser.search(action.content)
+        if plan:
+            was_diverged = plan.diverged
+            step, results = plan.observe(step, results)
+            if plan.diverged and not was_diverged:
+                console.print("[yellow]Plan cache: result differs from the recorded run, handing back to the model[/yellow]")
 
-
-        elif action.tool == "FINAL_ANSWER":
+        final = step.actions[-1]
+        if final.tool == "FINAL_ANSWER" and not results[-1].startswith("SKIPPED"):
             # Show the answer in the console
-            console.print(Panel(f"[bold green]{action.content}[/bold green]", title="Task Complete"))
+            console.print(Panel(f"[bold green]{final.content}[/bold green]", title="Task Complete"))
 
             # NEW: Generate a permanent report
             console.print("[dim italic]Generating final report...[/dim italic]")
-            report_content = f"### Result\n{action.content}\n\n### Process\n"
+            report_content = f"### Result\n{final.content}\n\n### Process\n"
 
             # Add the last few thoughts from memory to the report
-            for event in memory.get_history()[-5:]:
+            for event in memory.get_recent(5):
                 report_content += f"- {event['parts'][0]['text']}\n"
             files.save_report(user_task[:30], report_content)
+            memory.add_report(user_task, report_content)
+            console.print(
+                f"[dim]Validator: {validator.metrics['llm_calls']} LLM calls, "
+                f"{validator.llm_calls_avoided} avoided, cache hit rate {validator.cache_hit_rate:.0%}[/dim]"
+            )
+            status = "done"
+            answer = final.content
             running = False
             continue
 
-        #show the result of the tool and add it to memory
-        console.print(f"[bold magenta]Tool Result:[/bold magenta] {result}")
-        status_update = f"[SYSTEM NOTIFICATION]: {result}"
-        memory.add_event("model", f"Thought: {action.thought}\nAction: {action.tool}\nStatus: {status_update}")
+        #show the result of the tools and add it to memory as one observation
+        observation = merge_observation(step.actions, results)
+        console.print(f"[bold magenta]Tool Result:[/bold magenta] {observation}")
+        status_update = f"[SYSTEM NOTIFICATION]: {observation}"
+        memory.add_event("model", f"Thought: {step.thought}\nAction: {', '.join(a.tool for a in step.actions)}\nStatus: {status_update}")
+
+    if plan:
+        plan.finish(status)
+        if plan.hit:
+            console.print(f"[dim]Plan cache: {plan.llm_calls_saved} LLM calls saved[/dim]")
+    return {"status": status, "answer": answer, "steps": step_count}
+
+def run_batch(args, console, orchestrator, validator, browser, files, shell, tracer, plan_cache=None):
+    from core.batch import BatchRunner
+
+    results_path = args.out or f"{os.path.splitext(args.batch)[0]}.results.jsonl"
+    runner = BatchRunner(orchestrator, validator, browser, files, shell, workers=args.workers, tracer=tracer,
+                         plan_cache=plan_cache)
+    console.print(f"[bold cyan]Batch:[/bold cyan] {args.batch} -> {results_path} ({args.workers} workers)")
+
+    def show_result(result):
+        color = "green" if result["status"] == "done" else "red"
+        console.print(f"[{color}]{result['status']:>9}[/{color}] {result['id']} ({result['elapsed']:.1f}s) "
+                      f"{escape((result.get('answer') or result.get('error') or '')[:80])}", highlight=False)
+
+    summary = runner.run(args.batch, results_path, retry_failed=args.retry_failed, on_result=show_result)
+    counts = ", ".join(f"{n} {status}" for status, n in sorted(summary["statuses"].items())) or "nothing to do"
+    console.print(f"[bold]Batch finished in {summary['elapsed']:.1f}s:[/bold] {counts} "
+                  f"({summary['skipped']} of {summary['total']} already had results)")
+    if plan_cache and plan_cache.metrics["lookups"]:
+        console.print(f"[dim]Plan cache: hit rate {plan_cache.hit_rate:.0%}, "
+                      f"{plan_cache.metrics['llm_calls_saved']} LLM calls saved, "
+                      f"{plan_cache.metrics['fallbacks']} replays handed back to the model[/dim]")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
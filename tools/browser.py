@@ -1,35 +1,205 @@
+import asyncio
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import json
-from dotenv import load_dotenv
-import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from core.config import get_secret
+
+# Filler words that do not change what a search returns; dropped when building cache keys.
+# Prepositions and negations ('to', 'from', 'without', 'not') are kept: they change the question.
+STOPWORDS = {"a", "an", "the", "of", "is", "are", "what", "how"}
+
+
+def normalize_query(query: str) -> str:
+    """
+    'What is the latest Python version?' and 'latest python version' share one cache key.
+    Word order is kept: 'celsius to fahrenheit' and 'fahrenheit to celsius' are different searches.
+    """
+    # Punctuation, '_' and '-' split words, so 'read_csv' and 'read csv' match; version dots are kept.
+    # Letters of any script count: '北京 weather' and '上海 weather' must not share a key
+    words = re.findall(r"(?:[^\W_]|[+#])+(?:\.[0-9]+)*", query.casefold())
+    return " ".join(w for w in words if w not in STOPWORDS) or query.strip().casefold()
+
+
+class SearchCache:
+    """TTL + LRU cache of raw search results, optionally persisted to a JSON file."""
+
+    def __init__(self, ttl=3600, max_entries=512, path=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, (expires, value) in data.items():
+            if expires > now:
+                self._entries[key] = (expires, value)
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dict(self._entries), f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self.path:
+                self._save()
 
-load_dotenv()
 
 class WebBrowser:
-    def __init__(self):
-        self.api_key = st.secrets.get("SERPER_API_KEY") or os.getenv("SERPER_API_KEY")
-        self.url = "https://google.serper.dev/search"
+    def __init__(self, num_results=2, snippet_chars=150, timeout=10, retries=2, pool_size=8,
+                 cache_ttl=3600, cache_path=None, url=None, api_key=None, session=None, async_client=None):
+        self.api_key = api_key or get_secret("SERPER_API_KEY")
+        self.url = url or get_secret("SERPER_URL") or "https://google.serper.dev/search"
+        self.num_results = num_results
+        self.snippet_chars = snippet_chars
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.cache = SearchCache(ttl=cache_ttl, path=cache_path)
+        self.metrics = {"requests": 0, "cache_hits": 0, "fetches": 0, "fetch_seconds": 0.0}
+
+        # Keep-alive session; retries cover 429s and transient 5xx with backoff
+        retry = Retry(total=retries, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["POST"])
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry))
+        self.session.mount("http://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry))
+        # Injected transports (core.replay) replace the HTTP layer entirely
+        if session is not None:
+            self.session = session
+        self._async_client = async_client
+
+    def _headers(self):
+        return {'X-API-KEY': self.api_key, 'Content-Type': 'application/json'}
+
+    def _format_results(self, organic):
+        snippets = []
+        # Only take the top results and keep them VERY short
+        for result in organic[:self.num_results]:
+            title = result.get('title', 'No Title')
+            info = result.get('snippet', '')[:self.snippet_chars]
+            snippets.append(f"[{title}]: {info}...")
+
+        return "\n".join(snippets) if snippets else "No results found."
+
+    def _lookup(self, query):
+        self.metrics["requests"] += 1
+        key = normalize_query(query)
+        organic = self.cache.get(key)
+        if organic is not None:
+            self.metrics["cache_hits"] += 1
+        return key, organic
+
+    def _store(self, key, response, started):
+        response.raise_for_status()
+        data = response.json()
+        self.metrics["fetches"] += 1
+        self.metrics["fetch_seconds"] += time.perf_counter() - started
+        # Only the fields we render are cached, so the on-disk cache stays small
+        organic = [{"title": r.get("title"), "snippet": r.get("snippet", "")}
+                   for r in data.get('organic', [])[:10]]
+        self.cache.put(key, organic)
+        return organic
 
     def search(self, query):
         if not self.api_key:
             return "Error: No SERPER_API_KEY found."
 
-        payload = json.dumps({"q": query})
-        headers = {'X-API-KEY': self.api_key, 'Content-Type': 'application/json'}
+        key, organic = self._lookup(query)
+        if organic is None:
+            try:
+                started = time.perf_counter()
+                response = self.session.post(self.url, headers=self._headers(), json={"q": query}, timeout=self.timeout)
+                organic = self._store(key, response, started)
+            except Exception as e:
+                return f"Search Error: {str(e)}"
 
-        try:
-            response = requests.post(self.url, headers=headers, data=payload)
-            results = response.json()
-
-            snippets = []
-            # Only take top 2 results and keep them VERY short
-            for result in results.get('organic', [])[:2]:
-                title = result.get('title', 'No Title')
-                # Only take the first 150 characters of the snippet
-                info = result.get('snippet', '')[:150]
-                snippets.append(f"[{title}]: {info}...")
-
-            return "\n".join(snippets) if snippets else "No results found."
-        except Exception as e:
-            return f"Search Error: {str(e)}"
\ No newline at end of file
+        return self._format_results(organic)
+
+    @staticmethod
+    def _unique(queries):
+        return list(OrderedDict((normalize_query(q), q) for q in queries if q.strip()).values())
+
+    def search_many(self, queries):
+        """Runs several queries concurrently (deduplicated by cache key) and returns one combined result."""
+        unique = self._unique(queries)
+        with ThreadPoolExecutor(max_workers=min(self.pool_size, len(unique) or 1)) as pool:
+            results = list(pool.map(self.search, unique))
+        return "\n".join(f"### {q}\n{r}" for q, r in zip(unique, results))
+
+    @property
+    def async_client(self):
+        """One keep-alive httpx client per browser, created on first use."""
+        if self._async_client is None:
+            import httpx
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                transport=httpx.AsyncHTTPTransport(retries=1, limits=httpx.Limits(max_connections=self.pool_size))
+            )
+        return self._async_client
+
+    @async_client.setter
+    def async_client(self, client):
+        self._async_client = client
+
+    async def asearch(self, query):
+        if not self.api_key:
+            return "Error: No SERPER_API_KEY found."
+
+        key, organic = self._lookup(query)
+        if organic is None:
+            try:
+                started = time.perf_counter()
+                response = await self.async_client.post(self.url, headers=self._headers(), json={"q": query})
+                organic = self._store(key, response, started)
+            except Exception as e:
+                return f"Search Error: {str(e)}"
+
+        return self._format_results(organic)
+
+    async def asearch_many(self, queries):
+        unique = self._unique(queries)
+        results = await asyncio.gather(*(self.asearch(q) for q in unique))
+        return "\n".join(f"### {q}\n{r}" for q, r in zip(unique, results))
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.metrics["cache_hits"] / self.metrics["requests"] if self.metrics["requests"] else 0.0
@@ -1,10 +1,93 @@
+import hashlib
+import mmap
 import os
+import re
+import tempfile
+import threading
+
+from tools.patch import apply_patch
+from tools.workspace_index import WorkspaceIndex
+
+# Files at least this big are read through mmap, so a ranged read does not load the whole file
+MMAP_THRESHOLD = 1 << 20
+READ_DEFAULT_LINES = 200
+READ_MAX_BYTES = 64 * 1024
+
+
+def parse_read_range(spec):
+    """
+    READ_FILE content -> (lines, byte_range). Accepts '', 'lines 10-40', '10-40', 'line 7', 'lines 100-'
+    and 'bytes 0-4096'; ranges are inclusive, lines count from 1, bytes from 0. Raises ValueError.
+    """
+    spec = (spec or "").strip().lower()
+    if not spec:
+        return None, None
+    match = re.fullmatch(r"(lines?|bytes?)?\s*(\d+)\s*(?:(-)\s*(\d+)?)?", spec)
+    if not match:
+        raise ValueError(f"Cannot read range '{spec}'. Use e.g. 'lines 10-40' or 'bytes 0-4096'.")
+    unit, start, dash, end = match.groups()
+    start = int(start)
+    end = int(end) if end else (None if dash else start)
+    if end is not None and end < start:
+        raise ValueError(f"Range '{spec}' ends before it starts.")
+    if unit and unit.startswith("byte"):
+        return None, (start, end)
+    return (max(1, start), end), None
+
+
+def _line_offset(data, size, skip, chunk_size=1 << 20):
+    """Byte offset where the line after the first `skip` lines starts, or None if the file is shorter."""
+    position = 0
+    # Count newlines a chunk at a time (bytes.count runs in C), then walk the last chunk
+    while skip:
+        chunk = data[position:position + chunk_size]
+        if not chunk:
+            return None
+        found = chunk.count(b"\n")
+        if found < skip:
+            skip -= found
+            position += len(chunk)
+            continue
+        for _ in range(skip):
+            position = data.find(b"\n", position) + 1
+        skip = 0
+    return position if position < size else None
+
+
+class StagedWrite:
+    """A write_file whose content is on disk in a temp file but not yet in place."""
+
+    def __init__(self, files, file_name, path, tmp_path, chars, size, digest):
+        self.files = files
+        self.file_name = file_name
+        self.path = path
+        self.tmp_path = tmp_path
+        self.chars = chars
+        self.size = size
+        self.digest = digest
+
+    def commit(self):
+        if not self.files._commit(self.path, self.tmp_path, self.size, self.digest):
+            return f"CONFIRMED: {self.file_name} already has exactly this content, nothing was written. You do NOT need to write it again."
+        return f"CONFIRMED: {self.file_name} has been written to disk. Length: {self.chars} chars. You do NOT need to write it again."
+
+    def discard(self):
+        if self.tmp_path and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
 
 class FileManager:
-    def __init__(self, base_dir="workspace"):
+    def __init__(self, base_dir="workspace", watch=False):
         self.base_dir = os.path.abspath(base_dir)
         if not os.path.exists(self.base_dir):
             os.makedirs(self.base_dir)
+        # Cached listing for the UI and the model; watch=True refreshes on filesystem events (watchdog)
+        self.index = WorkspaceIndex(self.base_dir, watch=watch)
+        # Content hash of files we wrote, checked against (mtime, size) so edits from elsewhere are noticed
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self.metrics = {"writes": 0, "writes_skipped": 0, "bytes_written": 0, "bytes_skipped": 0,
+                        "patches": 0, "patch_bytes_saved": 0}
 
     def _get_safe_path(self, file_name):
         safe_path = os.path.abspath(os.path.join(self.base_dir, file_name))
@@ -12,20 +95,161 @@ class FileManager:
             raise PermissionError("Access denied: Path traversal detected")
         return safe_path
 
+    def subdir(self, name):
+        """A FileManager confined to a folder inside this workspace (e.g. one per batch task)."""
+        return FileManager(self._get_safe_path(name))
+
+    def _disk_hash(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None, None
+        cached = self._hashes.get(path)
+        if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return stat.st_size, cached[1]
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self._hashes[path] = ((stat.st_mtime_ns, stat.st_size), digest)
+        return stat.st_size, digest
+
+    def _stage(self, path, data: bytes):
+        """
+        Writes data to a temp file next to path. Returns (temp path, digest); the temp path is
+        None when the file already holds exactly this data, so there is nothing to write.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            size, current = self._disk_hash(path)
+        if size == len(data) and current == digest:
+            return None, digest
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest
+
+    def _commit(self, path, tmp_path, size, digest):
+        """Swaps a staged temp file in, so readers never see half a file. Returns False when nothing was staged."""
+        with self._lock:
+            if tmp_path is None:
+                self.metrics["writes_skipped"] += 1
+                self.metrics["bytes_skipped"] += size
+                return False
+            os.replace(tmp_path, path)
+            stat = os.stat(path)
+            self._hashes[path] = ((stat.st_mtime_ns, stat.st_size), digest)
+            self.index.note_write(os.path.relpath(path, self.base_dir), digest)
+            self.metrics["writes"] += 1
+            self.metrics["bytes_written"] += size
+            return True
+
+    def _store(self, path, data: bytes):
+        """Writes data unless the file already holds exactly it. Returns False when the write was skipped."""
+        tmp_path, digest = self._stage(path, data)
+        return self._commit(path, tmp_path, len(data), digest)
+
+    def stage_write(self, file_name, contents):
+        """
+        First half of write_file: the content goes to a temp file next to the target, e.g. while
+        the validator is still deciding. commit() on the returned StagedWrite moves it into place,
+        discard() drops it.
+        """
+        path = self._get_safe_path(file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = contents.encode("utf-8")
+        tmp_path, digest = self._stage(path, data)
+        return StagedWrite(self, file_name, path, tmp_path, len(contents), len(data), digest)
+
     def write_file(self, file_name, contents):
+        return self.stage_write(file_name, contents).commit()
+
+    def content_hash(self, file_name):
+        """sha256 of a workspace file as it is on disk now (None if it does not exist); cached per mtime and size."""
+        with self._lock:
+            return self._disk_hash(self._get_safe_path(file_name))[1]
+
+    def patch_file(self, file_name, patch):
+        """
+        Applies a unified diff or SEARCH/REPLACE blocks to a workspace file in memory.
+        Returns (new_content, changed_line_ranges); raises PatchError if any hunk does not match.
+        Nothing is written: the caller validates the change first, then calls write_patched.
+        """
         path = self._get_safe_path(file_name)
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(contents)
-        return f"CONFIRMED: {file_name} has been written to disk. Length: {len(contents)} chars. You do NOT need to write it again."
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{file_name} does not exist yet; create it with WRITE_FILE.")
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            original = f.read()
+        return apply_patch(original, patch)
+
+    def write_patched(self, file_name, contents, patch, changed_lines):
+        self.metrics["patches"] += 1
+        # What the model did not have to send compared with a full WRITE_FILE
+        self.metrics["patch_bytes_saved"] += max(0, len(contents.encode("utf-8")) - len(patch.encode("utf-8")))
+        if not self._store(self._get_safe_path(file_name), contents.encode("utf-8")):
+            return f"CONFIRMED: patch leaves {file_name} unchanged, nothing was written."
+        return (f"CONFIRMED: patch applied to {file_name} ({changed_lines} lines changed, "
+                f"{len(contents)} chars now). You do NOT need to write it again.")
 
     def read_file(self, file_name):
         path = self._get_safe_path(file_name)
         if not os.path.exists(path): return "Error: File not found"
-        with open(path, "r") as f: return f.read()
+        with open(path, "r", encoding="utf-8") as f: return f.read()
+
+    def read_range(self, file_name, lines=None, byte_range=None):
+        """
+        READ_FILE: part of a file with a header saying which part it is. lines=(first, last) is
+        1-based and inclusive (last=None reads READ_DEFAULT_LINES lines), byte_range=(start, end)
+        is inclusive. No range means the first READ_DEFAULT_LINES lines. At most READ_MAX_BYTES
+        are returned; large files are mapped instead of read, so only the pages touched are loaded.
+        """
+        path = self._get_safe_path(file_name)
+        if not os.path.isfile(path):
+            return f"Error: {file_name} not found"
+        size = os.path.getsize(path)
+        if size == 0:
+            return f"{file_name} is empty."
+        with open(path, "rb") as f:
+            if size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return self._slice(file_name, data, size, lines, byte_range)
+            return self._slice(file_name, f.read(), size, lines, byte_range)
+
+    @staticmethod
+    def _slice(file_name, data, size, lines, byte_range):
+        if byte_range:
+            start = byte_range[0]
+            if start >= size:
+                return f"Error: {file_name} has only {size} bytes."
+            end = min(size, (byte_range[1] if byte_range[1] is not None else size - 1) + 1, start + READ_MAX_BYTES)
+            text = bytes(data[start:end]).decode("utf-8", errors="replace")
+            return f"{file_name} bytes {start}-{end - 1} of {size}:\n{text}"
+
+        first, last = lines or (1, None)
+        if last is None:
+            last = first + READ_DEFAULT_LINES - 1
+        start = _line_offset(data, size, first - 1)
+        if start is None:
+            return f"Error: {file_name} has fewer than {first} lines."
+        end, line = start, first - 1
+        while line < last and end < size and end - start < READ_MAX_BYTES:
+            newline = data.find(b"\n", end)
+            end = size if newline == -1 else newline + 1
+            line += 1
+        end = min(end, start + READ_MAX_BYTES)
+        text = bytes(data[start:end]).decode("utf-8", errors="replace")
+        more = ", more lines follow" if end < size else ""
+        return f"{file_name} lines {first}-{line} ({size} bytes total{more}):\n{text}"
+
+    @staticmethod
+    def report_name(task_name):
+        return f"report_{task_name.replace(' ', '_').lower()}.md"
 
     def save_report(self, task_name, content):
         """Saves a structured Markdown report of the task."""
-        filename = f"report_{task_name.replace(' ', '_').lower()}.md"
+        filename = self.report_name(task_name)
         path = self._get_safe_path(filename)
 
         report_template = f"""# Project Overlord: Task Report
@@ -36,9 +260,9 @@ class FileManager:
                         ---
                         *Generated by Overlord Autonomous System*
                         """
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(report_template)
+        self._store(path, report_template.encode("utf-8"))
         return f"Report saved to {filename}"
 
     def list_files(self):
-        return os.listdir(self.base_dir)
\ No newline at end of file
+        """Workspace files, recursively, from the cached index."""
+        return [entry.path for entry in self.index.list()]
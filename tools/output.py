@@ -0,0 +1,152 @@
+import codecs
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+
+# The per-run part of an artifact's name: <run>_<YYYYmmdd-HHMMSS>-<6 hex>.<stream>.log
+ARTIFACT_STAMP = re.compile(r"_\d{8}-\d{6}-[0-9a-f]{6}(?=\.std(?:out|err)\.log)")
+
+
+def mask_artifact_stamps(text: str) -> str:
+    """Replaces the timestamp and id in artifact names, so two runs with the same output read the same."""
+    return ARTIFACT_STAMP.sub("_<stamp>", text)
+
+
+class OutputBuffer:
+    """
+    Bounded capture of one output stream: the first and last lines are kept within byte and
+    line caps, the middle is dropped. Once the caps are exceeded the full stream is written to
+    spill_path so nothing is lost. saved_path is where the result says that file is, when the
+    caller moves it there after the run (defaults to spill_path).
+    """
+
+    def __init__(self, max_bytes=8000, max_lines=200, spill_path=None, saved_path=None):
+        self.head_bytes, self.head_lines = max_bytes // 2, max_lines // 2
+        self.tail_bytes, self.tail_lines = max_bytes - self.head_bytes, max_lines - self.head_lines
+        self.spill_path = spill_path
+        self.saved_path = saved_path or spill_path
+        self.head, self._head_size = [], 0
+        self.tail, self._tail_size = deque(), 0
+        self.total_bytes = 0
+        self.dropped_lines = 0
+        self.dropped_bytes = 0
+        self._partial = ""
+        self._spill = None
+
+    def write(self, text: str):
+        # Chunks can end mid-line; hold the unfinished line back until its newline arrives
+        lines = (self._partial + text).splitlines(keepends=True)
+        self._partial = ""
+        if lines and not lines[-1].endswith(("\n", "\r")):
+            self._partial = lines.pop()
+            if len(self._partial) > self.tail_bytes:
+                lines.append(self._partial)
+                self._partial = ""
+        for line in lines:
+            self._add(line)
+
+    def _add(self, line):
+        size = len(line.encode("utf-8"))
+        self.total_bytes += size
+        if self._spill:
+            self._spill.write(line)
+
+        if self._head_open() and len(self.head) < self.head_lines and self._head_size + size <= self.head_bytes:
+            self.head.append(line)
+            self._head_size += size
+            return
+
+        if size > self.tail_bytes:
+            # One line bigger than the whole tail budget (a huge print without newlines): keep its end
+            self._start_spill(pending=line)
+            kept = line[-(self.tail_bytes // 4):]
+            self.dropped_bytes += size - len(kept.encode("utf-8"))
+            line, size = kept, len(kept.encode("utf-8"))
+
+        self.tail.append(line)
+        self._tail_size += size
+        while len(self.tail) > 1 and (len(self.tail) > self.tail_lines or self._tail_size > self.tail_bytes):
+            self._start_spill()
+            dropped = self.tail.popleft()
+            dropped_size = len(dropped.encode("utf-8"))
+            self._tail_size -= dropped_size
+            if dropped.endswith(("\n", "\r")):
+                self.dropped_lines += 1
+            self.dropped_bytes += dropped_size
+
+    def _start_spill(self, pending=""):
+        if self._spill is not None or not self.spill_path:
+            return
+        # First overflow: everything so far is still in memory, copy it out before dropping anything
+        os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+        self._spill = open(self.spill_path, "w", encoding="utf-8")
+        self._spill.write("".join(self.head) + "".join(self.tail) + pending)
+
+    def _head_open(self):
+        # Once anything went to the tail, the head is closed so the output stays in order
+        return not self.tail and not self.dropped_bytes
+
+    def close(self):
+        if self._partial:
+            self._add(self._partial)
+            self._partial = ""
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+
+    def render(self, relative_to=None) -> str:
+        text = "".join(self.head)
+        if self.dropped_bytes:
+            where = ""
+            if self.saved_path:
+                path = os.path.relpath(self.saved_path, relative_to) if relative_to else self.saved_path
+                where = f", full output saved to {path}"
+            lines = f"{self.dropped_lines} lines / " if self.dropped_lines else ""
+            text += f"\n...[{lines}{self.dropped_bytes} bytes omitted{where}]...\n"
+        return text + "".join(self.tail)
+
+
+class OutputCapture:
+    """
+    stdout + stderr of one run. Raw bytes are decoded incrementally, kept in bounded buffers
+    and forwarded to on_output(stream, text) as they arrive. With staging_dir, overflow is
+    spilled there instead, under the name it would have in artifact_dir: whoever started the run
+    moves it over (or deletes it) once it knows whether the result is used.
+    """
+
+    def __init__(self, artifact_dir, run_name, max_bytes=8000, max_lines=200, on_output=None, staging_dir=None):
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.artifact_dir = artifact_dir
+        self.buffers = {}
+        for stream in ("stdout", "stderr"):
+            log_name = f"{run_name}_{stamp}.{stream}.log"
+            self.buffers[stream] = OutputBuffer(max_bytes, max_lines, os.path.join(staging_dir or artifact_dir, log_name),
+                                                os.path.join(artifact_dir, log_name))
+        self._decoders = {stream: codecs.getincrementaldecoder("utf-8")("replace") for stream in self.buffers}
+        self.on_output = on_output
+        self._lock = threading.Lock()
+
+    def feed(self, stream, data: bytes, final=False):
+        with self._lock:
+            text = self._decoders[stream].decode(data, final)
+            if not text:
+                return
+            self.buffers[stream].write(text)
+        if self.on_output:
+            self.on_output(stream, text)
+
+    def write(self, stream, text: str):
+        """For messages that did not come from the process itself (timeouts, crashes)."""
+        self.feed(stream, text.encode("utf-8"))
+
+    def close(self):
+        for stream, buffer in self.buffers.items():
+            self.feed(stream, b"", final=True)
+            buffer.close()
+
+    def render(self, relative_to=None) -> str:
+        return (f"STDOUT: {self.buffers['stdout'].render(relative_to)}\n"
+                f"STDERR: {self.buffers['stderr'].render(relative_to)}")
@@ -0,0 +1,145 @@
+import re
+
+SEARCH_MARK = "<<<<<<< SEARCH"
+DIVIDER = "======="
+REPLACE_MARK = ">>>>>>> REPLACE"
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(Exception):
+    """The patch does not match the file; nothing was written."""
+
+
+def _parse_search_replace(patch):
+    hunks = []
+    lines = patch.splitlines(keepends=True)
+    i = 0
+    while i < len(lines):
+        if lines[i].strip() != SEARCH_MARK:
+            i += 1
+            continue
+        search, replace = [], []
+        i += 1
+        while i < len(lines) and lines[i].strip() != DIVIDER:
+            search.append(lines[i])
+            i += 1
+        i += 1
+        while i < len(lines) and lines[i].strip() != REPLACE_MARK:
+            replace.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            raise PatchError("Unterminated SEARCH/REPLACE block (missing '>>>>>>> REPLACE').")
+        hunks.append((search, replace, None))
+        i += 1
+    return hunks
+
+
+def _parse_unified(patch):
+    hunks = []
+    current = None
+    for line in patch.splitlines(keepends=True):
+        header = HUNK_HEADER.match(line)
+        if header:
+            # '-N,0' (nothing removed) means 'after line N'; otherwise the hunk starts at line N
+            start = int(header.group(1))
+            current = ([], [], start if header.group(2) == "0" else start - 1)
+            hunks.append(current)
+        elif current is None or line.startswith(("--- ", "+++ ")):
+            continue
+        elif line.startswith("-"):
+            current[0].append(line[1:])
+        elif line.startswith("+"):
+            current[1].append(line[1:])
+        elif line.startswith(" ") or line in ("\n", "\r\n"):
+            # Context line; an empty line is context whose leading space got stripped
+            current[0].append(line[1:] if line.startswith(" ") else line)
+            current[1].append(line[1:] if line.startswith(" ") else line)
+        elif line.startswith("\\"):
+            # '\ No newline at end of file'
+            continue
+    return hunks
+
+
+def parse_patch(patch: str):
+    """Returns [(old_lines, new_lines, line_hint)] for unified diff or SEARCH/REPLACE input."""
+    if SEARCH_MARK in patch:
+        hunks = _parse_search_replace(patch)
+    else:
+        hunks = _parse_unified(patch)
+    if not hunks:
+        raise PatchError("No hunks found. Use a unified diff (@@ ... @@) or SEARCH/REPLACE blocks.")
+    return hunks
+
+
+def _find(lines, old, start, hint):
+    """Index where `old` occurs in lines[start:], nearest to the hint; exact match first, then ignoring trailing whitespace."""
+    for normalize in (lambda s: s.rstrip("\r\n"), lambda s: s.rstrip()):
+        target = [normalize(line) for line in old]
+        matches = [i for i in range(start, len(lines) - len(old) + 1)
+                   if [normalize(line) for line in lines[i:i + len(old)]] == target]
+        if matches:
+            if hint is None and len(matches) > 1:
+                raise PatchError(f"SEARCH block matches {len(matches)} places; include more surrounding lines.")
+            return min(matches, key=lambda i: abs(i - hint)) if hint is not None else matches[0]
+    return None
+
+
+def apply_patch(original: str, patch: str):
+    """
+    Applies every hunk to `original`, or none of them. Returns (new_content, changed_ranges), where
+    changed_ranges are (start, end) line indices in the new content (end exclusive).
+    """
+    lines = original.splitlines(keepends=True)
+    # A file without a trailing newline: the last line must still match hunks that end with one
+    missing_final_newline = bool(lines) and not lines[-1].endswith("\n")
+    if missing_final_newline:
+        lines[-1] += "\n"
+
+    result, ranges = [], []
+    position = 0
+    for number, (old, new, hint) in enumerate(parse_patch(patch), 1):
+        if not old:
+            # Pure insertion: at the hinted line, or at the end for a SEARCH block with nothing to find
+            index = min(hint, len(lines)) if hint is not None else len(lines)
+            index = max(index, position)
+        else:
+            index = _find(lines, old, position, hint)
+            if index is None:
+                preview = "".join(old[:3]).rstrip()
+                raise PatchError(f"Hunk {number} does not match the file. Expected to find:\n{preview}")
+        result.extend(lines[position:index])
+        # Only the lines that really differ count as changed, context lines do not
+        prefix = 0
+        while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < min(len(old), len(new)) - prefix and old[-1 - suffix] == new[-1 - suffix]:
+            suffix += 1
+        start = len(result) + prefix
+        result.extend(new)
+        ranges.append((start, len(result) - suffix))
+        position = index + len(old)
+    result.extend(lines[position:])
+
+    content = "".join(result)
+    if missing_final_newline and content.endswith("\n"):
+        content = content[:-1]
+    return content, ranges
+
+
+def change_excerpt(content: str, ranges, context=3, label="file"):
+    """The changed lines plus `context` lines around them, with a header saying where they come from."""
+    lines = content.splitlines()
+    windows = []
+    for start, end in sorted(ranges):
+        window = [max(0, start - context), min(len(lines), max(end, start + 1) + context)]
+        if windows and window[0] <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], window[1])
+        else:
+            windows.append(window)
+    parts = [f"# Excerpt of {label}: lines " + ", ".join(f"{a + 1}-{b}" for a, b in windows) + " (changed code plus context)"]
+    for i, (a, b) in enumerate(windows):
+        if i:
+            parts.append("# ...")
+        parts.extend(lines[a:b])
+    return "\n".join(parts) + "\n"
@@ -0,0 +1,162 @@
+"""
+Warm interpreter used by PythonWorkerPool. Not meant to be imported.
+
+Usage: python -u python_worker.py numpy,pandas
+Reads one JSON job per line on stdin: {"path": ..., "cwd": ..., "marker": ..., "recycle": ...}.
+The script's output goes to this process's stdout/stderr; when the job is over the marker
+is written to both streams so the parent knows where the job's output ends. The recycle marker
+is written instead when the job left state behind that cannot be undone, and the parent then
+replaces this worker.
+"""
+import ast
+import json
+import os
+import runpy
+import sys
+import threading
+import traceback
+import warnings
+from types import ModuleType
+
+# Scripts importing these can change the interpreter itself (sys.setrecursionlimit, ctypes...)
+INTERPRETER_MODULES = {"sys", "builtins", "importlib", "ctypes", "gc"}
+
+
+def touches_interpreter(path):
+    """True when the script imports sys or another module that reaches into the interpreter."""
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError, ValueError):
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and not node.level:
+            names = [node.module or ""]
+        else:
+            continue
+        if any(name.split(".")[0] in INTERPRETER_MODULES for name in names):
+            return True
+    return False
+
+
+def snapshot_modules():
+    # Attribute values of every module loaded before any job: a reassignment is a monkeypatch
+    return {name: (module, dict(vars(module))) for name, module in list(sys.modules.items())
+            if isinstance(module, ModuleType) and name != "__main__"}
+
+
+def patched_module(snapshot):
+    """Name of a preloaded module whose attributes a job reassigned, deleted or added, or None."""
+    for name, (module, attributes) in snapshot.items():
+        current = vars(module)
+        for key, value in current.items():
+            # Importing a submodule sets it on its package; that is not a patch
+            if attributes.get(key, attributes) is not value and not isinstance(value, ModuleType):
+                return name
+        if any(key not in current for key in attributes):
+            return name
+    return None
+
+
+class ProcessState:
+    """Interpreter globals a job may change that are put back afterwards."""
+
+    def __init__(self):
+        self.streams = (sys.stdin, sys.stdout, sys.stderr)
+        self.environ = dict(os.environ)
+        self.cwd = os.getcwd()
+        self.path = list(sys.path)
+        self.meta_path = list(sys.meta_path)
+        self.path_hooks = list(sys.path_hooks)
+        self.recursion_limit = sys.getrecursionlimit()
+        self.warning_filters = list(warnings.filters)
+        self.modules = set(sys.modules)
+        self.threads = threading.active_count()
+        self.module_attributes = snapshot_modules()
+
+    def restore(self):
+        """Undoes what the job changed. Returns the reason the worker must be recycled, or None."""
+        reason = None
+        if any(stream.closed for stream in self.streams):
+            reason = "closed a standard stream"
+        sys.stdin, sys.stdout, sys.stderr = self.streams
+        if dict(os.environ) != self.environ:
+            os.environ.clear()
+            os.environ.update(self.environ)
+        os.chdir(self.cwd)
+        sys.path[:] = self.path
+        if sys.meta_path != self.meta_path or sys.path_hooks != self.path_hooks:
+            reason = reason or "changed the import system"
+        sys.setrecursionlimit(self.recursion_limit)
+        sys.settrace(None)
+        sys.setprofile(None)
+        warnings.filters[:] = self.warning_filters
+        # Modules the script imported (e.g. its own helpers in the workspace) must not leak into the next run
+        for name in set(sys.modules) - self.modules:
+            del sys.modules[name]
+        if threading.active_count() > self.threads:
+            reason = reason or "left threads running"
+        patched = patched_module(self.module_attributes)
+        if patched:
+            reason = reason or f"patched {patched}"
+        return reason
+
+
+def run_job(job, state):
+    path = job["path"]
+    os.chdir(job["cwd"])
+    sys.argv[:] = [path]
+    # Same sys.path a fresh 'python path' would get: the script's folder first
+    sys.path[:] = [os.path.dirname(path)] + state.path[1:]
+    try:
+        # Fresh namespace on every run
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit as e:
+        if isinstance(e.code, str):
+            print(e.code, file=sys.stderr)
+    except BaseException as e:
+        # Hide the runpy frames so the traceback looks like a plain 'python script.py' run
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb)
+
+
+def main():
+    preload = sys.argv[1].split(",") if len(sys.argv) > 1 else []
+    for name in filter(None, preload):
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+    # Jobs arrive on a private copy of stdin; scripts calling input() get EOF instead of our protocol
+    jobs = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    sys.stdin = open(os.devnull, "r")
+
+    state = ProcessState()
+    for line in jobs:
+        job = json.loads(line)
+        recycle = touches_interpreter(job["path"])
+        try:
+            run_job(job, state)
+        finally:
+            for stream in (sys.stdout, sys.stderr):
+                try:
+                    stream.flush()
+                except (AttributeError, ValueError, OSError):
+                    pass
+            recycle = state.restore() or recycle
+            sys.stdout.flush()
+            sys.stderr.flush()
+            marker = (job["recycle"] if recycle else job["marker"]).encode()
+            os.write(1, marker)
+            os.write(2, marker)
+
+
+if __name__ == "__main__":
+    main()
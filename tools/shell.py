@@ -1,29 +1,171 @@
+import asyncio
 import subprocess
 import sys
 import os
 
+from tools.output import OutputCapture
+from tools.venv_pool import parse_packages
+from tools.worker_pool import DEFAULT_PRELOAD, PythonWorkerPool, RunCancelled, WorkersBusy
+
 class ShellTool:
-    def __init__(self, workspace_dir="workspace"):
+    def __init__(self, workspace_dir="workspace", timeout=15, warm_workers=0, preload=DEFAULT_PRELOAD,
+                 max_output_bytes=8000, max_output_lines=200, venv_pool=None):
         self.workspace_dir = os.path.abspath(workspace_dir)
+        self.timeout = timeout
+        self.max_output_bytes = max_output_bytes
+        self.max_output_lines = max_output_lines
+        # Optional pool of pre-started interpreters; 0 keeps the cold 'one subprocess per run' mode
+        self.pool = None
+        self._owns_pool = True
+        if warm_workers:
+            try:
+                os.makedirs(self.workspace_dir, exist_ok=True)
+                self.pool = PythonWorkerPool(size=warm_workers, preload=preload, cwd=self.workspace_dir)
+            except OSError as e:
+                print(f"DEBUG: Warm workers unavailable, using cold subprocesses: {e}")
+        # Optional tools.venv_pool.VenvPool: the first INSTALL_PACKAGE checks out a venv for this
+        # shell's task, installs go there from the local wheelhouse and later runs use its interpreter
+        self.venv_pool = venv_pool
+        self._owns_venv_pool = True
+        self.venv = None
+
+    @property
+    def python(self):
+        return self.venv.python if self.venv else sys.executable
+
+    def for_workspace(self, workspace_dir):
+        """A ShellTool for another workspace that shares this one's warm workers (they take the cwd per job)."""
+        shell = ShellTool(workspace_dir, self.timeout, max_output_bytes=self.max_output_bytes,
+                          max_output_lines=self.max_output_lines)
+        shell.pool = self.pool
+        shell._owns_pool = False
+        # Same pool, but the new shell checks out a venv of its own
+        shell.venv_pool = self.venv_pool
+        shell._owns_venv_pool = False
+        return shell
 
-    def execute_python(self, file_name):
+    def _capture(self, file_name, on_output, staging_dir=None):
+        run_name = os.path.splitext(os.path.basename(file_name))[0]
+        return OutputCapture(os.path.join(self.workspace_dir, "artifacts"), run_name,
+                             self.max_output_bytes, self.max_output_lines, on_output, staging_dir)
+
+    def execute_python(self, file_name, on_output=None, cancel=None, staging_dir=None, wait_for_worker=True):
+        """
+        Runs a workspace script. Output is streamed to on_output(stream, text) as it is produced
+        and kept head+tail within the output caps; overflow is saved under workspace/artifacts
+        (or staging_dir, see OutputCapture). Setting cancel (a threading.Event) kills the run.
+        With wait_for_worker=False, WorkersBusy is raised instead of queueing for a warm worker.
+        """
         #guard rail for when AI forgot the file name
         if not file_name:
             return "Error: You didn't provide a file_name to run. Please specify a file to run."
+        if self.pool and not self.venv:
+            return self._run_warm(file_name, on_output, cancel, staging_dir, wait_for_worker)
+        # A cold run has a single implementation, the event loop's; this call gets a loop of its own
+        return asyncio.run(self.aexecute_python(file_name, on_output, cancel, staging_dir))
+
+    def _run_warm(self, file_name, on_output, cancel, staging_dir, wait_for_worker):
+        capture = self._capture(file_name, on_output, staging_dir)
+        try:
+            self.pool.run(os.path.join(self.workspace_dir, file_name), self.workspace_dir, self.timeout,
+                          capture.feed, cancel, wait_for_worker)
+            capture.close()
+            return capture.render(self.workspace_dir)
+        except WorkersBusy:
+            capture.close()
+            raise
+        except Exception as e:
+            capture.close()
+            return f"Error: {str(e)}\n{capture.render(self.workspace_dir)}"
+
+    async def aexecute_python(self, file_name, on_output=None, cancel=None, staging_dir=None, wait_for_worker=True):
+        """execute_python on the event loop. A cold run is killed by its cancel event or by cancelling the task."""
+        if not file_name:
+            return "Error: You didn't provide a file_name to run. Please specify a file to run."
+        # Warm workers run the host interpreter; once the task has its own venv, runs start in that
+        if self.pool and not self.venv:
+            # The pool blocks on pipes, keep it off the event loop
+            return await asyncio.to_thread(self._run_warm, file_name, on_output, cancel, staging_dir, wait_for_worker)
         file_path = os.path.join(self.workspace_dir, file_name)
+        capture = self._capture(file_name, on_output, staging_dir)
+
+        async def pump(stream, reader):
+            while chunk := await reader.read(65536):
+                capture.feed(stream, chunk)
+
         try:
-            result = subprocess.run(
-                [sys.executable, file_path],
-                capture_output=True, text=True, timeout=15,
+            proc = await asyncio.create_subprocess_exec(
+                self.python, file_path,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
                 cwd=self.workspace_dir
             )
-            return f"STDOUT: {result.stdout}\nSTDERR: {result.stderr}"
+            watcher = asyncio.ensure_future(self._kill_when_set(cancel, proc)) if cancel else None
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(pump("stdout", proc.stdout), pump("stderr", proc.stderr), proc.wait()),
+                    timeout=self.timeout
+                )
+                if cancel is not None and cancel.is_set():
+                    raise RunCancelled(file_path)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                # Same wording subprocess.run uses, so both paths look alike to the model
+                raise subprocess.TimeoutExpired([self.python, file_path], self.timeout)
+            except asyncio.CancelledError:
+                proc.kill()
+                await proc.wait()
+                capture.close()
+                raise
+            finally:
+                if watcher:
+                    watcher.cancel()
+            capture.close()
+            return capture.render(self.workspace_dir)
         except Exception as e:
-            return f"Error: {str(e)}"
+            capture.close()
+            return f"Error: {str(e)}\n{capture.render(self.workspace_dir)}"
+
+    @staticmethod
+    async def _kill_when_set(cancel, proc):
+        while not cancel.is_set():
+            await asyncio.sleep(0.05)
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+
+    def _install_in_venv(self, package_name):
+        try:
+            specs = parse_packages(package_name)
+        except ValueError as e:
+            return f"Failed to install {package_name}: {e}"
+        if self.venv is None:
+            self.venv = self.venv_pool.checkout()
+        ok, detail = self.venv_pool.install(self.venv, specs)
+        if not ok:
+            return f"Failed to install {package_name}: {detail}"
+        return f"Installed package: {package_name} ({detail})"
 
     def install_package(self, package_name):
+        if self.venv_pool:
+            return self._install_in_venv(package_name)
         try:
             subprocess.check_call([sys.executable, "-m", "pip", "install", package_name])
             return f"Installed package: {package_name}"
         except Exception as e:
-            return f"Failed to install {package_name}: {e}"
\ No newline at end of file
+            return f"Failed to install {package_name}: {e}"
+
+    async def ainstall_package(self, package_name):
+        # pip runs in a subprocess either way; installs are rare, so the loop just waits on a thread
+        return await asyncio.to_thread(self.install_package, package_name)
+
+    def close(self):
+        if self.pool and self._owns_pool:
+            self.pool.close()
+        if self.venv:
+            self.venv_pool.release(self.venv)
+            self.venv = None
+        if self.venv_pool and self._owns_venv_pool:
+            self.venv_pool.close()
@@ -0,0 +1,453 @@
+import importlib.metadata
+import json
+import os
+import queue
+import re
+import shutil
+import site
+import subprocess
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+import venv
+import zipfile
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Installed once into a directory every pooled venv imports from (OVERLORD_VENV_SEED overrides it)
+DEFAULT_SEED = ("requests",)
+
+# A requirement as the model writes it: a name, optional extras and version constraints. No pip options, URLs or paths.
+_SPEC = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*(\[[A-Za-z0-9._,-]+\])?([<>=!~]=?[A-Za-z0-9.*+!-]+(,[<>=!~]=?[A-Za-z0-9.*+!-]+)*)?$")
+
+
+def parse_packages(text):
+    """Requirement specs in INSTALL_PACKAGE content ('numpy pandas==2.2', one or more per line)."""
+    specs = (text or "").split()
+    if not specs:
+        raise ValueError("no package name given")
+    refused = [spec for spec in specs if not _SPEC.match(spec)]
+    if refused:
+        raise ValueError(f"not a package name: {', '.join(refused)}")
+    return specs
+
+
+def _tail(output, limit=400):
+    output = output.strip()
+    return output if len(output) <= limit else "..." + output[-limit:]
+
+
+def disk_usage(path) -> int:
+    """Bytes taken by the files under path (symlinks are not followed)."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _normalize(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _dist_name(file_name):
+    # 'humanize-4.16.0-py3-none-any.whl' and 'humanize-4.16.0.dist-info' both start with the name
+    return _normalize(file_name.split("-", 1)[0])
+
+
+# Linux ioctl that makes dest share src's blocks until either is written (btrfs, XFS, ...)
+_FICLONE = 0x40049409
+_can_reflink = fcntl is not None and sys.platform.startswith("linux")
+
+
+def _clone(src, dest):
+    """
+    Copies src to dest, copy-on-write where the filesystem supports it. Never a hard link: a
+    task that edits an installed file must not change it for every other venv.
+    """
+    global _can_reflink
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    if _can_reflink:
+        try:
+            with open(src, "rb") as source, open(dest, "wb") as target:
+                fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+            shutil.copystat(src, dest)
+            return dest
+        except OSError:
+            # Not supported here; plain copies from now on
+            _can_reflink = False
+    return shutil.copy2(src, dest)
+
+
+class Wheelhouse:
+    """
+    Local directory of wheels. Installs only ever read from it (pip --no-index), so they work
+    without a network and a package is downloaded (or built from an sdist) once, not per task.
+    fetch() is the only step that talks to a package index; allow_download=False never does.
+    """
+
+    def __init__(self, path="overlord_wheelhouse", allow_download=True, timeout=300):
+        self.path = os.path.abspath(path)
+        self.allow_download = allow_download
+        self.timeout = timeout
+
+    def _pip(self, *args, python=None):
+        os.makedirs(self.path, exist_ok=True)
+        command = [sys.executable, "-m", "pip"]
+        if python:
+            # pip from this interpreter installs into the venv, so venvs do not need a pip of their own
+            command += ["--python", python]
+        command += ["--disable-pip-version-check", "--no-input", *args]
+        try:
+            proc = subprocess.run(command, capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return False, f"pip timed out after {self.timeout}s"
+        return proc.returncode == 0, proc.stdout + proc.stderr
+
+    def fetch(self, specs):
+        """Adds wheels for specs and everything they depend on."""
+        return self._pip("wheel", "--quiet", "--wheel-dir", self.path, "--find-links", self.path, *specs)
+
+    def resolve(self, specs, python):
+        """
+        The wheels pip would install into the venv of `python` for specs, from the wheelhouse alone
+        (a dry run), as (paths, pip output); paths is None when the wheelhouse cannot satisfy them.
+        """
+        ok, output = self._pip("install", "--dry-run", "--quiet", "--report", "-", "--no-index",
+                               "--find-links", self.path, *specs, python=python)
+        if not ok:
+            return None, output
+        try:
+            report = json.loads(output[output.index("{"):output.rindex("}") + 1])
+        except ValueError:
+            return None, output
+        wheels = [url2pathname(urlparse(item["download_info"]["url"]).path) for item in report.get("install", [])]
+        if not all(path.endswith(".whl") and os.path.exists(path) for path in wheels):
+            return None, output
+        return wheels, output
+
+    def unpack(self, wheel):
+        """A directory with the wheel's files, extracted once and copied into every venv that installs it."""
+        target = os.path.join(self.path, ".unpacked", os.path.basename(wheel)[:-len(".whl")])
+        if not os.path.isdir(target):
+            staging = f"{target}.{uuid.uuid4().hex[:8]}"
+            with zipfile.ZipFile(wheel) as archive:
+                archive.extractall(staging)
+            try:
+                os.replace(staging, target)
+            except OSError:
+                # Another task unpacked it first
+                shutil.rmtree(staging, ignore_errors=True)
+        return target
+
+    def install(self, specs, python=None, target=None):
+        """Installs specs from the wheelhouse alone, into the venv of `python` or a --target directory."""
+        args = ["install", "--quiet", "--no-index", "--find-links", self.path]
+        if target:
+            args += ["--target", target]
+        return self._pip(*args, *specs, python=python)
+
+    def ensure(self, specs, python=None, target=None):
+        """
+        install(), fetching the missing wheels first if the wheelhouse cannot serve them yet (and
+        downloads are allowed). Returns (ok, fetched, pip output).
+        """
+        ok, output = self.install(specs, python, target)
+        if ok or not self.allow_download:
+            return ok, False, output
+        ok, output = self.fetch(specs)
+        if not ok:
+            return False, True, output
+        ok, output = self.install(specs, python, target)
+        return ok, True, output
+
+    def size_bytes(self) -> int:
+        return disk_usage(self.path)
+
+
+class Venv:
+    def __init__(self, path, python, site_packages):
+        self.path = path
+        self.python = python
+        self.site_packages = site_packages
+
+    def packages(self):
+        """Normalized names of what was installed into this venv itself (seed included, not the host's)."""
+        return frozenset(_dist_name(n) for n in os.listdir(self.site_packages) if n.endswith(".dist-info"))
+
+    def copy_wheel(self, unpacked):
+        """
+        Installs an unpacked wheel by copying its files into the venv: the .data directories go
+        where pip would put them. Console-script launchers are not generated; scripts run
+        through the venv's python.
+        """
+        scripts = os.path.dirname(self.python)
+        places = {"purelib": self.site_packages, "platlib": self.site_packages, "scripts": scripts,
+                  "data": self.path, "headers": os.path.join(self.path, "include")}
+        for root, _, files in os.walk(unpacked):
+            parts = os.path.relpath(root, unpacked).split(os.sep)
+            kind = None
+            if parts[0].endswith(".data"):
+                if len(parts) == 1 or parts[1] not in places:
+                    continue
+                kind = parts[1]
+                dest_dir = os.path.join(places[kind], *parts[2:])
+            else:
+                dest_dir = os.path.join(self.site_packages, *[p for p in parts if p != "."])
+            os.makedirs(dest_dir, exist_ok=True)
+            for name in files:
+                src, dest = os.path.join(root, name), os.path.join(dest_dir, name)
+                if kind == "scripts":
+                    # Scripts get their own copy with the '#!python' placeholder pointing at this venv
+                    with open(src, "rb") as f:
+                        content = f.read()
+                    if content.startswith(b"#!python"):
+                        content = b"#!" + self.python.encode() + content[len(b"#!python"):]
+                    with open(dest, "wb") as f:
+                        f.write(content)
+                    os.chmod(dest, 0o755)
+                else:
+                    _clone(src, dest)
+        for name in os.listdir(unpacked):
+            if name.endswith(".dist-info"):
+                installer = os.path.join(self.site_packages, name, "INSTALLER")
+                if os.path.lexists(installer):
+                    os.unlink(installer)
+                with open(installer, "w", encoding="utf-8") as f:
+                    f.write("overlord\n")
+
+
+class VenvPool:
+    """
+    Virtualenvs created ahead of time; each task checks one out, so installs never touch the host
+    interpreter and tasks running side by side do not share a site-packages. A venv sees the
+    host's packages (what scripts could import before still works) and gets its own copy of the
+    seed packages, installed once from the wheelhouse; the task's own installs go into the venv
+    and come first. Wheels are unpacked once in the wheelhouse and copied (copy-on-write where
+    the filesystem can) into each venv that installs them, so only the first task to ask for a
+    set of packages waits for pip, and nothing one task changes leaks into another's venv.
+    Returned venvs are deleted, not reused, and the pool is topped up in the background.
+    Nothing happens until the first checkout: a session that never installs a package never
+    seeds or creates a venv.
+    """
+
+    def __init__(self, root="overlord_venvs", size=2, seed=DEFAULT_SEED, wheelhouse=None):
+        self.root = os.path.abspath(root)
+        self.size = size
+        self.seed = tuple(seed)
+        self.wheelhouse = wheelhouse or Wheelhouse()
+        self.seed_dir = os.path.join(self.root, "seed")
+        self.seed_error = None
+        self.metrics = {"checkouts": 0, "created": 0, "cold_checkouts": 0, "installs": 0, "already_installed": 0,
+                        "copied": 0, "fetched": 0, "failed": 0, "install_seconds": 0.0}
+        self._idle = queue.Queue()
+        self._closed = False
+        # (specs, packages already in the venv) -> wheels pip chose; fresh venvs are all alike, so
+        # the second task asking for the same packages skips pip and just copies the wheels in
+        self._resolved = {}
+        self._lock = threading.Lock()
+        # Held while the seed is swapped or copied into a new venv
+        self._seed_lock = threading.Lock()
+        self._pth = self._pth_lines()
+        self._jobs = queue.Queue()
+        self._started = False
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        os.makedirs(self.root, exist_ok=True)
+        # Venvs left by an earlier process belonged to tasks that are gone
+        for name in os.listdir(self.root):
+            if name.startswith(("venv-", "seed-")):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+        # One background thread seeds, creates and deletes venvs; nothing here waits for it. It is a
+        # daemon, so exiting never waits for a seed install (leftovers are cleared on the next start)
+        threading.Thread(target=self._work, name="overlord-venvs", daemon=True).start()
+        self._jobs.put(self._prepare)
+
+    @staticmethod
+    def _pth_lines():
+        lines = []
+        if sys.prefix != sys.base_prefix:
+            # Running from a venv ourselves: its packages are not the 'system' ones a pooled venv sees
+            for path in site.getsitepackages():
+                lines.append(f"import site; site.addsitedir({path!r})")
+        return "\n".join(lines) + "\n"
+
+    # --- background work -----------------------------------------------------
+
+    def _work(self):
+        while (job := self._jobs.get()) is not None:
+            try:
+                job()
+            except Exception as e:
+                # The next checkout creates its venv on the spot instead
+                print(f"DEBUG: venv pool: {e}")
+
+    def _prepare(self):
+        self._install_seed()
+        self._fill()
+
+    def _install_seed(self):
+        marker = os.path.join(self.seed_dir, ".overlord-seed")
+        wanted = "\n".join(sorted(self.seed))
+        try:
+            with open(marker, encoding="utf-8") as f:
+                if f.read() == wanted:
+                    return
+        except OSError:
+            pass
+        if not self.seed:
+            shutil.rmtree(self.seed_dir, ignore_errors=True)
+            return
+        # Installed next to the old seed and swapped in, so running scripts never see half of it
+        staging = os.path.join(self.root, f"seed-{uuid.uuid4().hex[:8]}")
+        ok, _, output = self.wheelhouse.ensure(list(self.seed), target=staging)
+        if not ok:
+            shutil.rmtree(staging, ignore_errors=True)
+            self.seed_error = _tail(output)
+            return
+        with open(os.path.join(staging, ".overlord-seed"), "w", encoding="utf-8") as f:
+            f.write(wanted)
+        with self._seed_lock:
+            shutil.rmtree(self.seed_dir, ignore_errors=True)
+            os.replace(staging, self.seed_dir)
+
+    def _create(self):
+        path = os.path.join(self.root, f"venv-{uuid.uuid4().hex[:12]}")
+        venv.EnvBuilder(system_site_packages=True, symlinks=os.name != "nt", with_pip=False).create(path)
+        site_packages = sysconfig.get_path("purelib", vars={"base": path, "platbase": path})
+        if self._pth.strip():
+            with open(os.path.join(site_packages, "overlord_host.pth"), "w", encoding="utf-8") as f:
+                f.write(self._pth)
+        with self._seed_lock:
+            if os.path.isdir(self.seed_dir):
+                # Packages only: pip --target puts console scripts in bin/, which venvs do without
+                shutil.copytree(self.seed_dir, site_packages, copy_function=_clone, dirs_exist_ok=True,
+                                ignore=lambda d, names: {"bin", ".overlord-seed"} if d == self.seed_dir else set())
+        python = os.path.join(path, "Scripts", "python.exe") if os.name == "nt" else os.path.join(path, "bin", "python")
+        self.metrics["created"] += 1
+        return Venv(path, python, site_packages)
+
+    def _fill(self):
+        while not self._closed and self._idle.qsize() < self.size:
+            self._idle.put(self._create())
+
+    # --- tasks ---------------------------------------------------------------
+
+    def checkout(self) -> Venv:
+        """
+        A venv for one task; created on the spot if the pool has run dry (as it is on the first
+        checkout, which also starts seeding and filling the pool).
+        """
+        self._start()
+        self.metrics["checkouts"] += 1
+        try:
+            env = self._idle.get_nowait()
+        except queue.Empty:
+            self.metrics["cold_checkouts"] += 1
+            env = self._create()
+        if not self._closed:
+            self._jobs.put(self._fill)
+        return env
+
+    def _installed(self, env, specs):
+        """
+        True if the venv can already import every spec (a bare name or name==version). pip takes
+        about a second just to start and say 'already satisfied'; reading the metadata takes milliseconds.
+        """
+        paths = [env.site_packages] + site.getsitepackages()
+        for spec in specs:
+            name, pinned, version = spec.partition("==")
+            if not re.fullmatch(r"[A-Za-z0-9._-]+", name):
+                return False
+            found = [d.version for d in importlib.metadata.distributions(name=name, path=paths)]
+            if not found or (pinned and found[0] != version):
+                return False
+        return True
+
+    def _install_wheels(self, env, specs):
+        own = env.packages()
+        key = (tuple(sorted(specs)), own)
+        fetched = False
+        with self._lock:
+            wheels = self._resolved.get(key)
+        if wheels is None:
+            wheels, output = self.wheelhouse.resolve(specs, env.python)
+            if wheels is None and self.wheelhouse.allow_download:
+                fetched = True
+                ok, output = self.wheelhouse.fetch(specs)
+                if not ok:
+                    return False, fetched, output
+                wheels, output = self.wheelhouse.resolve(specs, env.python)
+            if wheels is None:
+                return False, fetched, output
+            with self._lock:
+                self._resolved[key] = wheels
+        if any(_dist_name(os.path.basename(w)) in own for w in wheels) or not all(os.path.exists(w) for w in wheels):
+            # Replacing a version installed into this venv earlier: pip removes the old one first
+            ok, output = self.wheelhouse.install(specs, python=env.python)
+            return ok, fetched, output
+        for wheel in wheels:
+            env.copy_wheel(self.wheelhouse.unpack(wheel))
+        self.metrics["copied"] += len(wheels)
+        return True, fetched, ""
+
+    def install(self, env, specs):
+        """Installs specs into a checked-out venv from the wheelhouse. Returns (ok, detail for the model)."""
+        self.metrics["installs"] += 1
+        if self._installed(env, specs):
+            self.metrics["already_installed"] += 1
+            return True, "already installed"
+        start = time.perf_counter()
+        try:
+            ok, fetched, output = self._install_wheels(env, specs)
+        finally:
+            self.metrics["install_seconds"] += time.perf_counter() - start
+        self.metrics["fetched"] += fetched
+        if ok:
+            return True, "downloaded into the local wheelhouse" if fetched else "from the local wheelhouse"
+        self.metrics["failed"] += 1
+        if not self.wheelhouse.allow_download:
+            return False, f"not available in the local wheelhouse (offline mode). {_tail(output)}"
+        return False, _tail(output)
+
+    def release(self, env):
+        """Gives back a task's venv; it is deleted, the next task gets a fresh one."""
+        if self._closed:
+            shutil.rmtree(env.path, ignore_errors=True)
+        else:
+            self._jobs.put(lambda: shutil.rmtree(env.path, ignore_errors=True))
+
+    def disk_usage(self) -> dict:
+        names = os.listdir(self.root) if os.path.isdir(self.root) else []
+        venvs = [os.path.join(self.root, n) for n in names if n.startswith("venv-")]
+        return {
+            "wheelhouse": self.wheelhouse.size_bytes(),
+            "seed": disk_usage(self.seed_dir),
+            "venvs": len(venvs),
+            "venv_bytes": sum(disk_usage(path) for path in venvs),
+        }
+
+    def close(self):
+        self._closed = True
+        self._jobs.put(None)
+        while True:
+            try:
+                shutil.rmtree(self._idle.get_nowait().path, ignore_errors=True)
+            except queue.Empty:
+                return
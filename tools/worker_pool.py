@@ -0,0 +1,175 @@
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "python_worker.py")
+
+# Imported once per worker so generated scripts do not pay for them on every run
+DEFAULT_PRELOAD = ("json", "math", "random", "statistics", "datetime", "collections", "numpy", "pandas")
+
+
+class WorkersBusy(RuntimeError):
+    """Every warm worker is running something and the caller would rather not wait."""
+
+
+class RunCancelled(RuntimeError):
+    """The run was stopped through its cancel event."""
+
+
+class _Worker:
+    def __init__(self, python, preload, cwd):
+        env = dict(os.environ, PYTHONIOENCODING="utf-8")
+        self.proc = subprocess.Popen(
+            [python, "-u", WORKER_SCRIPT, ",".join(preload)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env
+        )
+        self.uses = 0
+        self._chunks = queue.Queue()
+        for name, pipe in (("stdout", self.proc.stdout), ("stderr", self.proc.stderr)):
+            threading.Thread(target=self._pump, args=(name, pipe), daemon=True).start()
+
+    def _pump(self, name, pipe):
+        # Raw chunks, not lines: a script may print without a trailing newline
+        fd = pipe.fileno()
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                self._chunks.put((name, None))
+                return
+            self._chunks.put((name, data))
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def run(self, path, cwd, timeout, sink, cancel=None):
+        """
+        Streams the job's output to sink(stream, bytes) as it arrives.
+        Returns 'ok', 'recycle' (finished, but the job left state behind and the worker must go),
+        'timeout', 'crashed' or 'cancelled' (cancel, a threading.Event, was set).
+        """
+        token = uuid.uuid4().hex
+        marker = f"\x00overlord-{token}\x00".encode()
+        recycle = f"\x00overlord-{token}\x01".encode()
+        job = json.dumps({"path": path, "cwd": cwd, "marker": marker.decode(), "recycle": recycle.decode()}) + "\n"
+        self.proc.stdin.write(job.encode())
+        self.proc.stdin.flush()
+        self.uses += 1
+
+        # The marker can be split across chunks, so hold back a marker-sized tail before forwarding
+        pending = {"stdout": bytearray(), "stderr": bytearray()}
+        keep = len(marker) - 1
+        done = set()
+        deadline = time.monotonic() + timeout
+        status = "ok"
+        while len(done) < 2:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                status = "timeout"
+                break
+            if cancel is not None:
+                if cancel.is_set():
+                    status = "cancelled"
+                    break
+                remaining = min(remaining, 0.05)
+            try:
+                name, data = self._chunks.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if data is None:
+                # The script killed the interpreter (os._exit, segfault...)
+                status = "crashed"
+                break
+            buffer = pending[name]
+            buffer += data
+            if buffer.endswith(marker) or buffer.endswith(recycle):
+                if buffer.endswith(recycle):
+                    status = "recycle"
+                del buffer[-len(marker):]
+                done.add(name)
+                sink(name, bytes(buffer))
+                buffer.clear()
+            elif len(buffer) > keep:
+                sink(name, bytes(buffer[:-keep]))
+                del buffer[:-keep]
+
+        for name, buffer in pending.items():
+            if buffer:
+                sink(name, bytes(buffer))
+        return status
+
+    def kill(self):
+        if self.alive():
+            self.proc.kill()
+        self.proc.wait()
+
+
+class PythonWorkerPool:
+    """
+    Pre-started interpreters with common libraries already imported.
+    Each run executes a script in a fresh namespace; std streams, os.environ, cwd, sys.path and
+    other interpreter settings are put back afterwards. Workers are replaced after a crash, a timeout,
+    max_uses runs, or a run that imported sys (or similar) or patched a preloaded module.
+    """
+
+    def __init__(self, size=2, preload=DEFAULT_PRELOAD, max_uses=50, cwd=None, python=sys.executable):
+        self.size = size
+        self.preload = preload
+        self.max_uses = max_uses
+        self.cwd = cwd or os.getcwd()
+        self.python = python
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        return _Worker(self.python, self.preload, self.cwd)
+
+    def run(self, path, cwd, timeout=15, sink=None, cancel=None, wait=True):
+        """
+        Runs a script like 'python path' would, streaming output to sink(stream, bytes).
+        Returns the exit code (0, or 1 if the worker died). Raises subprocess.TimeoutExpired on timeout,
+        RunCancelled when cancel (a threading.Event) is set while it runs (the worker is replaced),
+        and WorkersBusy instead of waiting for a free worker when wait is False.
+        """
+        sink = sink or (lambda stream, data: None)
+        try:
+            worker = self._idle.get(block=wait)
+        except queue.Empty:
+            raise WorkersBusy("all warm workers are busy") from None
+        try:
+            if not worker.alive():
+                worker = self._spawn()
+            status = worker.run(path, cwd, timeout, sink, cancel)
+            if status not in ("ok", "recycle"):
+                worker.kill()
+                exit_code = worker.proc.returncode
+                worker = self._spawn()
+                if status == "timeout":
+                    raise subprocess.TimeoutExpired([self.python, path], timeout)
+                if status == "cancelled":
+                    raise RunCancelled(path)
+                sink("stderr", f"\nProcess exited with code {exit_code}.".encode())
+                return exit_code or 1
+            if status == "recycle" or worker.uses >= self.max_uses:
+                worker.kill()
+                worker = self._spawn()
+            return 0
+        finally:
+            if self._closed:
+                worker.kill()
+            else:
+                self._idle.put(worker)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                return
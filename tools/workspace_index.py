@@ -0,0 +1,159 @@
+import hashlib
+import os
+import stat as stat_module
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+# Never listed: our own atomic-write temp files, caches and hidden folders
+IGNORED_DIRS = {"__pycache__", ".git", ".venv", "venv", "node_modules"}
+IGNORED_PREFIXES = (".tmp-",)
+
+
+@dataclass
+class FileEntry:
+    path: str            # relative to the workspace, '/'-separated
+    size: int
+    mtime_ns: int
+    sha256: Optional[str] = None
+
+
+def file_digest(path, chunk_size=1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class WorkspaceIndex:
+    """
+    Cached recursive listing of a workspace (size, mtime and content hash per file).
+    refresh() rescans incrementally: directories whose mtime did not change are not listed
+    again, and files are only re-hashed when their size or mtime changed. Scans are skipped
+    entirely while the index is younger than min_interval seconds, or, with watch=True and
+    watchdog installed, until the filesystem reports a change.
+    """
+
+    def __init__(self, base_dir, min_interval=1.0, watch=False):
+        self.base_dir = os.path.abspath(base_dir)
+        self.min_interval = min_interval
+        self.entries = {}
+        self.metrics = {"scans": 0, "scans_skipped": 0, "hashed": 0, "dirs_listed": 0}
+        self._dirs = {}  # relative dir -> (mtime_ns, [child names])
+        self._scanned_at = None
+        self._dirty = True
+        self._lock = threading.Lock()
+        self._observer = self._start_watching() if watch else None
+
+    def _start_watching(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            # Optional: mtime scanning on its own is still correct, just not event driven
+            return None
+
+        index = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                index._dirty = True
+
+        observer = Observer()
+        observer.schedule(_Handler(), self.base_dir, recursive=True)
+        observer.daemon = True
+        observer.start()
+        return observer
+
+    def close(self):
+        if self._observer:
+            self._observer.stop()
+            self._observer = None
+
+    def _needs_scan(self, force):
+        if force or self._scanned_at is None:
+            return True
+        if self._observer is not None:
+            return self._dirty
+        return time.monotonic() - self._scanned_at >= self.min_interval
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not self._needs_scan(force):
+                self.metrics["scans_skipped"] += 1
+                return self.entries
+            self._dirty = False
+            self.metrics["scans"] += 1
+            seen_files, seen_dirs = {}, {}
+            self._scan_dir("", seen_files, seen_dirs)
+            self.entries = seen_files
+            self._dirs = seen_dirs
+            self._scanned_at = time.monotonic()
+            return self.entries
+
+    def _scan_dir(self, rel_dir, seen_files, seen_dirs):
+        full_dir = os.path.join(self.base_dir, rel_dir)
+        try:
+            dir_mtime = os.stat(full_dir).st_mtime_ns
+        except FileNotFoundError:
+            return
+        cached = self._dirs.get(rel_dir)
+        if cached and cached[0] == dir_mtime:
+            # No entry was added, removed or renamed here since the last scan
+            names = cached[1]
+        else:
+            try:
+                names = sorted(os.listdir(full_dir))
+            except (FileNotFoundError, NotADirectoryError):
+                return
+            self.metrics["dirs_listed"] += 1
+        seen_dirs[rel_dir] = (dir_mtime, names)
+
+        for name in names:
+            if name.startswith(IGNORED_PREFIXES) or name in IGNORED_DIRS:
+                continue
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            try:
+                stat = os.stat(os.path.join(full_dir, name))
+            except FileNotFoundError:
+                continue
+            if stat_module.S_ISDIR(stat.st_mode):
+                self._scan_dir(rel, seen_files, seen_dirs)
+                continue
+            previous = self.entries.get(rel)
+            if previous and (previous.size, previous.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                seen_files[rel] = previous
+            else:
+                seen_files[rel] = FileEntry(rel, stat.st_size, stat.st_mtime_ns)
+
+    def get(self, rel_path) -> Optional[FileEntry]:
+        """The entry for one file, hashed on first request (cheap again until the file changes)."""
+        self.refresh()
+        return self._hashed(self.entries.get(rel_path.replace(os.sep, "/")))
+
+    def _hashed(self, entry):
+        if entry is not None and entry.sha256 is None:
+            entry.sha256 = file_digest(os.path.join(self.base_dir, entry.path))
+            self.metrics["hashed"] += 1
+        return entry
+
+    def note_write(self, rel_path, sha256=None):
+        """Updates one entry after a write we made ourselves, so the next listing is right without a scan."""
+        rel = rel_path.replace(os.sep, "/")
+        path = os.path.join(self.base_dir, rel)
+        with self._lock:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self.entries.pop(rel, None)
+                return
+            self.entries[rel] = FileEntry(rel, stat.st_size, stat.st_mtime_ns, sha256)
+
+    def list(self, with_hashes=False):
+        """Entries sorted by path; with_hashes hashes whatever changed since it was last hashed."""
+        entries = self.refresh()
+        if with_hashes:
+            return [self._hashed(entries[path]) for path in sorted(entries)]
+        return [entries[path] for path in sorted(entries)]